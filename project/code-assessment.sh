@@ -12,6 +12,7 @@ black --check /pyats/project/src || add_fail black
 pylint /pyats/project/src || add_fail pylint
 flake8 /pyats/project/src || add_fail flake8
 pydocstyle /pyats/project/src || add_fail pydocstyle
+python -m unittest discover -s tests -t . || add_fail unittest
 if [[ ${#FAILURES[@]} -ne 0 ]]; then
     cat <<RESULT
 ===================================================
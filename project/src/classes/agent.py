@@ -0,0 +1,190 @@
+import os
+import re
+import json
+import base64
+import socket
+import logging
+import threading
+from itertools import count
+
+import paramiko
+from paramiko import SSHClient
+from pyats.topology import Device
+
+
+_log = logging.getLogger(__name__)
+_log.setLevel(logging.INFO)
+
+
+class RemoteAgent:
+    """RemoteAgent.
+
+    Context manager which talks to the agent deployed by the agent playbook
+    over a single SSH-forwarded channel. Each call is a json request/response
+    round trip, so there is no prompt parsing and no per-command login.
+    """
+
+    def __init__(self, device: Device, port: int = 7777, timeout: int = 60):
+        """Constructor.
+
+        Args:
+            device (Device): device with the agent running
+            port (int): port agent listens on the device loopback
+            timeout (int): default timeout of a single call, seconds
+        """
+        self._device = device
+        self._port = port
+        self._timeout = timeout
+        self._ssh = None
+        self._channel = None
+        self._buffer = b""
+        self._ids = count(1)
+        self._lock = threading.Lock()
+        self._loghead = f"RemoteAgent@{device.name}"
+
+    @property
+    def connected(self) -> bool:
+        """Channel to the agent is open."""
+        return self._channel is not None
+
+    def connect(self) -> None:
+        connection = self._device.connections.cli.command
+        pattern = re.compile(r"ssh -i (/.*)+\s(\w+)@(.*)")
+        key_filename, username, host = pattern.search(connection).groups()
+
+        self._ssh = SSHClient()
+        self._ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self._ssh.connect(
+            host,
+            username=username,
+            pkey=paramiko.RSAKey.from_private_key_file(key_filename),
+            allow_agent=False,
+        )
+        self._open_channel()
+        _log.info(f"{self._loghead} - connected via ssh channel to port {self._port}")
+
+    def _open_channel(self) -> None:
+        self._channel = self._ssh.get_transport().open_channel(
+            "direct-tcpip", ("127.0.0.1", self._port), ("127.0.0.1", 0)
+        )
+        self._buffer = b""
+
+    def _read_response(self) -> dict:
+        while b"\n" not in self._buffer:
+            data = self._channel.recv(65536)
+            if not data:
+                raise ConnectionError(f"{self._loghead} - channel closed")
+            self._buffer += data
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return json.loads(line)
+
+    def disconnect(self) -> None:
+        if self._channel is not None:
+            self._channel.close()
+        if self._ssh is not None:
+            self._ssh.close()
+        self._channel, self._ssh = None, None
+        _log.info(f"{self._loghead} - disconnected")
+
+    def call(self, method: str, params: dict = None, timeout: int = None):
+        """Execute agent method and return its result.
+
+        Args:
+            method (str): agent method name
+            params (dict): method arguments
+            timeout (int): response timeout, seconds
+        """
+        with self._lock:
+            request_id = next(self._ids)
+            request = {"id": request_id, "method": method, "params": params or {}}
+            self._channel.settimeout(timeout or self._timeout)
+            self._channel.sendall(json.dumps(request).encode() + b"\n")
+            try:
+                response = self._read_response()
+                # replies of timed out calls are not awaited anymore
+                while response.get("id") != request_id:
+                    _log.warning(
+                        f"{self._loghead} - discarded reply {response.get('id')} "
+                        f"while waiting for {request_id}"
+                    )
+                    response = self._read_response()
+            except socket.timeout:
+                # late reply may come in parts, a fresh channel drops it entirely
+                self._channel.close()
+                self._open_channel()
+                raise
+
+        if "error" in response:
+            raise RuntimeError(
+                f"{self._loghead} - `{method}` failed: {response['error']}"
+            )
+        return response["result"]
+
+    def execute(self, command: str, timeout: int = 60) -> dict:
+        """Run shell command, returns returncode, stdout, stderr and duration."""
+        result = self.call(
+            "execute", {"command": command, "timeout": timeout}, timeout=timeout + 5
+        )
+        _log.info(
+            f"{self._loghead} - executed `{command}`: returncode "
+            f"{result['returncode']} in {result['duration']:.3f}s"
+        )
+        return result
+
+    def spawn(self, name: str, command: str, log: str = None) -> int:
+        """Start background process under the given name, returns its pid."""
+        result = self.call("spawn", {"name": name, "command": command, "log": log})
+        if result["started"]:
+            _log.info(f"{self._loghead} - started `{name}`: {command}")
+        return result["pid"]
+
+    def status(self, name: str = None, process: str = None) -> dict:
+        """Status of the spawned process or any process by executable name."""
+        return self.call("status", {"name": name, "process": process})
+
+    def stop(self, name: str) -> int:
+        """Stop spawned process, returns its exit code."""
+        result = self.call("stop", {"name": name})
+        _log.info(f"{self._loghead} - stopped `{name}`: {result['returncode']}")
+        return result["returncode"]
+
+    def stream_file(self, source: str, destination: str, chunk: int = 1048576) -> int:
+        """Copy file from the device in chunks, returns number of bytes.
+
+        Args:
+            source (str): file path on the device, relative to the home directory
+            destination (str): local file path
+            chunk (int): size of a single read, bytes
+        """
+        offset = 0
+        os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+        with open(destination, "wb") as f:
+            while True:
+                result = self.call(
+                    "read_file", {"path": source, "offset": offset, "size": chunk}
+                )
+                f.write(base64.b64decode(result["data"]))
+                offset = result["offset"]
+                if result["eof"]:
+                    break
+        _log.info(f"{self._loghead} - streamed `{source}` ({offset} bytes)")
+        return offset
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.disconnect()
+
+
+# if __name__ == "__main__":
+#     from pyats import topology
+
+#     testbed = topology.loader.load("testbed.yaml")
+#     with RemoteAgent(testbed.devices["proxy-vm"]) as agent:
+#         print(agent.execute("uname -a")["stdout"])
+#         agent.spawn("proxytcp", "./proxytcp/bin/proxytcp --mode default --port 1080")
+#         print(agent.status(process="proxytcp"))
+#         agent.stream_file("proxy_resources.log", "/tmp/proxy_resources.log")
+#         agent.stop("proxytcp")
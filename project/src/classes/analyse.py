@@ -1,6 +1,34 @@
 import re
+import math
+import socket
+import statistics
 
-from src.classes.clients import BrowserStats
+from src.classes.clients import BrowserStats, SocksStats
+
+
+def _percentile(values: list, percent: int) -> float:
+    """Nearest-rank percentile of the values."""
+    ordered = sorted(values)
+    index = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def _summary(values: list, percents: tuple = (50, 95)) -> dict:
+    """Distribution summary of the values.
+
+    Args:
+        values (list): measured values
+        percents (tuple): percentiles included as `p<percent>` keys
+    """
+    if values:
+        summary = {
+            "count": len(values),
+            "min": min(values),
+            "avg": statistics.mean(values),
+        }
+        summary.update({f"p{x}": _percentile(values, x) for x in percents})
+        summary["max"] = max(values)
+        return summary
 
 
 class BrowserResponseAnalyzer:
@@ -108,3 +136,500 @@ class CurlResponseAnalyzer:
         result = re.compile(pattern).search(self._response)
         if result is not None:
             return int(result[3])
+
+
+class CurlTimingAnalyzer:
+    """Analyse curl `--write-out` timings of proxied and direct transfers.
+
+    With `--socks5-hostname` name lookup is done by the proxy, so proxied
+    time_connect is the time to connect to the proxy itself.
+    """
+
+    _metrics = (
+        "time_namelookup",
+        "time_connect",
+        "time_appconnect",
+        "time_starttransfer",
+        "time_total",
+    )
+
+    def __init__(self, proxied: list, direct: list):
+        self._timings = {"proxied": proxied, "direct": direct}
+
+    def _succeeded(self, mode: str) -> list:
+        return [timing for timing in self._timings[mode] if timing["http_code"]]
+
+    def get_error_rate(self) -> dict:
+        """Share of transfers without any http response."""
+        return {
+            mode: 1 - len(self._succeeded(mode)) / len(timings) if timings else None
+            for mode, timings in self._timings.items()
+        }
+
+    def get_summary(self) -> dict:
+        """Distribution of every timing (ms) and download speed (kB/s)."""
+        summary = {}
+        for metric in self._metrics:
+            summary[metric] = {
+                mode: _summary([x[metric] * 1000 for x in self._succeeded(mode)])
+                for mode in self._timings
+            }
+        summary["speed_download"] = {
+            mode: _summary([x["speed_download"] / 1024 for x in self._succeeded(mode)])
+            for mode in self._timings
+        }
+        return summary
+
+    def get_delay_rate(self, metric: str = "time_total", stat: str = "p50") -> float:
+        """Ratio of proxied to direct value of the metric statistic."""
+        summary = self.get_summary()[metric]
+        if summary["proxied"] and summary["direct"] and summary["direct"][stat]:
+            return summary["proxied"][stat] / summary["direct"][stat]
+
+
+class ThroughputAnalyzer:
+    """Analyse bulk transfers of proxied and direct Curl.get_bulk runs."""
+
+    def __init__(self, proxied: list, direct: list, proxy_cpu_time: float = None):
+        """Constructor.
+
+        Args:
+            proxied (list): bulk transfer stats with proxy on
+            direct (list): bulk transfer stats with proxy off
+            proxy_cpu_time (float): proxy CPU time during proxied transfers, seconds
+        """
+        self._transfers = {"proxied": proxied, "direct": direct}
+        self._proxy_cpu_time = proxy_cpu_time
+
+    def get_throughput(self) -> dict:
+        """Average throughput over all runs, MB/s."""
+        throughput = {}
+        for mode, transfers in self._transfers.items():
+            size = sum(x["bytes"] for x in transfers)
+            duration = sum(x["time"] for x in transfers)
+            throughput[mode] = size / duration / 2**20 if duration else None
+        return throughput
+
+    def get_throughput_rate(self) -> float:
+        """Ratio of proxied to direct throughput."""
+        throughput = self.get_throughput()
+        if throughput["proxied"] and throughput["direct"]:
+            return throughput["proxied"] / throughput["direct"]
+
+    def get_errors(self) -> dict:
+        return {
+            mode: sum(x["errors"] for x in transfers)
+            for mode, transfers in self._transfers.items()
+        }
+
+    def get_cpu_per_megabyte(self) -> float:
+        """Proxy CPU time spent per relayed megabyte, ms."""
+        size = sum(x["bytes"] for x in self._transfers["proxied"])
+        if self._proxy_cpu_time is not None and size:
+            return self._proxy_cpu_time * 1000 / (size / 2**20)
+
+
+class LoadResponseAnalyzer:
+    """Analyse load generator samples."""
+
+    def __init__(self, samples: list, step_duration: int):
+        self._samples = samples
+        self._step_duration = step_duration
+
+    def get_curve(self) -> list:
+        """Throughput, latency and error rate per load step."""
+        curve = []
+        steps = sorted({sample.step for sample in self._samples})
+        for step in steps:
+            entries = [sample for sample in self._samples if sample.step == step]
+            succeeded = [sample.latency for sample in entries if sample.error is None]
+            errors = len(entries) - len(succeeded)
+            curve.append(
+                {
+                    "step": step,
+                    "concurrency": entries[0].concurrency,
+                    "requests": len(entries),
+                    "errors": errors,
+                    "error_rate": errors / len(entries),
+                    "throughput": len(succeeded) / self._step_duration,
+                    "latency_avg": statistics.mean(succeeded) if succeeded else None,
+                    "latency_p95": _percentile(succeeded, 95) if succeeded else None,
+                }
+            )
+        return curve
+
+    def get_timeline(self, interval: int = 1) -> list:
+        """Requests, errors and average latency per time interval in seconds."""
+        buckets = {}
+        for sample in self._samples:
+            buckets.setdefault(int(sample.timestamp // interval), []).append(sample)
+
+        timeline = []
+        for index in sorted(buckets):
+            entries = buckets[index]
+            succeeded = [sample.latency for sample in entries if sample.error is None]
+            timeline.append(
+                {
+                    "time": index * interval,
+                    "requests": len(entries),
+                    "errors": len(entries) - len(succeeded),
+                    "latency_avg": statistics.mean(succeeded) if succeeded else None,
+                }
+            )
+        return timeline
+
+    def get_saturation_point(self, min_growth: float = 0.1) -> dict:
+        """First step where adding sessions no longer increases throughput.
+
+        Args:
+            min_growth (float): minimal relative throughput growth between two
+                steps to consider the proxy not saturated
+        """
+        curve = self.get_curve()
+        for previous, current in zip(curve, curve[1:]):
+            if current["concurrency"] <= previous["concurrency"]:
+                continue
+            if previous["throughput"] == 0:
+                return current
+            growth = current["throughput"] / previous["throughput"] - 1
+            if growth < min_growth:
+                return current
+
+
+class SocksResponseAnalyzer:
+    """Analyse SOCKS5 client response."""
+
+    _stages = (SocksStats.CONNECT, SocksStats.HANDSHAKE, SocksStats.FIRST_BYTE)
+
+    def __init__(self, response: list):
+        self._response = response
+        self._succeeded = [
+            entry for entry in response if entry.get(SocksStats.ERROR) is None
+        ]
+
+    def _latencies(self, stage: str) -> list:
+        if stage not in self._stages:
+            raise ValueError(f"Unknown stage `{stage}`, expected one of {self._stages}")
+        return [
+            entry[stage] for entry in self._succeeded if entry.get(stage) is not None
+        ]
+
+    def get_error_rate(self) -> float:
+        if self._response:
+            return 1 - len(self._succeeded) / len(self._response)
+
+    def get_errors(self) -> dict:
+        """Number of failed connections grouped by error message."""
+        result = {}
+        for entry in self._response:
+            error = entry.get(SocksStats.ERROR)
+            if error is not None:
+                result[error] = result.get(error, 0) + 1
+        return result
+
+    def get_latency_summary(self, stage: str) -> dict:
+        """Count, min, mean, percentiles and max latency of the stage, ms."""
+        return _summary(self._latencies(stage), percents=(50, 95, 99))
+
+    def get_histogram(self, stage: str, bucket_width: float = 5) -> dict:
+        """Number of connections per latency bucket of the stage.
+
+        Args:
+            stage (str): one of `connect`, `handshake`, `first_byte`
+            bucket_width (float): width of a single bucket, ms
+        """
+        histogram = {}
+        for latency in self._latencies(stage):
+            bucket = int(latency // bucket_width) * bucket_width
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+        return dict(sorted(histogram.items()))
+
+    def get_received_bytes(self) -> int:
+        return sum(entry.get(SocksStats.RECEIVED, 0) for entry in self._response)
+
+
+class ConnectionLatencyAnalyzer:
+    """Analyse latency of each connection at the proxy boundary.
+
+    Takes TsharkPcap.tcp_timeline of the grid side and the proxy side
+    captures, correlates client streams by the client address and upstream
+    streams by the CONNECT request. Times are compared within a single
+    capture only, so clocks of the devices need not be synchronized.
+    Proxy streams of other clients, e.g. tests running concurrently from
+    other devices, are skipped if the grid client ip is given.
+    """
+
+    _metrics = ("handshake", "upstream_connect", "relay_upstream", "relay_downstream")
+
+    def __init__(
+        self,
+        grid_streams: dict,
+        proxy_streams: dict,
+        proxy_port: int = 1080,
+        client_ip: str = None,
+    ):
+        """Constructor.
+
+        Args:
+            grid_streams (dict): tcp timeline of the grid side capture
+            proxy_streams (dict): tcp timeline of the proxy side capture
+            proxy_port (int): port the proxy listens on
+            client_ip (str): ip of the grid device, all clients if None
+        """
+        self._grid_streams = grid_streams
+        self._proxy_streams = proxy_streams
+        self._proxy_port = int(proxy_port)
+        self._client_ip = client_ip
+
+    @staticmethod
+    def _segments(payloads: dict) -> list:
+        """Payload segments as (offset, time, data) sorted by offset."""
+        return sorted((seq - 1, *entry) for seq, entry in payloads.items())
+
+    @staticmethod
+    def _time_of_offset(segments: list, offset: int) -> float:
+        for start, timestamp, data in segments:
+            if start <= offset < start + len(data):
+                return timestamp
+
+    @staticmethod
+    def _head(segments: list, size: int) -> bytes:
+        data = b""
+        for start, _, chunk in segments:
+            if start > len(data) or len(data) >= size:
+                break
+            data += chunk[len(data) - start :]
+        return data[:size]
+
+    @staticmethod
+    def _socks_address(message: bytes) -> tuple:
+        """Address and length of SOCKS5 request/reply: VER CMD RSV ATYP ADDR PORT."""
+        if message[3] == 1:
+            address, length = socket.inet_ntoa(message[4:8]), 4
+        elif message[3] == 4:
+            address, length = socket.inet_ntop(socket.AF_INET6, message[4:20]), 16
+        else:
+            length = message[4] + 1
+            address = message[5 : 4 + length].decode(errors="replace")
+        if len(message) < 4 + length + 2:
+            raise IndexError("incomplete message")
+        return address, 4 + length + 2
+
+    def _parse_socks(self, forward: list, backward: list) -> dict:
+        """Destination and stream offsets of SOCKS5 handshake messages."""
+        request = self._head(forward, 300)
+        reply = self._head(backward, 300)
+        try:
+            greeting_length = 2 + request[1]
+            command = request[greeting_length:]
+            host, request_length = self._socks_address(command)
+            _, reply_length = self._socks_address(reply[2:])
+        except IndexError:
+            return None
+        if reply[2:4] != b"\x05\x00":
+            return None
+
+        return {
+            "host": host,
+            "port": int.from_bytes(command[request_length - 2 : request_length], "big"),
+            "request": greeting_length,
+            "reply": 2,
+            "forward_data": greeting_length + request_length,
+            "backward_data": 2 + reply_length,
+        }
+
+    @staticmethod
+    def _relay_delays(incoming, incoming_start, outgoing, outgoing_start) -> list:
+        """Time between bytes entering and leaving the proxy, ms."""
+        incoming = [
+            (start - incoming_start + len(data), timestamp)
+            for start, timestamp, data in incoming
+            if start >= incoming_start
+        ]
+        outgoing = [
+            (start - outgoing_start + len(data), timestamp)
+            for start, timestamp, data in outgoing
+            if start >= outgoing_start
+        ]
+        delays = []
+        index = 0
+        for end, timestamp in incoming:
+            while index < len(outgoing) and outgoing[index][0] < end:
+                index += 1
+            if index == len(outgoing):
+                break
+            delays.append((outgoing[index][1] - timestamp) * 1000)
+        return delays
+
+    def _client_handshake(self, client: tuple) -> float:
+        """SYN to CONNECT reply time seen by the client, ms."""
+        for stream in self._grid_streams.values():
+            if stream["client"] == client and stream["syn"] is not None:
+                backward = self._segments(stream["backward"])
+                socks = self._parse_socks(self._segments(stream["forward"]), backward)
+                if socks is not None:
+                    replied = self._time_of_offset(backward, socks["reply"])
+                    return (replied - stream["syn"]) * 1000
+
+    def get_connections(self) -> list:
+        """Latency breakdown of each proxied connection."""
+        upstreams = sorted(
+            (
+                stream
+                for stream in self._proxy_streams.values()
+                if stream["server"][1] != self._proxy_port and stream["syn"] is not None
+            ),
+            key=lambda x: x["syn"],
+        )
+
+        connections = []
+        for stream in self._proxy_streams.values():
+            if stream["server"][1] != self._proxy_port:
+                continue
+            if self._client_ip is not None and stream["client"][0] != self._client_ip:
+                continue
+            forward = self._segments(stream["forward"])
+            backward = self._segments(stream["backward"])
+            socks = self._parse_socks(forward, backward)
+            if socks is None:
+                continue
+
+            connection = {
+                "client_port": stream["client"][1],
+                "host": socks["host"],
+                "port": socks["port"],
+                "handshake": self._client_handshake(stream["client"]),
+                "upstream_connect": None,
+                "relay_upstream": None,
+                "relay_downstream": None,
+            }
+
+            # upstream connection is opened between CONNECT request and reply
+            requested = self._time_of_offset(forward, socks["request"])
+            replied = self._time_of_offset(backward, socks["reply"])
+            upstream = next(
+                (
+                    x
+                    for x in upstreams
+                    if x["server"][1] == socks["port"]
+                    and requested <= x["syn"] <= replied
+                ),
+                None,
+            )
+            connections.append(connection)
+            if upstream is None:
+                continue
+            upstreams.remove(upstream)
+
+            if upstream["syn_ack"] is not None:
+                connect = (upstream["syn_ack"] - upstream["syn"]) * 1000
+                connection["upstream_connect"] = connect
+            delays = self._relay_delays(
+                forward,
+                socks["forward_data"],
+                self._segments(upstream["forward"]),
+                0,
+            )
+            if delays:
+                connection["relay_upstream"] = statistics.mean(delays)
+            delays = self._relay_delays(
+                self._segments(upstream["backward"]),
+                0,
+                backward,
+                socks["backward_data"],
+            )
+            if delays:
+                connection["relay_downstream"] = statistics.mean(delays)
+        return connections
+
+    def get_summary(self) -> dict:
+        """Distribution of each latency component per destination host, ms."""
+        hosts = {}
+        for connection in self.get_connections():
+            hosts.setdefault(connection["host"], []).append(connection)
+
+        summary = {}
+        for host, connections in hosts.items():
+            summary[host] = {
+                metric: _summary(
+                    [x[metric] for x in connections if x[metric] is not None]
+                )
+                for metric in self._metrics
+            }
+        return summary
+
+
+class ProxyResourcesAnalyzer:
+    """Analyse proxy resource usage samples of ProxyMonitor."""
+
+    _metrics = ("cpu", "rss", "threads", "fds", "sockets")
+
+    def __init__(self, stats: dict, started: float = None):
+        """Constructor.
+
+        Args:
+            stats (dict): ProxyMonitor stats
+            started (float): epoch time to align samples to, sampler start by default
+        """
+        self._hz = stats.get("hz") or 100
+        self._started = started if started is not None else stats.get("started_at")
+        self._samples = stats.get("samples", [])
+
+    def get_series(self) -> list:
+        """Time aligned samples, cpu in percent of a single core, rss in kB."""
+        series = []
+        previous = None
+        for sample in self._samples:
+            cpu = None
+            if previous is not None and previous["pid"] == sample["pid"]:
+                ticks = sample["utime"] + sample["stime"]
+                ticks -= previous["utime"] + previous["stime"]
+                elapsed = sample["timestamp"] - previous["timestamp"]
+                if elapsed > 0:
+                    cpu = ticks / self._hz / elapsed * 100
+            series.append(
+                {
+                    "time": sample["timestamp"] - (self._started or 0),
+                    "pid": sample["pid"],
+                    "cpu": cpu,
+                    "rss": sample["rss"],
+                    "threads": sample["threads"],
+                    "fds": sample["fds"],
+                    "sockets": sample["sockets"],
+                }
+            )
+            previous = sample
+        return series
+
+    def get_summary(self, start: float = None, end: float = None) -> dict:
+        """Distribution of each metric within the time window."""
+        series = [
+            entry
+            for entry in self.get_series()
+            if (start is None or entry["time"] >= start)
+            and (end is None or entry["time"] <= end)
+        ]
+        return {
+            metric: _summary([x[metric] for x in series if x[metric] is not None])
+            for metric in self._metrics
+        }
+
+    def get_cpu_time(self) -> float:
+        """Proxy CPU time consumed between the first and the last sample, seconds."""
+        ticks = 0
+        for previous, sample in zip(self._samples, self._samples[1:]):
+            if previous["pid"] == sample["pid"]:
+                ticks += sample["utime"] + sample["stime"]
+                ticks -= previous["utime"] + previous["stime"]
+        return ticks / self._hz
+
+    def get_growth(self, metric: str) -> float:
+        """Difference between the last and the first value of the metric."""
+        series = [x for x in self.get_series() if x[metric] is not None]
+        if series:
+            return series[-1][metric] - series[0][metric]
+
+    def get_restarts(self) -> int:
+        """Number of times proxy process was replaced during sampling."""
+        pids = [sample["pid"] for sample in self._samples]
+        return len([1 for x, y in zip(pids, pids[1:]) if x != y])
@@ -2,7 +2,10 @@
 # pylint: disable=too-many-locals
 import re
 import json
+import math
+import time
 import asyncio
+import queue
 import logging
 from concurrent.futures.thread import ThreadPoolExecutor
 from abc import ABC
@@ -13,7 +16,8 @@ from selenium.common import exceptions
 from pyats.topology import Device
 
 from src.classes.utils import TrafficDump
-from src.classes.sut import Proxy
+from src.classes.sut import Proxy, proxy_controller
+from src.classes.tshark_pcap import TsharkPcap
 
 
 _log = logging.getLogger(__name__)
@@ -51,6 +55,22 @@ class BrowserStats:
         return f"{self.LOADING_TIME}, {self.PERF_LOGS}, {self.BROW_LOGS}, {self.CRIT_ERROR}"
 
 
+class SocksStats:
+    """SOCKS5 client response data toolbox."""
+
+    CONNECT = "connect"
+    HANDSHAKE = "handshake"
+    FIRST_BYTE = "first_byte"
+    RECEIVED = "received"
+    ERROR = "error"
+
+    def __str__(self):
+        return (
+            f"{self.CONNECT}, {self.HANDSHAKE}, {self.FIRST_BYTE}, "
+            f"{self.RECEIVED}, {self.ERROR}"
+        )
+
+
 class ChromeBase(ABC):
     """ChromeBase.
 
@@ -117,7 +137,9 @@ class ChromeBase(ABC):
             self._proxy_enabled = True
 
             if session_wide_proxy is True:
-                self._proxy_controller = Proxy(proxy_server, logfile=unicon_log)
+                self._proxy_controller = proxy_controller(
+                    proxy_server, logfile=unicon_log
+                )
 
         # enable webdriver logs collection
         self._chromeoptions.capabilities["goog:loggingPrefs"] = {
@@ -292,6 +314,10 @@ class ChromeAsync(ChromeBase):
                 driver.implicitly_wait(self._session_timeout)
             self._drivers.append(driver)
 
+    @property
+    def drivers(self) -> list:
+        return self._drivers
+
     def get(self, hosts: list):
         """Get.
 
@@ -307,6 +333,46 @@ class ChromeAsync(ChromeBase):
         loop.run_until_complete(asyncio.gather(*asyncio.Task.all_tasks(loop)))
         _log.info(f"{self._loghead} - loading complete: {len(hosts)} pages loaded")
 
+    def get_each(self, hosts: list) -> dict:
+        """Load every host once spreading them over the pool of drivers.
+
+        Stats of each host are collected right after its loading, so
+        returned dict maps host to the same stats Chrome.get_stats returns.
+        """
+        pending = queue.Queue()
+        for host in hosts:
+            pending.put(host)
+        results = {}
+
+        def worker(driver):
+            while True:
+                try:
+                    host = pending.get_nowait()
+                except queue.Empty:
+                    return
+                _log.info(f"{self._loghead} - get URL: {host}")
+                try:
+                    driver.get(host)
+                    stats = {
+                        BrowserStats.LOADING_TIME: self._get_page_loading_time(driver),
+                        BrowserStats.PERF_LOGS: driver.get_log("performance"),
+                        BrowserStats.BROW_LOGS: driver.get_log("browser"),
+                    }
+                except exceptions.WebDriverException as error:
+                    stats = {BrowserStats.CRIT_ERROR: error.msg}
+                    # drop logs of the failed page before the next host
+                    try:
+                        driver.get_log("performance")
+                    except exceptions.WebDriverException:
+                        pass
+                results[host] = BrowserStats.serializer(stats)
+
+        with ThreadPoolExecutor(len(self._drivers)) as executor:
+            for future in [executor.submit(worker, x) for x in self._drivers]:
+                future.result()
+        _log.info(f"{self._loghead} - loading complete: {len(results)} pages loaded")
+        return results
+
     def make_screenshots(self, name: str) -> None:
         for index, driver in enumerate(self._drivers):
             if driver.session_id is not None:
@@ -358,6 +424,18 @@ class Curl:
     the testing host for the analysis.
     """
 
+    _batch_format = "%{url_effective} %{http_code} %{time_total}\\n"
+    _bulk_format = "%{size_download} %{size_upload} %{time_total} %{http_code}\\n"
+    _bulk_upload_file = "bulk_upload.bin"
+    _timing_metrics = (
+        "time_namelookup",
+        "time_connect",
+        "time_appconnect",
+        "time_starttransfer",
+        "time_total",
+        "speed_download",
+    )
+
     def __init__(
         self,
         client_server: Device,
@@ -393,6 +471,8 @@ class Curl:
         self._proxy_controller = None
         self._tshark_contrller = None
         self._response = None
+        self._batch_response = []
+        self._timings = []
         self._loghead = f"CURL@{client_server.name}"
 
         # set proxy
@@ -410,7 +490,7 @@ class Curl:
             self._proxy_enabled = True
 
             if session_wide_proxy is True:
-                self._proxy_controller = Proxy(proxy_server)
+                self._proxy_controller = proxy_controller(proxy_server)
 
         # set timeout
         if isinstance(session_timeout, int):
@@ -432,6 +512,165 @@ class Curl:
                 f.write(self._response)
         return self._response
 
+    def get_batch(
+        self, hosts: list, max_concurrency: int = 50, headers_only: bool = True
+    ) -> list:
+        """Request all hosts concurrently with a single `curl --parallel` command.
+
+        Args:
+            hosts (list): urls to request
+            max_concurrency (int): max number of simultaneous transfers
+            headers_only (bool): send HEAD requests like `get` does, GET otherwise
+        """
+        base_command = self._base_command if headers_only else "curl "
+        outputs = " ".join(f"-o /dev/null {host}" for host in hosts)
+        command = (
+            f"{base_command}-s --no-progress-meter --parallel "
+            f"--parallel-max {max_concurrency} "
+            f'-w "{self._batch_format}" {outputs}{self._command_args}'
+        )
+        timeout = 60
+        if isinstance(self._session_timeout, int):
+            rounds = math.ceil(len(hosts) / max_concurrency)
+            timeout = max(timeout, self._session_timeout * rounds + 10)
+
+        _log.info(f"{self._loghead} - executing command: {command}")
+        response = self._client_server.curl.execute(command, timeout=timeout)
+        self._batch_response = self._parse_batch(hosts, response)
+        _log.info(
+            f"{self._loghead} - responses recieved: "
+            f"{[entry['status_code'] for entry in self._batch_response]}"
+        )
+        return self._batch_response
+
+    @staticmethod
+    def _parse_batch(hosts: list, response: str) -> list:
+        """Match `-w` output lines (in completion order) to requested hosts."""
+        results = [
+            {"host": host, "status_code": None, "time_total": None} for host in hosts
+        ]
+        for line in response.splitlines():
+            fields = line.split()
+            if len(fields) != 3 or not fields[1].isdigit():
+                continue
+            url, code, time_total = fields
+            for entry in results:
+                if entry["time_total"] is None and entry["host"].rstrip(
+                    "/"
+                ) == url.rstrip("/"):
+                    # curl reports `000` when no response was received
+                    entry["status_code"] = int(code) or None
+                    entry["time_total"] = float(time_total) * 1000
+                    break
+        return results
+
+    def get_timing(self, host: str, runs: int = 1) -> list:
+        """Download host `runs` times and collect `--write-out` timings as json.
+
+        Every run is a separate curl process, so connection setup is measured
+        each time. Timings are in seconds, speed_download in bytes per second.
+
+        Args:
+            host (str): url to download
+            runs (int): number of downloads
+        """
+        # http_code is quoted as curl reports `000` on failures
+        fields = [f'"{metric}": %{{{metric}}}' for metric in self._timing_metrics]
+        template = "{" + ", ".join(fields) + ', "http_code": "%{http_code}"}\\n'
+        command = (
+            f"for i in $(seq {runs}); do "
+            f"curl -s -o /dev/null -w '{template}' {host}{self._command_args}; done"
+        )
+        timeout = 60
+        if isinstance(self._session_timeout, int):
+            timeout = max(timeout, self._session_timeout * runs + 10)
+
+        _log.info(f"{self._loghead} - executing command: {command}")
+        response = self._client_server.curl.execute(command, timeout=timeout)
+
+        timings = []
+        for line in response.splitlines():
+            line = line.strip()
+            if not line.startswith("{"):
+                continue
+            try:
+                timing = json.loads(line)
+            except ValueError:
+                continue
+            timing["http_code"] = int(timing["http_code"])
+            timings.append(timing)
+        self._timings.extend(timings)
+        _log.info(f"{self._loghead} - {len(timings)} out of {runs} timings recieved")
+        return timings
+
+    def get_bulk(self, url: str, streams: int = 1, upload_size: int = None) -> dict:
+        """Transfer large objects over parallel streams with a single curl command.
+
+        Args:
+            url (str): url to download from or upload to
+            streams (int): number of simultaneous transfers
+            upload_size (int): upload generated file of the given size in bytes
+                with PUT instead of downloading
+        """
+        commands = []
+        upload = ""
+        if upload_size is not None:
+            commands.append(
+                f"head -c {upload_size} /dev/zero > {self._bulk_upload_file}"
+            )
+            upload = f"-T {self._bulk_upload_file} "
+        transfers = " ".join(f"-o /dev/null {upload}{url}" for _ in range(streams))
+        commands.append(
+            f"curl -s --no-progress-meter --parallel --parallel-max {streams} "
+            f'-w "{self._bulk_format}" {transfers}{self._command_args}'
+        )
+        if upload_size is not None:
+            commands.append(f"rm -f {self._bulk_upload_file}")
+        command = "; ".join(commands)
+        timeout = 60
+        if isinstance(self._session_timeout, int):
+            timeout = max(timeout, self._session_timeout + 10)
+
+        _log.info(f"{self._loghead} - executing command: {command}")
+        response = self._client_server.curl.execute(command, timeout=timeout)
+
+        results = []
+        for line in response.splitlines():
+            fields = line.split()
+            if len(fields) == 4 and fields[0].isdigit() and fields[3].isdigit():
+                results.append(
+                    {
+                        "size_download": int(fields[0]),
+                        "size_upload": int(fields[1]),
+                        "time_total": float(fields[2]),
+                        "http_code": int(fields[3]),
+                    }
+                )
+        # streams start together, so the slowest one defines the transfer time
+        stats = {
+            "streams": streams,
+            "direction": "upload" if upload_size is not None else "download",
+            "bytes": sum(x["size_download"] + x["size_upload"] for x in results),
+            "time": max([x["time_total"] for x in results], default=0),
+            "errors": streams - len([x for x in results if x["http_code"] == 200]),
+        }
+        _log.info(f"{self._loghead} - bulk transfer complete: {stats}")
+        return stats
+
+    def get_timing_stats(self, write_to_file: str = None) -> list:
+        """Get all collected timings for post analyzis."""
+        if isinstance(write_to_file, str):
+            with open(write_to_file, "w") as f:
+                f.write(json.dumps(self._timings))
+        return self._timings
+
+    def get_batch_stats(self, write_to_file: str = None) -> list:
+        """Get results of the last batch for post analyzis."""
+        if isinstance(write_to_file, str):
+            with open(write_to_file, "w") as f:
+                f.write(json.dumps(self._batch_response))
+        return self._batch_response
+
     def __enter__(self):
         self._client_server.connect(alias="curl", logfile=self._unicon_log)
         if isinstance(self._proxy_controller, Proxy):
@@ -448,6 +687,197 @@ class Curl:
         self._client_server.curl.disconnect()
 
 
+def _template_bytes(message: str) -> bytes:
+    payload = TsharkPcap._socks_handshake_template[message]["payload"]
+    return bytes.fromhex(payload.replace(":", ""))
+
+
+class SocksClient:
+    """SocksClient.
+
+    Context manager which opens many concurrent connections through
+    the proxy with native asyncio SOCKS5 implementation and measures
+    connect, handshake and first byte latency of each connection.
+    Runs on the testing host, so proxy is reached by its external address.
+    """
+
+    _greeting = _template_bytes("connect to server request")
+    _greeting_reply = _template_bytes("connect to server response")
+    _connect_request = _template_bytes("command request - connect")
+    _connect_reply = _template_bytes("command response - connect")
+
+    def __init__(
+        self,
+        proxy_server: Device = None,
+        proxy_ip: str = None,
+        proxy_port: str = None,
+        connections: int = 1000,
+        max_concurrency: int = None,
+        payload: bytes = b"",
+        response_size: int = 0,
+        session_timeout: int = 30,
+        session_wide_proxy: bool = True,
+    ):
+        """Constructor.
+
+        Args:
+            proxy_server (Device): proxy hosting server
+            proxy_ip (str): proxy ip, external address of the proxy_server by default
+            proxy_port (str): proxy port
+            connections (int): number of connections to open
+            max_concurrency (int): number of simultaneously open connections,
+                all connections are opened at once if not specified
+            payload (bytes): data to send to the destination after the handshake
+            response_size (int): number of bytes to read from the destination
+            session_timeout (int): single connection timeout
+            session_wide_proxy (bool): enabe proxy switching on the session level
+            (if proxy is defined)
+        """
+        self._connections = connections
+        self._max_concurrency = max_concurrency or connections
+        self._payload = payload
+        self._response_size = response_size
+        self._session_timeout = session_timeout
+        self._proxy_controller = None
+        self._response = []
+        self._loghead = "SOCKS5@local"
+
+        # set proxy
+        if isinstance(proxy_server, Device):
+            if not proxy_ip:
+                connection = proxy_server.connections.cli.command
+                pattern = re.compile(r"ssh -i (/.*)+\s(\w+)@(.*)")
+                proxy_ip = pattern.search(connection)[3]
+            if session_wide_proxy is True:
+                self._proxy_controller = proxy_controller(proxy_server)
+        self._proxy_ip = proxy_ip
+        self._proxy_port = int(proxy_port) if proxy_port else 1080
+
+    def get(self, host: str, port: int = 80) -> None:
+        """Open all connections to the destination through the proxy."""
+        _log.info(
+            f"{self._loghead} - opening {self._connections} connections to "
+            f"{host}:{port} via {self._proxy_ip}:{self._proxy_port}"
+        )
+        loop = asyncio.new_event_loop()
+        try:
+            self._response = loop.run_until_complete(self._get_all(host, port))
+        finally:
+            loop.close()
+        failed = len([x for x in self._response if x[SocksStats.ERROR] is not None])
+        _log.info(
+            f"{self._loghead} - connections complete: {failed} out of "
+            f"{self._connections} failed"
+        )
+
+    def get_stats(self, write_to_file: str = None) -> list:
+        """Get results for post analyzis."""
+        if isinstance(write_to_file, str):
+            with open(write_to_file, "w") as f:
+                f.write(json.dumps(self._response))
+        return self._response
+
+    async def _get_all(self, host: str, port: int) -> list:
+        semaphore = asyncio.Semaphore(self._max_concurrency)
+        return await asyncio.gather(
+            *(self._session(semaphore, host, port) for _ in range(self._connections))
+        )
+
+    async def _session(self, semaphore, host: str, port: int) -> dict:
+        result = {
+            SocksStats.CONNECT: None,
+            SocksStats.HANDSHAKE: None,
+            SocksStats.FIRST_BYTE: None,
+            SocksStats.RECEIVED: 0,
+            SocksStats.ERROR: None,
+        }
+        async with semaphore:
+            writer = None
+            try:
+                started = time.perf_counter()
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self._proxy_ip, self._proxy_port),
+                    self._session_timeout,
+                )
+                connected = time.perf_counter()
+                result[SocksStats.CONNECT] = (connected - started) * 1000
+
+                await asyncio.wait_for(
+                    self._handshake(reader, writer, host, port),
+                    self._session_timeout,
+                )
+                handshaked = time.perf_counter()
+                result[SocksStats.HANDSHAKE] = (handshaked - connected) * 1000
+
+                await asyncio.wait_for(
+                    self._transfer(reader, writer, result), self._session_timeout
+                )
+            except (
+                OSError,
+                asyncio.TimeoutError,
+                asyncio.IncompleteReadError,
+            ) as error:
+                result[SocksStats.ERROR] = f"{type(error).__name__}: {error}"
+            finally:
+                if writer is not None:
+                    writer.close()
+        return result
+
+    async def _handshake(self, reader, writer, host: str, port: int) -> None:
+        writer.write(self._greeting)
+        await writer.drain()
+        reply = await reader.readexactly(len(self._greeting_reply))
+        if reply != self._greeting_reply:
+            raise ConnectionError(f"Unexpected greeting reply {reply.hex(':')}")
+
+        # request: VER CMD RSV ATYP(domain) LEN HOST PORT
+        address = host.encode()
+        writer.write(
+            self._connect_request
+            + bytes((0, 3, len(address)))
+            + address
+            + port.to_bytes(2, "big")
+        )
+        await writer.drain()
+
+        # reply: VER REP RSV ATYP BND.ADDR BND.PORT
+        reply = await reader.readexactly(4)
+        if reply[:2] != self._connect_reply:
+            raise ConnectionError(f"Unexpected connect reply {reply.hex(':')}")
+        if reply[3] == 1:
+            await reader.readexactly(4 + 2)
+        elif reply[3] == 4:
+            await reader.readexactly(16 + 2)
+        else:
+            length = (await reader.readexactly(1))[0]
+            await reader.readexactly(length + 2)
+
+    async def _transfer(self, reader, writer, result: dict) -> None:
+        started = time.perf_counter()
+        if self._payload:
+            writer.write(self._payload)
+            await writer.drain()
+
+        received = 0
+        while received < self._response_size:
+            chunk = await reader.read(min(65536, self._response_size - received))
+            if not chunk:
+                break
+            if received == 0:
+                result[SocksStats.FIRST_BYTE] = (time.perf_counter() - started) * 1000
+            received += len(chunk)
+        result[SocksStats.RECEIVED] = received
+
+    def __enter__(self):
+        if isinstance(self._proxy_controller, Proxy):
+            self._proxy_controller.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if isinstance(self._proxy_controller, Proxy):
+            self._proxy_controller.stop()
+
+
 # if __name__ == "__main__":
 #     from pyats.topology import loader
 
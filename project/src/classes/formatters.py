@@ -70,6 +70,140 @@ def log_table_time(
     return preface + table_name + table_head + table_content
 
 
+def log_table_load(hosts: Sequence[str], client: str, curve: Sequence[dict]) -> str:
+
+    preface = f"CLIENT: {client}\n" f"HOSTS:\n"
+    for i in hosts:
+        preface += f"{4*' '}{i}\n"
+
+    table_name = "\nTABLE - throughput/latency curve, ms\n"
+    table_head = (
+        f"{''.center(87, '_')}\n"
+        f"|{'step'.center(6)}|{'sessions'.center(10)}|{'requests'.center(10)}|"
+        f"{'errors, %'.center(11)}|{'req/s'.center(10)}|{'latency avg'.center(16)}|"
+        f"{'latency p95'.center(16)}|\n"
+        f"|{''.center(85, '_')}|\n"
+    )
+    table_content = ""
+    for stat in curve:
+        table_content += (
+            f"|{str(stat['step']).ljust(6)}|{str(stat['concurrency']).ljust(10)}|"
+            f"{str(stat['requests']).ljust(10)}|"
+            f"{str(stat['error_rate'] * 100)[:5].ljust(11)}|"
+            f"{str(stat['throughput'])[:6].ljust(10)}|"
+            f"{str(stat['latency_avg'])[:8].ljust(16)}|"
+            f"{str(stat['latency_p95'])[:8].ljust(16)}|\n"
+            f"|{''.center(85, '_')}|\n"
+        )
+    return preface + table_name + table_head + table_content
+
+
+def log_table_connections(summary: dict) -> str:
+
+    table_name = "\nTABLE - connection latency breakdown, ms\n"
+    table_head = (
+        f"{''.center(90, '_')}\n"
+        f"|{'host'.center(20)}|{'stage'.center(18)}|{'count'.center(7)}|"
+        f"{'avg'.center(9)}|{'p50'.center(9)}|{'p95'.center(9)}|{'max'.center(9)}|\n"
+        f"|{''.center(88, '_')}|\n"
+    )
+    table_content = ""
+    for host, metrics in summary.items():
+        host = (host[:18] + "..") if len(host) > 20 else host
+        for metric, stat in metrics.items():
+            stat = stat or {}
+            table_content += (
+                f"|{host.ljust(20)}|{metric.ljust(18)}|"
+                f"{str(stat.get('count', 0)).ljust(7)}|"
+                f"{str(stat.get('avg'))[:7].ljust(9)}|"
+                f"{str(stat.get('p50'))[:7].ljust(9)}|"
+                f"{str(stat.get('p95'))[:7].ljust(9)}|"
+                f"{str(stat.get('max'))[:7].ljust(9)}|\n"
+            )
+        table_content += f"|{''.center(88, '_')}|\n"
+    return table_name + table_head + table_content
+
+
+def log_table_curl_timing(host: str, runs: int, summary: dict) -> str:
+
+    preface = f"RUNS: {runs}\n" f"HOST: {host}\n"
+
+    table_name = "\nTABLE - curl timings, ms (speed_download, kB/s)\n"
+    table_head = (
+        f"{''.center(80, '_')}\n"
+        f"|{'metric'.center(20)}|{'proxy ON'.center(23)}|{'proxy OFF'.center(23)}|"
+        f"{'delay'.center(10)}|\n"
+        f"|{''.center(20)}|{''.center(57, '_')}|\n"
+        f"|{''.center(20)}|{'avg'.center(11)}|{'p50'.center(11)}|"
+        f"{'avg'.center(11)}|{'p50'.center(11)}|{'rate'.center(10)}|\n"
+        f"|{''.center(78, '_')}|\n"
+    )
+    table_content = ""
+    for metric, stat in summary.items():
+        proxied = stat["proxied"] or {}
+        direct = stat["direct"] or {}
+        rate = None
+        if proxied.get("p50") is not None and direct.get("p50"):
+            rate = proxied["p50"] / direct["p50"]
+        table_content += (
+            f"|{metric.ljust(20)}|"
+            f"{str(proxied.get('avg'))[:7].ljust(11)}|"
+            f"{str(proxied.get('p50'))[:7].ljust(11)}|"
+            f"{str(direct.get('avg'))[:7].ljust(11)}|"
+            f"{str(direct.get('p50'))[:7].ljust(11)}|"
+            f"{str(rate)[:4].ljust(10)}|\n"
+            f"|{''.center(78, '_')}|\n"
+        )
+    return preface + table_name + table_head + table_content
+
+
+def log_table_ansible_timing(group: str, timings: Sequence[dict]) -> str:
+
+    preface = f"GROUP: {group}\n"
+
+    table_name = "\nTABLE - ansible task timing, s\n"
+    table_head = (
+        f"{''.center(90, '_')}\n"
+        f"|{'playbook'.center(14)}|{'task'.center(50)}|{'hosts'.center(7)}|"
+        f"{'max'.center(7)}|{'total'.center(7)}|\n"
+        f"|{''.center(88, '_')}|\n"
+    )
+    table_content = ""
+    for row in timings:
+        task = (row["task"][:48] + "..") if len(row["task"]) > 50 else row["task"]
+        table_content += (
+            f"|{row['playbook'][:14].ljust(14)}|{task.ljust(50)}|"
+            f"{str(row['hosts']).ljust(7)}|"
+            f"{str(round(row['max'], 2))[:7].ljust(7)}|"
+            f"{str(round(row['total'], 2))[:7].ljust(7)}|\n"
+        )
+    table_content += f"|{''.center(88, '_')}|\n"
+    return preface + table_name + table_head + table_content
+
+
+def log_table_grid_deployment(timings: dict) -> str:
+
+    table_name = "\nTABLE - selenium grid deployment, s\n"
+    table_head = (
+        f"{''.center(66, '_')}\n"
+        f"|{'device'.center(20)}|{'pull'.center(10)}|{'create'.center(10)}|"
+        f"{'ready'.center(10)}|{'total'.center(11)}|\n"
+        f"|{''.center(64, '_')}|\n"
+    )
+    table_content = ""
+    for device, stat in timings.items():
+        stat = stat or {}
+        table_content += (
+            f"|{device[:20].ljust(20)}|"
+            f"{str(stat.get('pull'))[:8].ljust(10)}|"
+            f"{str(stat.get('create'))[:8].ljust(10)}|"
+            f"{str(stat.get('ready'))[:8].ljust(10)}|"
+            f"{str(stat.get('total'))[:8].ljust(11)}|\n"
+        )
+    table_content += f"|{''.center(64, '_')}|\n"
+    return table_name + table_head + table_content
+
+
 # if __name__ == "__main__":
 # p = ((45, 43), (30, 29))
 # d = ((50, 50), (32, 32), (16, 16), (0,0))
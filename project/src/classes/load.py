@@ -0,0 +1,226 @@
+# pylint: disable=too-many-arguments
+import math
+import time
+import logging
+from collections import namedtuple
+from concurrent.futures.thread import ThreadPoolExecutor
+
+from selenium.common import exceptions
+from pyats.topology import Device
+
+from src.classes.clients import ChromeAsync, Curl
+from src.classes.sut import (
+    LocalProxy,
+    ProxyMonitor,
+    ProxySupervisor,
+    proxy_controller,
+)
+
+
+_log = logging.getLogger(__name__)
+_log.setLevel(logging.INFO)
+
+
+LoadProfile = namedtuple(
+    "LoadProfile", ["steps", "step_duration", "target_concurrency"]
+)
+LoadSample = namedtuple(
+    "LoadSample", ["timestamp", "step", "concurrency", "latency", "error"]
+)
+
+
+class LoadGenerator:
+    """LoadGenerator.
+
+    Context manager which ramps the number of concurrent client sessions
+    against the proxy server according to the load profile and records
+    every request as LoadSample for the post analysis.
+    """
+
+    _clients = ("chrome", "curl")
+
+    def __init__(
+        self,
+        client_server: Device,
+        proxy_server: Device,
+        hosts: list,
+        profile: LoadProfile,
+        client: str = "chrome",
+        session_timeout: int = 30,
+        resources_interval: int = None,
+        supervise: bool = False,
+        unicon_log: str = None,
+    ):
+        """Constructor.
+
+        Args:
+            client_server (Device): server, from where load will be generated
+            proxy_server (Device): proxy hosting server
+            hosts (list): urls to request, cycled over concurrent sessions
+            profile (LoadProfile): number of steps, duration of a single step in
+                seconds and concurrency reached on the last step
+            client (str): `chrome` (ChromeAsync sessions) or `curl` (curl processes)
+            session_timeout (int): single request timeout
+            resources_interval (int): sample proxy resource usage with the given
+                interval in seconds, disabled if None
+            supervise (bool): restart proxy if it crashes under load
+            unicon_log (str): file for unicon module logs
+        """
+        if client not in self._clients:
+            raise ValueError(
+                f"Unknown client `{client}`, expected one of {self._clients}"
+            )
+
+        self._client_server = client_server
+        self._proxy_server = proxy_server
+        self._hosts = hosts
+        self._profile = profile
+        self._client = client
+        self._session_timeout = session_timeout
+        self._unicon_log = unicon_log
+        self._proxy_controller = proxy_controller(proxy_server, logfile=unicon_log)
+        self._proxy_monitor = None
+        if resources_interval and proxy_server.type != LocalProxy.device_type:
+            self._proxy_monitor = ProxyMonitor(
+                proxy_server, interval=resources_interval, logfile=unicon_log
+            )
+        self._proxy_supervisor = None
+        if supervise:
+            self._proxy_supervisor = ProxySupervisor(proxy_server, logfile=unicon_log)
+        self._samples = []
+        self._started = None
+        self._started_at = None
+        self._loghead = f"LoadGenerator({client})@{client_server.name}"
+
+    @property
+    def samples(self) -> list:
+        return self._samples
+
+    @property
+    def started_at(self) -> float:
+        """Epoch time of the load start, sample timestamps are relative to it."""
+        return self._started_at
+
+    @property
+    def resources(self) -> dict:
+        """Stats of ProxyMonitor or None if resource sampling is disabled."""
+        if self._proxy_monitor is not None:
+            return self._proxy_monitor.get_stats()
+
+    @property
+    def supervision(self) -> dict:
+        """Stats of ProxySupervisor or None if supervision is disabled."""
+        if self._proxy_supervisor is not None:
+            return self._proxy_supervisor.get_stats()
+
+    def concurrency_at(self, step: int) -> int:
+        """Number of concurrent sessions on the given step (starting from 1)."""
+        target = self._profile.target_concurrency
+        return max(1, math.ceil(target * step / self._profile.steps))
+
+    def run(self) -> list:
+        """Execute all steps of the load profile."""
+        self._started = time.monotonic()
+        self._started_at = time.time()
+        for step in range(1, self._profile.steps + 1):
+            concurrency = self.concurrency_at(step)
+            _log.info(
+                f"{self._loghead} - step {step}/{self._profile.steps}: "
+                f"{concurrency} concurrent sessions for {self._profile.step_duration}s"
+            )
+            if self._client == "chrome":
+                self._run_chrome_step(step, concurrency)
+            else:
+                self._run_curl_step(step, concurrency)
+            if self._proxy_monitor is not None:
+                self._proxy_monitor.collect()
+        _log.info(f"{self._loghead} - load complete: {len(self._samples)} requests")
+        return self._samples
+
+    def _record(self, step, concurrency, started, latency, error) -> None:
+        self._samples.append(
+            LoadSample(
+                timestamp=started - self._started,
+                step=step,
+                concurrency=concurrency,
+                latency=latency,
+                error=error,
+            )
+        )
+
+    def _host_for(self, request_index: int) -> str:
+        return self._hosts[request_index % len(self._hosts)]
+
+    def _run_chrome_step(self, step: int, concurrency: int) -> None:
+        def worker(index, driver, deadline):
+            request_index = index
+            while time.monotonic() < deadline:
+                host = self._host_for(request_index)
+                error = None
+                started = time.monotonic()
+                try:
+                    driver.get(host)
+                except exceptions.WebDriverException as exception:
+                    error = exception.msg
+                latency = (time.monotonic() - started) * 1000
+                self._record(step, concurrency, started, latency, error)
+                request_index += concurrency
+
+        with ChromeAsync(
+            grid_server=self._client_server,
+            max_num_of_instances=concurrency,
+            session_timeout=self._session_timeout,
+            proxy_server=self._proxy_server,
+            session_wide_proxy=False,
+            unicon_log=self._unicon_log,
+        ) as chrome:
+            # webdriver sessions are already open, they don't eat the step time
+            deadline = time.monotonic() + self._profile.step_duration
+            with ThreadPoolExecutor(concurrency) as executor:
+                futures = [
+                    executor.submit(worker, index, driver, deadline)
+                    for index, driver in enumerate(chrome.drivers)
+                ]
+                # worker failures fail the step instead of cutting its samples
+                for future in futures:
+                    future.result()
+
+    def _run_curl_step(self, step: int, concurrency: int) -> None:
+        deadline = time.monotonic() + self._profile.step_duration
+
+        with Curl(
+            client_server=self._client_server,
+            session_timeout=self._session_timeout,
+            proxy_server=self._proxy_server,
+            session_wide_proxy=False,
+            unicon_log=self._unicon_log,
+        ) as curl:
+            request_index = 0
+            while time.monotonic() < deadline:
+                hosts = [self._host_for(request_index + i) for i in range(concurrency)]
+                started = time.monotonic()
+                results = curl.get_batch(
+                    hosts, max_concurrency=concurrency, headers_only=False
+                )
+                for result in results:
+                    error = None if result["status_code"] else "connection failed"
+                    latency = result["time_total"]
+                    if latency is None:
+                        latency = (time.monotonic() - started) * 1000
+                    self._record(step, concurrency, started, latency, error)
+                request_index += concurrency
+
+    def __enter__(self):
+        self._proxy_controller.start()
+        if self._proxy_supervisor is not None:
+            self._proxy_supervisor.start()
+        if self._proxy_monitor is not None:
+            self._proxy_monitor.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if self._proxy_supervisor is not None:
+            self._proxy_supervisor.stop()
+        if self._proxy_monitor is not None:
+            self._proxy_monitor.stop()
+        self._proxy_controller.stop()
@@ -0,0 +1,320 @@
+import socket
+import random
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+
+
+_log = logging.getLogger(__name__)
+_log.setLevel(logging.INFO)
+
+
+class LocalServer(ABC):
+    """LocalServer.
+
+    Context manager which runs asyncio tcp server on the testing host in
+    a background thread, so it can be used from the synchronous code.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        """Constructor.
+
+        Args:
+            host (str): address to listen on
+            port (int): port to listen on, any free port if 0
+        """
+        self._host = host
+        self._port = port
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._connections = set()
+        self._loghead = f"{type(self).__name__}@{host}"
+
+    @property
+    def address(self) -> tuple:
+        return self._host, self._port
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        _log.info(f"{self._loghead} - listening on port {self._port}")
+
+    def stop(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        _log.info(f"{self._loghead} - stopped")
+
+    def _serve(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(
+                self._serve_connection, self._host, self._port, backlog=4096
+            )
+        )
+        self._port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.run_until_complete(self._shutdown())
+            self._loop.close()
+
+    async def _serve_connection(self, reader, writer):
+        self._connections.add(writer)
+        try:
+            await self._handle(reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _shutdown(self):
+        self._server.close()
+        for writer in list(self._connections):
+            writer.transport.abort()
+        await self._server.wait_closed()
+
+        # give handlers a chance to finish relaying, then drop the rest
+        tasks = asyncio.all_tasks() - {asyncio.current_task()}
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=1)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    @abstractmethod
+    async def _handle(self, reader, writer):
+        pass
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
+
+
+class EchoServer(LocalServer):
+    """Send back everything received from the client."""
+
+    async def _handle(self, reader, writer):
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+
+
+class SocksStandIn(LocalServer):
+    """Minimal SOCKS5 proxy (no authentication, CONNECT command only).
+
+    Used instead of proxytcp to run the framework clients locally and
+    as a baseline for proxytcp benchmarks. Faults can be injected to
+    check how clients handle misbehaving proxy.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        handshake_delay: float = 0,
+        relay_delay: float = 0,
+        drop_rate: float = 0,
+        error_rate: float = 0,
+    ):
+        """Constructor.
+
+        Args:
+            host (str): address to listen on
+            port (int): port to listen on, any free port if 0
+            handshake_delay (float): delay before each handshake reply, seconds
+            relay_delay (float): delay before relaying each chunk of data, seconds
+            drop_rate (float): probability to close connection right after accept
+            error_rate (float): probability to reply to CONNECT with general failure
+        """
+        super().__init__(host, port)
+        self._handshake_delay = handshake_delay
+        self._relay_delay = relay_delay
+        self._drop_rate = drop_rate
+        self._error_rate = error_rate
+        self._stats = {"connections": 0, "dropped": 0, "errors": 0, "relayed": 0}
+
+    @property
+    def stats(self) -> dict:
+        """Number of served, dropped and failed connections and relayed bytes."""
+        return dict(self._stats)
+
+    def inject(self, **faults) -> None:
+        """Change fault injection settings of the running server.
+
+        Args:
+            faults: any of handshake_delay, relay_delay, drop_rate, error_rate
+        """
+        for name, value in faults.items():
+            if name not in (
+                "handshake_delay",
+                "relay_delay",
+                "drop_rate",
+                "error_rate",
+            ):
+                raise ValueError(f"Unknown fault `{name}`")
+            setattr(self, f"_{name}", value)
+        _log.info(f"{self._loghead} - faults injected: {faults}")
+
+    async def _handle(self, reader, writer):
+        self._stats["connections"] += 1
+        if random.random() < self._drop_rate:
+            self._stats["dropped"] += 1
+            return
+
+        # greeting: VER NMETHODS METHODS
+        header = await reader.readexactly(2)
+        await reader.readexactly(header[1])
+        await asyncio.sleep(self._handshake_delay)
+        writer.write(b"\x05\x00")
+        await writer.drain()
+
+        # request: VER CMD RSV ATYP DST.ADDR DST.PORT
+        request = await reader.readexactly(4)
+        if request[3] == 1:
+            host = socket.inet_ntoa(await reader.readexactly(4))
+        elif request[3] == 4:
+            host = socket.inet_ntop(socket.AF_INET6, await reader.readexactly(16))
+        else:
+            length = (await reader.readexactly(1))[0]
+            host = (await reader.readexactly(length)).decode()
+        port = int.from_bytes(await reader.readexactly(2), "big")
+        await asyncio.sleep(self._handshake_delay)
+
+        if random.random() < self._error_rate:
+            # general SOCKS server failure
+            self._stats["errors"] += 1
+            writer.write(b"\x05\x01\x00\x01" + bytes(6))
+            await writer.drain()
+            return
+        if request[1] != 1:
+            # command not supported
+            writer.write(b"\x05\x07\x00\x01" + bytes(6))
+            await writer.drain()
+            return
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(host, port)
+        except OSError:
+            # connection refused
+            writer.write(b"\x05\x05\x00\x01" + bytes(6))
+            await writer.drain()
+            return
+        writer.write(b"\x05\x00\x00\x01" + bytes(6))
+        await writer.drain()
+
+        # relay until any side closes the connection
+        relays = {
+            asyncio.ensure_future(self._relay(reader, upstream_writer)),
+            asyncio.ensure_future(self._relay(upstream_reader, writer)),
+        }
+        try:
+            _, pending = await asyncio.wait(relays, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            upstream_writer.close()
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _relay(self, reader, writer):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                await asyncio.sleep(self._relay_delay)
+                writer.write(data)
+                await writer.drain()
+                self._stats["relayed"] += len(data)
+        except ConnectionError:
+            pass
+
+
+class OriginServer(LocalServer):
+    """Minimal HTTP/1.1 web server.
+
+    Routes:
+        /status/<code> - empty response with the given status code
+        /bytes/<size> - response body of the given size in bytes
+        any other path - small html page
+    """
+
+    _chunk = b"x" * 65536
+    _page = b"<html><head><title>origin</title></head><body>origin</body></html>"
+    _reasons = {200: "OK", 404: "Not Found", 405: "Method Not Allowed"}
+
+    async def _handle(self, reader, writer):
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, path, _ = request_line.decode().split(" ", 2)
+
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode().strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            await reader.readexactly(int(headers.get("content-length", 0)))
+
+            await self._respond(writer, method, path)
+            if headers.get("connection", "").lower() == "close":
+                break
+
+    async def _respond(self, writer, method: str, path: str) -> None:
+        code, size, body = 200, len(self._page), self._page
+        route = path.strip("/").split("/")
+        if method not in ("GET", "HEAD", "POST", "PUT"):
+            code, size, body = 405, 0, b""
+        elif route[0] == "status" and len(route) == 2 and route[1].isdigit():
+            code, size, body = int(route[1]), 0, b""
+        elif route[0] == "bytes" and len(route) == 2 and route[1].isdigit():
+            size, body = int(route[1]), None
+
+        reason = self._reasons.get(code, "Status")
+        writer.write(
+            f"HTTP/1.1 {code} {reason}\r\n"
+            f"Content-Type: text/html\r\n"
+            f"Content-Length: {size}\r\n\r\n".encode()
+        )
+        if method != "HEAD":
+            if body is not None:
+                writer.write(body)
+            else:
+                for offset in range(0, size, len(self._chunk)):
+                    writer.write(self._chunk[: size - offset])
+                    await writer.drain()
+        await writer.drain()
+
+
+# if __name__ == "__main__":
+#     from src.classes.clients import SocksClient
+#     from src.classes.analyse import SocksResponseAnalyzer
+
+#     with EchoServer() as echo, SocksStandIn() as proxy:
+#         with SocksClient(
+#             proxy_ip=proxy.address[0],
+#             proxy_port=proxy.address[1],
+#             connections=2000,
+#             max_concurrency=500,
+#             payload=b"x" * 1024,
+#             response_size=1024,
+#         ) as client:
+#             client.get(*echo.address)
+#             stats = client.get_stats()
+
+#     data = SocksResponseAnalyzer(stats)
+#     print(data.get_latency_summary("handshake"))
@@ -1,8 +1,12 @@
+import re
+import json
 import time
 import logging
+import urllib.request
 
 from pyats.topology import Device
 
+from src.classes.tracing import span
 from src.classes.troubleshooting import retry_on_unicon_error
 
 
@@ -13,10 +17,37 @@ _log.setLevel(logging.INFO)
 class SeleniumGrid:
     """Connection manager for remote selenium server."""
 
-    def __init__(self, device: Device, logfile: str = None):
+    def __init__(
+        self,
+        device: Device,
+        logfile: str = None,
+        ready_timeout: int = 120,
+        slots: int = 4,
+    ):
+        """Constructor.
+
+        Args:
+            device (Device): device hosting the grid
+            logfile (str): file for unicon module logs
+            ready_timeout (int): max time to wait for the grid readiness, seconds
+            slots (int): number of browser slots registered nodes should provide,
+                NODE_MAX_SESSION of docker-compose.yml
+        """
         self._device = device
         self._loghead = f"SeleniumGrid@{device.name}"
         self._logfile = logfile
+        self._ready_timeout = ready_timeout
+        self._slots = slots
+        self._ready_time = None
+
+        connection = device.connections.cli.command
+        host = re.compile(r"ssh -i (/.*)+\s(\w+)@(.*)").search(connection)[3]
+        self._hub_api = f"http://{host}:4444/grid/api/hub"
+
+    @property
+    def ready_time(self) -> float:
+        """Time from the last (re)start till the grid readiness, seconds."""
+        return self._ready_time
 
     @retry_on_unicon_error
     def up(self):
@@ -25,25 +56,96 @@ class SeleniumGrid:
         self._disconnect()
         _log.info(f"{self._loghead} - created")
 
+    @retry_on_unicon_error
+    def deploy(self, check_ready: bool = True) -> dict:
+        """Pull missing images and create grid containers.
+
+        Returns durations of the steps, seconds. With check_ready the grid is
+        started once to measure its readiness time and stopped again.
+        Images pre-pulled by the docker playbook are not pulled again, as the
+        pull checks every image against the registry.
+
+        Args:
+            check_ready (bool): start the grid and wait for its readiness
+        """
+        timings = {}
+        started = time.monotonic()
+        self._connect()
+        try:
+            with span("grid pull", "grid", device=self._device.name):
+                self._device.grid.execute(
+                    "docker image inspect $(docker-compose config | awk '/image:/ {print $2}')"
+                    " > /dev/null 2>&1 || docker-compose pull --quiet",
+                    timeout=600,
+                )
+            timings["pull"] = time.monotonic() - started
+            with span("grid create", "grid", device=self._device.name):
+                self._device.grid.execute("docker-compose up --no-start")
+            timings["create"] = time.monotonic() - started - timings["pull"]
+            if check_ready:
+                with span("grid ready", "grid", device=self._device.name):
+                    self._device.grid.execute("docker-compose start")
+                    try:
+                        timings["ready"] = self.wait_until_ready()
+                    finally:
+                        self._device.grid.execute("docker-compose stop")
+        finally:
+            self._disconnect()
+        timings["total"] = time.monotonic() - started
+        _log.info(f"{self._loghead} - deployed in {timings['total']:.2f}s")
+        return timings
+
     def start(self):
         self._connect()
         self._device.grid.execute("docker-compose start")
-        time.sleep(10)  # temporary solution
         _log.info(f"{self._loghead} - started via CLI")
+        self.wait_until_ready()
+
+    def attach(self):
+        """Use the grid started by another manager, e.g. the job session."""
+        self._connect()
+        _log.info(f"{self._loghead} - attached to running grid")
+        self.wait_until_ready()
 
     @retry_on_unicon_error
     def restart(self):
         self._device.grid.execute("docker-compose restart")
-        time.sleep(10)  # temporary solution
         _log.info(f"{self._loghead} - restarted")
+        self.wait_until_ready()
+
+    def wait_until_ready(self) -> float:
+        """Poll the hub with exponential backoff until nodes provide all slots."""
+        started = time.monotonic()
+        deadline = started + self._ready_timeout
+        delay = 0.1
+        while not self.is_ready():
+            if time.monotonic() + delay > deadline:
+                raise TimeoutError(
+                    f"{self._loghead} - not ready in {self._ready_timeout}s"
+                )
+            time.sleep(delay)
+            delay = min(delay * 2, 5)
+        self._ready_time = time.monotonic() - started
+        _log.info(f"{self._loghead} - ready in {self._ready_time:.2f}s")
+        return self._ready_time
+
+    def is_ready(self) -> bool:
+        """Check that hub responds and registered nodes provide all slots."""
+        try:
+            with urllib.request.urlopen(self._hub_api, timeout=5) as response:
+                hub = json.loads(response.read())
+        except (OSError, ValueError):
+            return False
+        return hub.get("slotCounts", {}).get("total", 0) >= self._slots
 
     @retry_on_unicon_error
     def is_alive(self):
         self._device.grid.execute("echo -ne '\n'")
         pid = self._device.grid.execute("pidof java")
-        status = "ON" if pid else "OFF"
+        alive = bool(pid) and self.is_ready()
+        status = "ON" if alive else "OFF"
         _log.info(f"{self._loghead} - check status: {status}")
-        return bool(pid)
+        return alive
 
     @retry_on_unicon_error
     def stop(self):
@@ -56,3 +158,39 @@ class SeleniumGrid:
 
     def _disconnect(self):
         self._device.grid.disconnect()
+
+
+class BulkServer:
+    """Connection manager for bulk transfer server deployed on the user device.
+
+    Server is reachable from other devices of the network on the given port,
+    see `allow-bulk` firewall rule of setup.config.yaml.
+    """
+
+    _script = "./bulk_server.py"
+
+    def __init__(self, device: Device, port: int = 8080, logfile: str = None):
+        self._device = device
+        self._port = port
+        self._loghead = f"BulkServer@{device.name}"
+        self._logfile = logfile
+
+    @property
+    def url(self) -> str:
+        """Base url of the server reachable by the proxy."""
+        net_ifs = self._device.interfaces.names.pop()
+        ip = self._device.interfaces[net_ifs].ipv4.ip.compressed
+        return f"http://{ip}:{self._port}"
+
+    @retry_on_unicon_error
+    def start(self):
+        self._device.connect(alias="bulk", logfile=self._logfile)
+        command = f"nohup {self._script} {self._port} > /dev/null 2>&1 &"
+        self._device.bulk.execute(command)
+        _log.info(f"{self._loghead} - started via CLI: {command}")
+
+    @retry_on_unicon_error
+    def stop(self):
+        self._device.bulk.execute(f"pkill -f '{self._script} {self._port}'")
+        self._device.bulk.disconnect()
+        _log.info(f"{self._loghead} - stopped")
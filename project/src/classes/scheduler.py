@@ -0,0 +1,182 @@
+import zlib
+import time
+import logging
+from collections import namedtuple
+
+from pyats.easypy import Task
+from pyats.results import Errored, Passed
+from pyats.datastructures.logic import Or
+
+
+_log = logging.getLogger(__name__)
+_log.setLevel(logging.INFO)
+
+
+JobTask = namedtuple(
+    "JobTask",
+    ["name", "testscript", "datafile", "resources", "uids", "parameters", "group"],
+    defaults=[None, None, None],
+)
+
+
+def shard_of(key: str, shards: int) -> int:
+    """Deterministic shard index of the key, stable across runs and hosts."""
+    return zlib.crc32(key.encode()) % shards
+
+
+def shard_items(items: list, shard: tuple = None) -> list:
+    """Items belonging to the (index, count) shard, all items if shard is None."""
+    if shard is None:
+        return list(items)
+    index, count = shard
+    return [item for item in items if shard_of(str(item), count) == index]
+
+
+class ParallelRunner:
+    """ParallelRunner.
+
+    Runs testscripts of an easypy job as concurrent pyATS tasks. Every task
+    declares resources it needs exclusively, `{user}` in a resource name
+    stands for the user device assigned to the task, e.g. `("{user}",
+    "capture@proxy-vm")` takes a whole user VM and the traffic capture on
+    the proxy. Tasks start in the given order as soon as their resources
+    are free, later tasks may overtake blocked ones.
+    """
+
+    def __init__(
+        self,
+        runtime,
+        user_devices: list,
+        max_parallel: int = None,
+        poll_interval: float = 1,
+    ):
+        """Constructor.
+
+        Args:
+            runtime: easypy runtime
+            user_devices (list): names of user devices tasks can be assigned to
+            max_parallel (int): max number of simultaneous tasks, unlimited if None
+            poll_interval (float): time between task status checks, seconds
+        """
+        if not user_devices:
+            raise ValueError("At least one user device is required")
+        self._runtime = runtime
+        self._user_devices = list(user_devices)
+        self._max_parallel = max_parallel
+        self._poll_interval = poll_interval
+        self._held = set()
+
+    def _claim(self, task: JobTask) -> tuple:
+        """Assign the first user device which makes all task resources free."""
+        for device in self._user_devices:
+            resources = {res.format(user=device) for res in task.resources}
+            if not resources & self._held:
+                self._held |= resources
+                return device, resources
+        return None, None
+
+    def shard(
+        self,
+        task: JobTask,
+        testcases: tuple = (),
+        looped: tuple = (),
+        shards: int = None,
+        items: list = None,
+    ) -> list:
+        """Split the task into shards, one per user device by default.
+
+        Every testcase runs in exactly one shard chosen by its uid, looped
+        testcases run in all shards with `shard` parameter, so loop iterations
+        are split by the testscript with `shard_items`. Shards with nothing
+        to run are not created, results of shards are merged by `run` under
+        the name of the task.
+
+        Args:
+            task (JobTask): task to split
+            testcases (tuple): uids of testcases to distribute across shards
+            looped (tuple): uids of testcases with iterations to split
+            shards (int): number of shards, number of user devices if None
+            items (list): iterations of the looped testcases, looped testcases
+                are left out of shards which get none of them, all shards
+                run them if None
+        """
+        shards = shards or len(self._user_devices)
+        sharded = []
+        for index in range(shards):
+            uids = [uid for uid in testcases if shard_of(uid, shards) == index]
+            if items is None or shard_items(items, (index, shards)):
+                uids += looped
+            if not uids:
+                continue
+            parameters = dict(task.parameters or {}, shard=(index, shards))
+            sharded.append(
+                task._replace(
+                    name=f"{task.name}_shard{index}",
+                    uids=Or("common_setup", *uids, "common_cleanup"),
+                    parameters=parameters,
+                    group=task.name,
+                )
+            )
+        return sharded
+
+    def run(self, tasks: list, **parameters) -> dict:
+        """Run all tasks and return their results by task name.
+
+        Results of shards are merged under the name of the task they were
+        split from, a task which ended without result counts as errored.
+
+        Args:
+            tasks (list): JobTask entries
+            parameters: testscript parameters passed to every task
+        """
+        pending = list(tasks)
+        running = {}
+        results = {}
+        while pending or running:
+            for task in list(pending):
+                if self._max_parallel and len(running) >= self._max_parallel:
+                    break
+                device, resources = self._claim(task)
+                if device is None:
+                    continue
+                kwargs = dict(parameters, **(task.parameters or {}))
+                if task.uids is not None:
+                    kwargs["uids"] = task.uids
+                pyats_task = Task(
+                    testscript=task.testscript,
+                    datafile=task.datafile,
+                    runtime=self._runtime,
+                    taskid=task.name,
+                    user_name=device,
+                    **kwargs,
+                )
+                pyats_task.start()
+                running[pyats_task] = (task, resources, time.monotonic())
+                pending.remove(task)
+                _log.info(f"Task `{task.name}` started on {device}: {resources}")
+
+            finished = [x for x in running if not x.is_alive()]
+            for pyats_task in finished:
+                pyats_task.wait()
+                task, resources, started = running.pop(pyats_task)
+                self._held -= resources
+                results[task.name] = pyats_task.result
+                _log.info(
+                    f"Task `{task.name}` finished in "
+                    f"{time.monotonic() - started:.1f}s: {pyats_task.result}"
+                )
+            if not finished:
+                time.sleep(self._poll_interval)
+
+        merged = {}
+        for task in tasks:
+            result = results.get(task.name)
+            name = task.group or task.name
+            merged[name] = merged.get(name, Passed) + (
+                Errored if result is None else result
+            )
+        _log.info(
+            f"All tasks finished: {sum(merged.values(), Passed)}, by task: "
+            + ", ".join(f"{name} {result}" for name, result in merged.items())
+        )
+        return merged
@@ -0,0 +1,73 @@
+import logging
+
+from pyats.topology import Testbed
+
+from src.classes.remote_tools import SeleniumGrid
+from src.classes.sut import proxy_controller
+
+
+_log = logging.getLogger(__name__)
+_log.setLevel(logging.INFO)
+
+
+class JobSession:
+    """JobSession.
+
+    Context manager which brings up resources shared by all testscripts of
+    an easypy job: selenium grids and proxy server are started and checked
+    for readiness once, before the first `run()`, and torn down after the
+    last one. Testscripts get `shared_session` parameter and only attach to
+    the running grid instead of starting and stopping it.
+    """
+
+    def __init__(
+        self,
+        testbed: Testbed,
+        grid_devices: tuple = ("user-2",),
+        proxy_device: str = "proxy-vm",
+        unicon_log: str = None,
+    ):
+        """Constructor.
+
+        Args:
+            testbed (Testbed): job testbed
+            grid_devices (tuple): names of devices hosting selenium grid
+            proxy_device (str): name of the proxy device
+            unicon_log (str): file for unicon module logs
+        """
+        self._grids = [
+            SeleniumGrid(testbed.devices[name], logfile=unicon_log)
+            for name in grid_devices
+        ]
+        self._proxy = proxy_controller(
+            testbed.devices[proxy_device], logfile=unicon_log, alias="session"
+        )
+        self._loghead = f"JobSession@{testbed.name}"
+
+    @property
+    def parameters(self) -> dict:
+        """Testscript parameters to pass to `run()`."""
+        return {"shared_session": True}
+
+    def start(self) -> None:
+        for grid in self._grids:
+            grid.start()
+        self._proxy.start()
+        ready_times = {
+            "proxy": self._proxy.ready_time,
+            "grids": [grid.ready_time for grid in self._grids],
+        }
+        _log.info(f"{self._loghead} - shared resources ready: {ready_times}")
+
+    def stop(self) -> None:
+        for grid in self._grids:
+            grid.stop()
+        self._proxy.stop()
+        _log.info(f"{self._loghead} - shared resources released")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
@@ -1,38 +1,365 @@
+import re
+import json
+import time
+import uuid
+import socket
 import logging
+import threading
 
 from pyats.topology import Device
 
 from src.classes.troubleshooting import retry_on_unicon_error
+from src.classes.agent import RemoteAgent
+from src.classes.local_servers import SocksStandIn
 
 
 _log = logging.getLogger(__name__)
 _log.setLevel(logging.INFO)
 
 
+def socks_greeting_accepted(host: str, port: int, timeout: float = 1) -> bool:
+    """Check that SOCKS5 server accepts no-authentication greeting."""
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            sock.sendall(b"\x05\x01\x00")
+            return sock.recv(2) == b"\x05\x00"
+    except OSError:
+        return False
+
+
 class Proxy:
     """Connection manager for proxy server."""
 
-    def __init__(self, device: Device, logfile: str = None):
+    def __init__(
+        self,
+        device: Device,
+        logfile: str = None,
+        alias: str = "proxy",
+        port: int = 1080,
+        ready_timeout: int = 10,
+    ):
+        """Constructor.
+
+        Args:
+            device (Device): proxy hosting server
+            logfile (str): file for unicon module logs
+            alias (str): unicon connection alias
+            port (int): proxy port
+            ready_timeout (int): max time to wait for the proxy readiness, seconds
+        """
         self._device = device
         self._loghead = f"ProxyServer(SUT)@{device.name}"
         self._logfile = logfile
+        self._alias = alias
+        self._port = port
+        self._ready_timeout = ready_timeout
+        self._ready_time = None
+
+        connection = device.connections.cli.command
+        self._host = re.compile(r"ssh -i (/.*)+\s(\w+)@(.*)").search(connection)[3]
+
+    @property
+    def ready_time(self) -> float:
+        """Time from the last start till the proxy accepted SOCKS5 greeting."""
+        return self._ready_time
+
+    @property
+    def _connection(self):
+        return getattr(self._device, self._alias)
 
     def start(self):
-        self._device.connect(alias="proxy", logfile=self._logfile)
+        self._device.connect(alias=self._alias, logfile=self._logfile)
         if not self.is_alive():
-            command = "./proxytcp/bin/proxytcp --mode default --port 1080 &"
-            self._device.proxy.execute(command)
+            command = f"./proxytcp/bin/proxytcp --mode default --port {self._port} &"
+            self._connection.execute(command)
             _log.info(f"{self._loghead} - started via CLI: {command}")
+        self.wait_until_ready()
+
+    def wait_until_ready(self) -> float:
+        """Probe proxy port with exponential backoff until greeting is accepted."""
+        started = time.monotonic()
+        deadline = started + self._ready_timeout
+        delay = 0.05
+        while not self.is_ready():
+            if time.monotonic() + delay > deadline:
+                raise TimeoutError(
+                    f"{self._loghead} - not ready in {self._ready_timeout}s"
+                )
+            time.sleep(delay)
+            delay = min(delay * 2, 1)
+        self._ready_time = time.monotonic() - started
+        _log.info(f"{self._loghead} - ready in {self._ready_time:.3f}s")
+        return self._ready_time
+
+    def is_ready(self) -> bool:
+        return socks_greeting_accepted(self._host, self._port)
 
     @retry_on_unicon_error
     def is_alive(self):
-        self._device.proxy.execute("echo -ne '\n'")
-        pid = self._device.proxy.execute("pidof proxytcp")
+        self._connection.execute("echo -ne '\n'")
+        pid = self._connection.execute("pidof proxytcp")
         status = "ON" if pid else "OFF"
         _log.info(f"{self._loghead} - check status: {status}")
         return bool(pid)
 
     @retry_on_unicon_error
     def stop(self):
-        self._device.proxy.disconnect()
+        self._connection.disconnect()
         _log.info(f"{self._loghead} - disconnected")
+
+
+class ProxySupervisor:
+    """Background watchdog which restarts crashed proxy server.
+
+    Uses its own connection manager, so it does not share the unicon
+    session with the test. Proxy is restarted only when it neither
+    accepts SOCKS5 greeting nor has a running process.
+    """
+
+    def __init__(self, device: Device, interval: float = 1, logfile: str = None):
+        """Constructor.
+
+        Args:
+            device (Device): proxy hosting server
+            interval (float): time between readiness probes, seconds
+            logfile (str): file for unicon module logs
+        """
+        self._controller = proxy_controller(device, logfile=logfile, alias="supervisor")
+        self._interval = interval
+        self._loghead = f"ProxySupervisor@{device.name}"
+        self._stopped = threading.Event()
+        self._thread = None
+        self._restarts = 0
+        self._ready_times = []
+
+    def start(self) -> None:
+        self._controller.start()
+        self._ready_times.append(self._controller.ready_time)
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+        _log.info(f"{self._loghead} - watching proxy every {self._interval}s")
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+        self._controller.stop()
+        _log.info(f"{self._loghead} - stopped, restarts: {self._restarts}")
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self._interval):
+            if self._controller.is_ready() or self._controller.is_alive():
+                continue
+            self._restarts += 1
+            _log.warning(f"{self._loghead} - proxy is down, restart #{self._restarts}")
+            try:
+                self._controller.start()
+                self._ready_times.append(self._controller.ready_time)
+            except TimeoutError as exception:
+                _log.error(f"{self._loghead} - {exception}")
+
+    def get_stats(self) -> dict:
+        """Number of restarts and time-to-ready of every (re)start, seconds."""
+        return {"restarts": self._restarts, "ready_times": list(self._ready_times)}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
+
+
+class ProxyMonitor:
+    """Background sampler of proxytcp resource usage on the proxy device.
+
+    Sampler script deployed by the proxy playbook appends samples to a file
+    on the device, new samples are streamed back in batches on each collect.
+    Every monitor has own sampler process and file, so monitors of tests
+    running concurrently don't interfere.
+    """
+
+    _script = "./proxy_sampler.sh"
+    _fields = ("timestamp", "pid", "utime", "stime", "rss", "threads", "fds", "sockets")
+
+    def __init__(
+        self,
+        device: Device,
+        interval: int = 1,
+        samples_file: str = None,
+        logfile: str = None,
+    ):
+        """Constructor.
+
+        Args:
+            device (Device): proxy device
+            interval (int): sampling interval, seconds
+            samples_file (str): samples file on the device, unique if None
+            logfile (str): file for unicon module logs
+        """
+        self._device = device
+        self._interval = interval
+        self._samples_file = samples_file or f"proxy_resources_{uuid.uuid4().hex}.log"
+        self._pid = None
+        self._logfile = logfile
+        self._loghead = f"ProxyMonitor@{device.name}"
+        self._hz = None
+        self._lines = 0
+        self._samples = []
+        self._started_at = None
+
+    @property
+    def samples(self) -> list:
+        return self._samples
+
+    @property
+    def started_at(self) -> float:
+        return self._started_at
+
+    def start(self) -> None:
+        self._device.connect(alias="monitor", logfile=self._logfile)
+        command = (
+            f"nohup {self._script} {self._samples_file} {self._interval}"
+            " > /dev/null 2>&1 & echo $!"
+        )
+        output = self._device.monitor.execute(command)
+        self._pid = int(re.findall(r"^(\d+)\s*$", output, re.MULTILINE)[-1])
+        self._started_at = time.time()
+        _log.info(f"{self._loghead} - started via CLI: {command}")
+
+    @retry_on_unicon_error
+    def collect(self) -> list:
+        """Fetch samples written since the previous call."""
+        self._device.monitor.execute("echo -ne '\n'")
+        output = self._device.monitor.execute(
+            f"tail -n +{self._lines + 1} {self._samples_file}"
+        )
+
+        batch = []
+        for line in output.splitlines():
+            fields = line.split()
+            if fields[:2] == ["#", "hz"] and len(fields) == 3:
+                self._hz = int(fields[2])
+            elif len(fields) == len(self._fields):
+                batch.append(
+                    dict(
+                        zip(
+                            self._fields,
+                            [float(fields[0])] + [int(x) for x in fields[1:]],
+                        )
+                    )
+                )
+            else:
+                # line is being written right now, fetch it next time
+                break
+            self._lines += 1
+        self._samples += batch
+        _log.info(f"{self._loghead} - collected {len(batch)} samples")
+        return batch
+
+    def stop(self) -> None:
+        self.collect()
+        # only own sampler, other monitors may sample the same proxy
+        self._device.monitor.execute(f"kill {self._pid}; rm -f {self._samples_file}")
+        self._device.monitor.disconnect()
+        _log.info(f"{self._loghead} - stopped, {len(self._samples)} samples total")
+
+    def get_stats(self, write_to_file: str = None) -> dict:
+        """Get results for post analyzis."""
+        data = {
+            "hz": self._hz,
+            "started_at": self._started_at,
+            "samples": self._samples,
+        }
+        if isinstance(write_to_file, str):
+            with open(write_to_file, "w") as f:
+                f.write(json.dumps(data))
+        return data
+
+
+class LocalProxy(Proxy):
+    """Connection manager for the in-process SOCKS5 stand-in.
+
+    Replaces proxytcp when the proxy device of the testbed has the
+    `socks-standin` type, the stand-in runs on the testing host.
+    """
+
+    device_type = "socks-standin"
+    _standins = {}
+
+    def __init__(self, device: Device, logfile: str = None, **kwargs):
+        super().__init__(device, logfile, **kwargs)
+        self._loghead = f"ProxyServer(stand-in)@{device.name}"
+        self._host = "127.0.0.1"
+
+    def start(self):
+        if not self.is_alive():
+            standin = SocksStandIn(host="0.0.0.0", port=self._port)
+            standin.start()
+            self._standins[self._port] = standin
+            _log.info(f"{self._loghead} - started in-process on port {self._port}")
+        self.wait_until_ready()
+
+    def is_alive(self):
+        alive = self._port in self._standins
+        status = "ON" if alive else "OFF"
+        _log.info(f"{self._loghead} - check status: {status}")
+        return alive
+
+    def stop(self):
+        _log.info(f"{self._loghead} - disconnected")
+
+
+class AgentProxy(Proxy):
+    """Connection manager for proxy server controlled via the remote agent.
+
+    Used when the proxy device has `agent: true` in its testbed `custom`
+    section, process is started and checked with agent RPC calls instead
+    of the unicon CLI session. Process spawned by the manager is stopped
+    with it, proxy started by someone else is left running.
+    """
+
+    def __init__(self, device: Device, logfile: str = None, **kwargs):
+        super().__init__(device, logfile, **kwargs)
+        self._loghead = f"ProxyServer(SUT, agent)@{device.name}"
+        self._agent = RemoteAgent(device)
+        self._spawned = False
+
+    def start(self):
+        # supervisor restarts proxy with the same manager, keep one connection
+        if not self._agent.connected:
+            self._agent.connect()
+        if not self.is_alive():
+            command = f"./proxytcp/bin/proxytcp --mode default --port {self._port}"
+            self._agent.spawn("proxytcp", command)
+            self._spawned = True
+            _log.info(f"{self._loghead} - started via agent: {command}")
+        self.wait_until_ready()
+
+    def is_alive(self):
+        alive = self._agent.status(process="proxytcp")["running"]
+        status = "ON" if alive else "OFF"
+        _log.info(f"{self._loghead} - check status: {status}")
+        return alive
+
+    def stop(self):
+        if self._spawned:
+            self._agent.stop("proxytcp")
+            self._spawned = False
+        self._agent.disconnect()
+        _log.info(f"{self._loghead} - disconnected")
+
+
+def proxy_controller(device: Device, logfile: str = None, **kwargs) -> Proxy:
+    """Create connection manager corresponding to the proxy device type.
+
+    Args:
+        device (Device): proxy hosting server
+        logfile (str): file for unicon module logs
+        kwargs: Proxy constructor arguments (alias, port, ready_timeout)
+    """
+    if device.type == LocalProxy.device_type:
+        return LocalProxy(device, logfile=logfile, **kwargs)
+    if device.custom.get("agent"):
+        return AgentProxy(device, logfile=logfile, **kwargs)
+    return Proxy(device, logfile=logfile, **kwargs)
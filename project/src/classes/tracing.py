@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import functools
+import threading
+from contextlib import contextmanager
+
+
+class Tracer:
+    """Tracer.
+
+    Collects timed spans of the process and saves them as Chrome trace-event
+    JSON, which can be opened in chrome://tracing or ui.perfetto.dev as a
+    flame chart. Spans of each thread are nested by time, so nested `span`
+    calls are shown as children, threads of worker pools get own rows.
+    """
+
+    def __init__(self):
+        self._events = []
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _tid(self, thread: str = None) -> int:
+        """Row id for the thread, named rows are used for external timings."""
+        name = thread or threading.current_thread().name
+        with self._lock:
+            if name not in self._threads:
+                self._threads[name] = len(self._threads) + 1
+            return self._threads[name]
+
+    def add(
+        self,
+        name: str,
+        start: float,
+        duration: float,
+        category: str = "env",
+        thread: str = None,
+        **args,
+    ) -> None:
+        """Add span measured elsewhere, e.g. ansible task from runner events.
+
+        Args:
+            name (str): span name
+            start (float): start time, seconds since the epoch
+            duration (float): duration, seconds
+            category (str): span category, used for filtering in the viewer
+            thread (str): row name, current thread if None
+            args: details shown for the selected span
+        """
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": int(start * 1e6),
+            "dur": int(duration * 1e6),
+            "pid": self._pid,
+            "tid": self._tid(thread),
+            "args": args,
+        }
+        with self._lock:
+            self._events.append(event)
+
+    @contextmanager
+    def span(self, name: str, category: str = "env", **args):
+        """Time the block, yields args dict to add details known at the end.
+
+        Args:
+            name (str): span name
+            category (str): span category, used for filtering in the viewer
+            args: details shown for the selected span
+        """
+        start = time.time()
+        started = time.perf_counter()
+        try:
+            yield args
+        except Exception as exp:
+            args["error"] = repr(exp)
+            raise
+        finally:
+            self.add(name, start, time.perf_counter() - started, category, **args)
+
+    def traced(self, name: str = None, category: str = "env"):
+        """Decorator, every call of the function is a span."""
+
+        def inner(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name or func.__qualname__, category):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return inner
+
+    @property
+    def events(self) -> list:
+        """Trace events with thread names metadata."""
+        with self._lock:
+            metadata = [
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": self._pid,
+                    "tid": tid,
+                    "args": {"name": name},
+                }
+                for name, tid in self._threads.items()
+            ]
+            return metadata + list(self._events)
+
+    def save(self, path: str) -> None:
+        """Write trace-event JSON file."""
+        with open(path, "w") as file:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, file)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._events.clear()
+            self._threads.clear()
+
+
+# process-wide tracer, spans of all modules go to the same timeline
+tracer = Tracer()
+span = tracer.span
+traced = tracer.traced
+
+
+# if __name__ == "__main__":
+#     with span("setup"):
+#         with span("create network", category="api"):
+#             time.sleep(0.1)
+#     tracer.save("environment_trace.json")
@@ -73,6 +73,49 @@ class TsharkPcap(pyshark.FileCapture):
                 continue
         return tcp_packets
 
+    def tcp_timeline(self) -> dict:
+        """Group TCP packets by stream with timestamps, handshake flags and payload.
+
+        Payload segments are keyed by relative sequence number, so retransmissions
+        keep the time of the first transmission.
+        """
+        streams = {}
+        for packet in self:
+            try:
+                tcp = packet.tcp
+                src = (packet.ip.src, int(tcp.srcport))
+                dst = (packet.ip.dst, int(tcp.dstport))
+            except AttributeError:
+                continue
+            timestamp = float(packet.sniff_timestamp)
+            stream = streams.setdefault(
+                int(tcp.stream),
+                {
+                    "client": src,
+                    "server": dst,
+                    "syn": None,
+                    "syn_ack": None,
+                    "forward": {},
+                    "backward": {},
+                },
+            )
+
+            syn = tcp.flags_syn in ("1", "True")
+            ack = tcp.flags_ack in ("1", "True")
+            if syn and not ack:
+                stream["client"], stream["server"] = src, dst
+                stream["syn"] = timestamp
+            elif syn and ack:
+                stream["syn_ack"] = timestamp
+
+            payload = tcp._all_fields.get("tcp.payload")
+            if payload:
+                direction = "forward" if src == stream["client"] else "backward"
+                stream[direction].setdefault(
+                    int(tcp.seq), (timestamp, bytes.fromhex(payload.replace(":", "")))
+                )
+        return streams
+
     def find_packets_in_stream(self, packet_type: str):
         """Creates list with lists of packets grouped by tcp stream."""
 
@@ -8,6 +8,7 @@ from scp import SCPClient
 from pyats.topology import Device
 
 import src
+from src.classes.sut import LocalProxy
 
 
 _log = logging.getLogger(__name__)
@@ -114,12 +115,18 @@ class TrafficDump:
 
     If no proxy is specified only one connection is established - to traffic source (user_endpoint)
     If proxy is specified two connections are established - to tarffic source and to the proxy host
+    If proxy is the local stand-in, both proxy legs are captured on the traffic source
     """
 
     def __init__(
         self, grid_server: Device, proxy_server: Device = None, logfile: str = None
     ):
 
+        # local stand-in runs on the testing host, there is nothing to capture
+        # on the proxy device
+        if proxy_server is not None and proxy_server.type == LocalProxy.device_type:
+            proxy_server = None
+
         self._grid_server = grid_server
         self._proxy_server = proxy_server
         self._logfile = logfile
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Bulk transfer server for throughput tests.
+
+GET /bytes/<size> - response body of the given size in bytes
+PUT|POST <any path> - request body is read and discarded
+
+Usage: bulk_server.py [port]
+"""
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+CHUNK = b"\0" * 65536
+
+
+class BulkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        route = self.path.strip("/").split("/")
+        if len(route) != 2 or route[0] != "bytes" or not route[1].isdigit():
+            self._reply(404, 0)
+            return
+        size = int(route[1])
+        self._reply(200, size)
+        for offset in range(0, size, len(CHUNK)):
+            self.wfile.write(CHUNK[: size - offset])
+
+    def do_PUT(self):
+        remaining = int(self.headers.get("Content-Length", 0))
+        while remaining > 0:
+            data = self.rfile.read(min(remaining, len(CHUNK)))
+            if not data:
+                break
+            remaining -= len(data)
+        self._reply(200, 0)
+
+    do_POST = do_PUT
+
+    def _reply(self, code, size):
+        self.send_response(code)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    ThreadingHTTPServer(("0.0.0.0", port), BulkHandler).serve_forever()
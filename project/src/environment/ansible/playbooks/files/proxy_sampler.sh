@@ -0,0 +1,24 @@
+#!/bin/sh
+# Periodically sample proxytcp resource usage from /proc.
+# Usage: proxy_sampler.sh [OUTPUT_FILE] [INTERVAL]
+# Header line: "# hz CLK_TCK"
+# Sample line: "epoch pid utime stime rss_kb threads fds sockets"
+out=${1:-proxy_resources.log}
+interval=${2:-1}
+
+echo "# hz $(getconf CLK_TCK)" > "$out"
+while true; do
+    pid=$(pidof -s proxytcp)
+    if [ -n "$pid" ]; then
+        ts=$(date +%s.%N)
+        ticks=$(cut -d ' ' -f 14,15 "/proc/$pid/stat" 2>/dev/null)
+        rss=$(awk '/^VmRSS/ {print $2}' "/proc/$pid/status" 2>/dev/null)
+        threads=$(awk '/^Threads/ {print $2}' "/proc/$pid/status" 2>/dev/null)
+        fds=$(ls "/proc/$pid/fd" 2>/dev/null | wc -l)
+        sockets=$(ls -l "/proc/$pid/fd" 2>/dev/null | grep -c 'socket:')
+        if [ -n "$ticks" ] && [ -n "$rss" ]; then
+            echo "$ts $pid $ticks $rss $threads $fds $sockets" >> "$out"
+        fi
+    fi
+    sleep "$interval"
+done
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Remote agent for test VMs.
+
+Serves newline delimited json RPC on the loopback interface, the testing
+host reaches it through the SSH-forwarded channel.
+
+Request:  {"id": 1, "method": "execute", "params": {"command": "uname -a"}}
+Response: {"id": 1, "result": {...}} or {"id": 1, "error": "..."}
+
+Usage: remote_agent.py [port]
+"""
+import os
+import sys
+import json
+import time
+import base64
+import signal
+import threading
+import subprocess
+import socketserver
+
+
+class Agent:
+    """RPC methods."""
+
+    def __init__(self):
+        self._processes = {}
+        self._lock = threading.Lock()
+
+    def ping(self):
+        return {"pid": os.getpid(), "time": time.time()}
+
+    def execute(self, command, timeout=60, cwd=None):
+        started = time.monotonic()
+        try:
+            completed = subprocess.run(
+                command,
+                shell=True,
+                cwd=cwd or os.path.expanduser("~"),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                timeout=timeout,
+            )
+        except subprocess.TimeoutExpired as exception:
+            return {
+                "returncode": None,
+                "stdout": (exception.stdout or b"").decode(errors="replace"),
+                "stderr": "timeout",
+                "duration": time.monotonic() - started,
+            }
+        return {
+            "returncode": completed.returncode,
+            "stdout": completed.stdout.decode(errors="replace"),
+            "stderr": completed.stderr.decode(errors="replace"),
+            "duration": time.monotonic() - started,
+        }
+
+    def spawn(self, name, command, cwd=None, log=None):
+        with self._lock:
+            process = self._processes.get(name)
+            if process is not None and process.poll() is None:
+                return {"pid": process.pid, "started": False}
+            output = open(log, "ab") if log else subprocess.DEVNULL
+            process = subprocess.Popen(
+                command,
+                shell=True,
+                cwd=cwd or os.path.expanduser("~"),
+                stdout=output,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+            self._processes[name] = process
+        return {"pid": process.pid, "started": True}
+
+    def status(self, name=None, process=None):
+        """Status of a spawned process by name or any process by executable name."""
+        if name is not None:
+            spawned = self._processes.get(name)
+            if spawned is None:
+                return {"running": False, "pids": [], "returncode": None}
+            returncode = spawned.poll()
+            return {
+                "running": returncode is None,
+                "pids": [spawned.pid] if returncode is None else [],
+                "returncode": returncode,
+            }
+        pids = []
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/comm") as f:
+                    if f.read().strip() == process:
+                        pids.append(int(entry))
+            except OSError:
+                continue
+        return {"running": bool(pids), "pids": pids, "returncode": None}
+
+    def stop(self, name, timeout=5):
+        spawned = self._processes.pop(name, None)
+        if spawned is None:
+            return {"returncode": None}
+        if spawned.poll() is None:
+            os.killpg(spawned.pid, signal.SIGTERM)
+            try:
+                spawned.wait(timeout)
+            except subprocess.TimeoutExpired:
+                os.killpg(spawned.pid, signal.SIGKILL)
+                spawned.wait()
+        return {"returncode": spawned.returncode}
+
+    def read_file(self, path, offset=0, size=1048576):
+        path = os.path.join(os.path.expanduser("~"), path)
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read(size)
+        return {
+            "data": base64.b64encode(data).decode(),
+            "offset": offset + len(data),
+            "eof": len(data) < size,
+        }
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            response = {}
+            try:
+                request = json.loads(line)
+                response["id"] = request.get("id")
+                if request["method"].startswith("_"):
+                    raise AttributeError(f"private method {request['method']}")
+                method = getattr(self.server.agent, request["method"])
+                response["result"] = method(**request.get("params", {}))
+            except Exception as exception:  # pylint: disable=broad-except
+                response["error"] = f"{type(exception).__name__}: {exception}"
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class AgentServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port):
+        super().__init__(("127.0.0.1", port), RequestHandler)
+        self.agent = Agent()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 7777
+    AgentServer(port).serve_forever()
@@ -0,0 +1,56 @@
+import threading
+
+from google.auth.credentials import AnonymousCredentials
+from google.auth.transport import requests
+from google.oauth2 import service_account
+from requests.adapters import HTTPAdapter
+
+
+# max number of kept alive connections per host, covers Builder worker pool
+POOL_SIZE = 16
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def get_session(credentials: dict) -> requests.AuthorizedSession:
+    """Process-wide AuthorizedSession for the project credentials.
+
+    Sessions are cached by service account key file and access scopes, so
+    all controllers share loaded credentials, access token and the pool of
+    kept alive connections. Requests are sent unauthenticated if no key
+    file is set, e.g. to the local fake API.
+
+    Args:
+        credentials (dict): `credentials` section of setup.config.yaml
+    """
+    service_key = credentials.get("service-acc-key")
+    scopes = tuple(credentials.get("access-scopes", ()))
+    key = (service_key, scopes)
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            if service_key is None:
+                loaded = AnonymousCredentials()
+            else:
+                loaded = service_account.Credentials.from_service_account_file(
+                    service_key, scopes=list(scopes)
+                )
+            session = requests.AuthorizedSession(credentials=loaded)
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[key] = session
+    return session
+
+
+def close_sessions() -> None:
+    """Close all cached sessions and their connections.
+
+    Called at the end of builder scenarios, sessions are created again by
+    the next `get_session` call.
+    """
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -1,8 +1,12 @@
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import yaml
+import ansible_runner
 
-from src.environment.google_cloud_setup import components, controllers, sshmanager
+from src.classes.tracing import span, traced
+from src.environment.google_cloud_setup import auth, components, controllers, sshmanager
 
 _log = logging.getLogger(__name__)
 
@@ -12,7 +16,14 @@ class Builder:
 
     _keys = ("project", "instance-templates", "instances", "firewall-rules")
 
-    def __init__(self, build_file: str, service_acc_key: str = None):
+    def __init__(
+        self,
+        build_file: str,
+        service_acc_key: str = None,
+        max_workers: int = 8,
+        batch: bool = True,
+        playbooks: str = None,
+    ):
         """Load and parse setup.config.yaml file into python objects.
 
         Args:
@@ -20,23 +31,29 @@ class Builder:
             service_acc_key (str): path to service account secret key file,
                 if not specified, value of the path will be taken from the build
                 file.
+            max_workers (int): max number of resources created or deleted
+                concurrently.
+            batch (bool): group API calls for many resources into batch
+                requests, otherwise they are sent by the pool of workers.
+            playbooks (str): path to the ansible project directory, needed to
+                bake images for templates with `image-family`.
         """
 
-        self._build = None
         self._project = None
         self._templates = None
         self._user = None
         self._instances = None
         self._firewall = None
         self._response_data = dict()
+        self._provisioned = []
         self._key = None
+        self._options = components.BuildOptions(max_workers, batch, playbooks)
 
         def load_yaml(file: str) -> dict:
             with open(file) as conf_file:
                 return yaml.load(conf_file, Loader=yaml.FullLoader)
 
         build = load_yaml(build_file)
-        self._build = build
 
         self._user = build["instance-user"]["name"]
 
@@ -53,6 +70,7 @@ class Builder:
                 machine_type=entry["machine-type"],
                 disk_size=entry["disk-size"],
                 os=entry["os"],
+                image_family=entry.get("image-family"),
             )
             for entry in build["instance-templates"]
         ]
@@ -78,6 +96,7 @@ class Builder:
             for entry in build["firewall-rules"]
         ]
 
+    @traced()
     def _create_network(self):
         # instantiate NetworkController object to get access to API
         # create network
@@ -92,6 +111,7 @@ class Builder:
             _log.error(f"Error occured while creating network: {error}")
             raise error
 
+    @traced()
     def _delete_network(self):
         # instantiate NetworkController object to get access to API
         # delete network
@@ -105,76 +125,325 @@ class Builder:
             _log.error(f"Error occured while deleting network: {error}")
             raise error
 
-    def _create_instances(self):
-        # loop through the list of instances
-        # get instance template
-        # instantiate InstanceController object for each instance to get access to API
-        # create instance
+    def _run_concurrently(self, func, items: list) -> None:
+        """Apply func to every item using the bounded pool of workers.
+
+        On the first error pending calls are cancelled, already started ones
+        are awaited and the error is raised.
+        """
+        with ThreadPoolExecutor(self._options.max_workers) as executor:
+            futures = [executor.submit(func, item) for item in items]
+            for future in as_completed(futures):
+                error = future.exception()
+                if error is not None:
+                    for pending in futures:
+                        pending.cancel()
+                    raise error
+
+    def _find_template(self, name: str) -> components.InstTemplate:
+        for templ in self._templates:
+            if templ.name == name:
+                return templ
+        return None
+
+    def _instance_controller(self, inst: components.Instance):
+        return controllers.InstanceController(
+            project=self._project,
+            template=self._find_template(inst.from_),
+            instance=inst,
+        )
+
+    def _register_instance(self, instance: controllers.InstanceController) -> None:
         # check instance creation
         # retrieve following data: name, network_ip, nat_i_
-        for inst in self._instances:
-            inst_template_name = inst.from_
-            inst_template = None
-            for templ in self._templates:
-                if templ.name == inst_template_name:
-                    inst_template = templ
-                    break
-
-            instance = controllers.InstanceController(
-                project=self._project, template=inst_template, instance=inst
+        if instance.created_status is True:
+            _log.info(
+                f'Created instance `{instance.data["name"]}`, network IP:'
+                f'{instance.data["network_ip"]}, NAT IP: {instance.data["nat_ip"]}'
             )
+            key = instance.data["name"]
+            self._response_data.update({key: instance.data})
+        else:
+            error = instance.exceptions[0]
+            _log.error(f"Error occured while creating instance: {error}")
+            raise error
+
+    def _create_instance(
+        self, inst: components.Instance, instance: controllers.InstanceController
+    ) -> None:
+        with span("Builder._create_instance", instance=inst.name):
             instance.create()
-            if instance.created_status is True:
-                _log.info(
-                    f'Created instance `{instance.data["name"]}`, network IP:'
-                    f'{instance.data["network_ip"]}, NAT IP: {instance.data["nat_ip"]}'
-                )
-                key = instance.data["name"]
-                self._response_data.update({key: instance.data})
+            self._register_instance(instance)
+
+    @traced()
+    def _create_instances(self, instances: list = None):
+        # all instances are created at once, if any of them fails the ones
+        # inserted by this run are deleted to not leave partial setup behind,
+        # instances which existed before are kept
+        instances = self._instances if instances is None else instances
+        created = [self._instance_controller(x) for x in instances]
+        try:
+            if self._options.batch:
+                controllers.batch_create(created)
+                for instance in created:
+                    self._register_instance(instance)
             else:
-                error = instance.exceptions[0]
-                _log.error(f"Error occured while creating instance: {error}")
-                raise error
+                self._run_concurrently(
+                    lambda x: self._create_instance(*x), list(zip(instances, created))
+                )
+        except Exception:
+            _log.error("Deleting partially created setup ...")
+            self._cleanup_instances(
+                [x for x, y in zip(instances, created) if y.inserted]
+            )
+            raise
+        self._provisioned += [x.name for x in instances]
 
-    def _delete_instances(self):
-        # loop through the list of instances
-        # instantiate InstanceController object for each instance to get access to API
+    def _check_instance_deleted(
+        self, instance: controllers.InstanceController, name: str
+    ) -> None:
+        if instance.deleted_status is True:
+            _log.info(f"Deleted instance `{name}`")
+        else:
+            error = instance.exceptions[0]
+            _log.error(f"Error occured while deleting instance: {error}")
+            raise error
+
+    def _delete_instance(self, inst: components.Instance) -> None:
+        # instantiate InstanceController object to get access to API
         # delete instance
-        for inst in self._instances:
+        with span("Builder._delete_instance", instance=inst.name):
             instance = controllers.InstanceController(
                 project=self._project, instance=inst
             )
             instance.delete()
-            if instance.deleted_status is True:
-                _log.info(f"Deleted instance `{inst.name}`")
-            else:
-                error = instance.exceptions[0]
-                _log.error(f"Error occured while deleting instance: {error}")
-                raise error
-
-    def _apply_firewall_rules(self):
-        # loop through the list of rules
-        # instantiate FirewallController object for each rule to get access to API
-        # create rule
+            self._check_instance_deleted(instance, inst.name)
+
+    @traced()
+    def _delete_instances(self, instances: list = None, quietly: bool = False):
+        instances = self._instances if instances is None else instances
+
+        def delete_quietly(inst):
+            try:
+                self._delete_instance(inst)
+            except Exception as error:  # pylint: disable=broad-except
+                _log.error(f"Instance `{inst.name}` was not cleaned up: {error}")
+
+        if self._options.batch:
+            deleted = [
+                controllers.InstanceController(project=self._project, instance=x)
+                for x in instances
+            ]
+            controllers.batch_delete(deleted)
+            for instance, inst in zip(deleted, instances):
+                try:
+                    self._check_instance_deleted(instance, inst.name)
+                except Exception as error:  # pylint: disable=broad-except
+                    if not quietly:
+                        raise
+                    _log.error(f"Instance `{inst.name}` was not cleaned up: {error}")
+        else:
+            func = delete_quietly if quietly else self._delete_instance
+            self._run_concurrently(func, instances)
+
+    def _cleanup_instances(self, instances: list):
+        # best effort, every instance gets its delete attempt
+        self._delete_instances(instances, quietly=True)
+
+    def _register_firewall_rule(
+        self, firewall_rule: controllers.FirewallController
+    ) -> None:
         # check rule creation
         # retrieve following data: name, tags
-        for rule in self._firewall:
-            firewall_rule = controllers.FirewallController(
-                project=self._project, firewall_rule=rule
+        if firewall_rule.created_status is True:
+            _log.info(
+                f'Created firewall rule `{firewall_rule.data["name"]}`: ingress,'
+                f'protocol: {firewall_rule.data["allowed"]["IPProtocol"]},'
+                f'ports: {firewall_rule.data["allowed"]["ports"]}'
             )
+            key = firewall_rule.data["name"]
+            self._response_data.update({key: firewall_rule.data})
+        else:
+            error = firewall_rule.exceptions[0]
+            _log.error(f"Error occured while creating firewall rule: {error}")
+            raise error
+
+    def _firewall_controller(self, rule: components.FirewallRule):
+        return controllers.FirewallController(project=self._project, firewall_rule=rule)
+
+    def _apply_firewall_rule(
+        self,
+        rule: components.FirewallRule,
+        firewall_rule: controllers.FirewallController,
+    ) -> None:
+        with span("Builder._apply_firewall_rule", rule=rule.name):
             firewall_rule.create()
-            if firewall_rule.created_status is True:
-                _log.info(
-                    f'Created firewall rule `{firewall_rule.data["name"]}`: ingress,'
-                    f'protocol: {firewall_rule.data["allowed"]["IPProtocol"]},'
-                    f'ports: {firewall_rule.data["allowed"]["ports"]}'
+            self._register_firewall_rule(firewall_rule)
+
+    @traced()
+    def _apply_firewall_rules(self, rules: list = None):
+        # like instances, rules inserted by this run are deleted if any of
+        # them fails, rules which existed before are kept
+        rules = self._firewall if rules is None else rules
+        created = [self._firewall_controller(x) for x in rules]
+        try:
+            if self._options.batch:
+                controllers.batch_create(created)
+                # succeeded rules are registered before the first error is raised
+                for firewall_rule in sorted(
+                    created, key=lambda x: not x.created_status
+                ):
+                    self._register_firewall_rule(firewall_rule)
+            else:
+                self._run_concurrently(
+                    lambda x: self._apply_firewall_rule(*x), list(zip(rules, created))
                 )
-                key = firewall_rule.data["name"]
-                self._response_data.update({key: firewall_rule.data})
+        except Exception:
+            _log.error("Deleting partially applied firewall rules ...")
+            self._cleanup_firewall_rules(
+                [(x, y) for x, y in zip(rules, created) if y.inserted]
+            )
+            raise
+
+    def _cleanup_firewall_rules(self, rules: list):
+        # best effort, rules are (rule, controller) pairs
+        deleted = [y for _, y in rules]
+        if self._options.batch:
+            controllers.batch_delete(deleted)
+        else:
+            self._run_concurrently(lambda x: x.delete(), deleted)
+        for rule, firewall_rule in rules:
+            if firewall_rule.deleted_status is True:
+                self._response_data.pop(rule.name, None)
             else:
-                error = firewall_rule.exceptions[0]
-                _log.error(f"Error occured while creating firewall rule: {error}")
-                raise error
+                _log.error(
+                    f"Firewall rule `{rule.name}` was not cleaned up: "
+                    f"{firewall_rule.exceptions}"
+                )
+
+    def _check_firewall_rule_deleted(
+        self, firewall_rule: controllers.FirewallController
+    ) -> None:
+        if firewall_rule.deleted_status is True:
+            _log.info(f'Deleted firewall rule `{firewall_rule.data["name"]}`')
+        else:
+            error = firewall_rule.exceptions[0]
+            _log.error(f"Error occured while deleting firewall rule: {error}")
+            raise error
+
+    @traced()
+    def _delete_firewall_rules(self, rules: list):
+        # rules are controllers with loaded data
+        if self._options.batch:
+            controllers.batch_delete(rules)
+        else:
+            self._run_concurrently(lambda x: x.delete(), rules)
+        for firewall_rule in rules:
+            self._check_firewall_rule_deleted(firewall_rule)
+
+    @traced()
+    def _fetch(self, resources: list) -> None:
+        # load data of existing resources into their controllers
+        if self._options.batch:
+            controllers.batch_get(resources)
+        else:
+            self._run_concurrently(lambda x: x.refresh(), resources)
+        for resource in resources:
+            if resource.exceptions:
+                raise resource.exceptions[0]
+
+    @property
+    def baked(self) -> bool:
+        """True if instances boot from the baked images."""
+        return any(x.image is not None for x in self._templates)
+
+    @traced()
+    def _prepare_images(self):
+        # templates with image family boot from the image baked from current
+        # playbooks, image name contains their hash, so it is baked only once;
+        # the rest keep the hash in the instance config, so reconcile recreates
+        # instances which were set up by outdated playbooks
+        playbooks = self._options.playbooks
+        if playbooks is None:
+            if any(x.image_family for x in self._templates):
+                raise ValueError("Ansible project directory is needed to bake images")
+            return
+        digest = components.content_hash(
+            os.path.join(playbooks, "main.yml"), os.path.join(playbooks, "playbooks")
+        )
+        for index, templ in enumerate(self._templates):
+            if not templ.image_family:
+                self._templates[index] = templ._replace(playbooks_hash=digest)
+                continue
+            name = f"{templ.image_family}-{digest}"
+            image = controllers.ImageController(self._project, name=name)
+            if image.refresh():
+                _log.info(f"Using baked image `{name}` for template `{templ.name}`")
+            else:
+                self._bake_image(templ, name)
+            self._templates[index] = templ._replace(image=name)
+
+    @traced()
+    def _bake_image(self, templ: components.InstTemplate, name: str):
+        if self._key is None:
+            raise ValueError("SSH keys must be added before baking images")
+        _log.info(f"Baking image `{name}` for template `{templ.name}` ...")
+        inst = components.Instance(
+            name=f"bake-{name}"[:63],
+            zone=self._instances[0].zone,
+            external_ip="ephemeral",
+            tags=sorted({tag for x in self._instances for tag in x.tags}),
+            from_=templ.name,
+        )
+        instance = controllers.InstanceController(
+            project=self._project, template=templ, instance=inst
+        )
+        try:
+            with span("create bake instance", instance=inst.name):
+                instance.create()
+            if instance.created_status is not True:
+                raise instance.exceptions[0]
+
+            # bake host gets playbooks of all groups
+            hosts = {inst.name: {"ansible_host": instance.data["nat_ip"]}}
+            inventory = {
+                "all": {
+                    "vars": {
+                        "ansible_user": self._user,
+                        "ansible_ssh_private_key_file": self._key,
+                    }
+                },
+                "proxy": {"hosts": hosts},
+                "users": {"hosts": hosts},
+            }
+            with span("ansible main.yml", "ansible", host=inst.name):
+                result = ansible_runner.run(
+                    project_dir=self._options.playbooks,
+                    playbook="main.yml",
+                    inventory=inventory,
+                )
+            if result.rc != 0:
+                raise RuntimeError(
+                    f"Playbooks failed on `{inst.name}`: {result.status}"
+                )
+
+            instance.stop()
+            if instance.exceptions:
+                raise instance.exceptions[0]
+            image = controllers.ImageController(
+                self._project,
+                name=name,
+                family=templ.image_family,
+                source_disk=f"projects/{self._project.id}/zones/{inst.zone}"
+                f"/disks/{inst.name}",
+            )
+            with span("create image", image=name):
+                image.create()
+            if image.created_status is not True:
+                raise image.exceptions[0]
+            _log.info(f"Baked image `{name}`, family `{templ.image_family}`")
+        finally:
+            self._cleanup_instances([inst])
 
     def _set_exit_code(self):
         for inst in self._instances:
@@ -186,23 +455,106 @@ class Builder:
                 return 0
         return 1
 
+    @property
+    def provisioned(self) -> list:
+        """Names of instances created by the executed scenario."""
+        return list(self._provisioned)
+
+    @traced()
     def execute_setup_scenario(self):
         _log.info("Creating test setup ...")
 
-        self._create_network()
-        self._create_instances()
-        self._apply_firewall_rules()
+        try:
+            self._create_network()
+            self._apply_firewall_rules()
+            self._prepare_images()
+            self._create_instances()
+        finally:
+            auth.close_sessions()
 
         _log.info("Test setup successfully created")
 
+    @traced()
+    def _reconcile_firewall_rules(self):
+        rules = [self._firewall_controller(x) for x in self._firewall]
+        self._fetch(rules)
+
+        stale_rules, new_rules = [], []
+        for rule, firewall_rule in zip(self._firewall, rules):
+            if firewall_rule.data is None:
+                new_rules.append(rule)
+            elif firewall_rule.data["config_hash"] != firewall_rule.config_hash:
+                _log.info(f"Firewall rule `{rule.name}` is outdated, recreating")
+                stale_rules.append(firewall_rule)
+                new_rules.append(rule)
+            else:
+                _log.info(f"Reusing firewall rule `{rule.name}`")
+                self._response_data.update({rule.name: firewall_rule.data})
+
+        if stale_rules:
+            self._delete_firewall_rules(stale_rules)
+        if new_rules:
+            self._apply_firewall_rules(new_rules)
+
+    @traced()
+    def _reconcile_instances(self):
+        instances = [self._instance_controller(x) for x in self._instances]
+        self._fetch(instances)
+
+        stale_instances, new_instances = [], []
+        for inst, instance in zip(self._instances, instances):
+            if instance.data is None:
+                new_instances.append(inst)
+            elif instance.data["config_hash"] != instance.config_hash:
+                _log.info(f"Instance `{inst.name}` is outdated, recreating")
+                stale_instances.append(inst)
+            elif instance.data["status"] != "RUNNING":
+                _log.info(
+                    f"Instance `{inst.name}` is {instance.data['status']}, recreating"
+                )
+                stale_instances.append(inst)
+            else:
+                _log.info(f"Reusing instance `{inst.name}`")
+                self._response_data.update({inst.name: instance.data})
+
+        if stale_instances:
+            self._delete_instances(stale_instances)
+        if stale_instances or new_instances:
+            self._create_instances(stale_instances + new_instances)
+
+    @traced()
+    def execute_reconcile_scenario(self):
+        """Bring existing resources to the state described by the build file.
+
+        Running instances and firewall rules with unchanged configuration
+        hash are reused, missing ones are created, changed or not running
+        ones are recreated. Nothing is deleted if the setup is up to date.
+        """
+        _log.info("Reconciling test setup ...")
+
+        try:
+            self._create_network()
+            self._reconcile_firewall_rules()
+            self._prepare_images()
+            self._reconcile_instances()
+        finally:
+            auth.close_sessions()
+
+        _log.info(f"Test setup reconciled, provisioned instances: {self._provisioned}")
+
+    @traced()
     def execute_teardown_scenario(self):
         _log.info("Deleting test setup ...")
 
-        self._delete_instances()
-        # self._delete_network()   # bugged, priority and severity are low, so can be ignored
+        try:
+            self._delete_instances()
+            # self._delete_network()   # bugged, priority and severity are low, so can be ignored
+        finally:
+            auth.close_sessions()
 
         _log.info("Test setup successfully deleted")
 
+    @traced()
     def add_ssh_keys(self, private_key_file=None):
         if private_key_file is None:
             private_key_file = os.path.join(os.getcwd(), "cloud_access.key")
@@ -215,6 +567,7 @@ class Builder:
             f"key: `{private_key_file}`"
         )
 
+    @traced()
     def generate_testbed(self, testbed_file="testbed.yaml"):
         testbed = {
             "testbed": {
@@ -229,22 +582,25 @@ class Builder:
             "devices": dict(),
             "topology": dict(),
         }
+        # hosts of the ansible groups get the remote agent with main.yml
+        agents = set()
+        if self._options.playbooks is not None:
+            agents = {x for names in self.ansible_groups.values() for x in names}
         for entry in self._instances:
             device_data = self._response_data.get(entry.name)
-            testbed["devices"].update(
-                {
-                    device_data.get("name"): {
-                        "os": "linux",
-                        "type": "linux-vm",
-                        "connections": {
-                            "cli": {
-                                "command": f"ssh -i {self._key} {self._user}"
-                                f'@{device_data.get("nat_ip")}'
-                            },
-                        },
+            device = {
+                "os": "linux",
+                "type": "linux-vm",
+                "connections": {
+                    "cli": {
+                        "command": f"ssh -i {self._key} {self._user}"
+                        f'@{device_data.get("nat_ip")}'
                     },
-                }
-            )
+                },
+            }
+            if entry.name in agents:
+                device["custom"] = {"agent": True}
+            testbed["devices"].update({device_data.get("name"): device})
         for entry in self._instances:
             device_data = self._response_data.get(entry.name)
             testbed["topology"].update(
@@ -271,6 +627,18 @@ class Builder:
                 )
         _log.info(f"Created testbed file `{testbed_file}`")
 
+    @property
+    def ansible_groups(self) -> dict:
+        """Instance names by ansible inventory group, chosen by the first tag."""
+        groups = {"proxy": [], "users": []}
+        for entry in self._instances:
+            if entry.tags[0] == "proxy":
+                groups["proxy"].append(entry.name)
+            elif entry.tags[0] == "usr":
+                groups["users"].append(entry.name)
+        return groups
+
+    @traced()
     def generate_ansible_configs(self, general="all", groups="myhosts.ini"):
         # general data file
         content = (
@@ -279,18 +647,14 @@ class Builder:
         with open(general, "w") as file:
             file.write(content)
         # groups data file
-        content = "[proxy]"
-        for entry in self._instances:
-            tag = entry.tags[0]
-            device_host = self._response_data.get(entry.name).get("nat_ip")
-            if tag == "proxy":
-                content += f"\n{entry.name} ansible_host={device_host}"
-        content += "\n\n[users]"
-        for entry in self._instances:
-            tag = entry.tags[0]
-            device_host = self._response_data.get(entry.name).get("nat_ip")
-            if tag == "usr":
-                content += f"\n{entry.name} ansible_host={device_host}"
+        sections = []
+        for group, names in self.ansible_groups.items():
+            hosts = "".join(
+                f'\n{name} ansible_host={self._response_data.get(name).get("nat_ip")}'
+                for name in names
+            )
+            sections.append(f"[{group}]{hosts}")
+        content = "\n\n".join(sections)
         with open(groups, "w") as file:
             file.write(content)
         _log.info(f"Created ansible config files `{general}`, `{groups}`")
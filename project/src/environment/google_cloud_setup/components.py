@@ -1,10 +1,52 @@
+import os
+import json
+import hashlib
 from collections import namedtuple
 
 
 Project = namedtuple("Project", ["id", "network", "credentials"])
-InstTemplate = namedtuple("InstTemplate", ["name", "machine_type", "disk_size", "os"])
+InstTemplate = namedtuple(
+    "InstTemplate",
+    [
+        "name",
+        "machine_type",
+        "disk_size",
+        "os",
+        "image_family",
+        "image",
+        "playbooks_hash",
+    ],
+    defaults=[None, None, None],
+)
 Instance = namedtuple("Instance", ["name", "zone", "external_ip", "tags", "from_"])
+BuildOptions = namedtuple("BuildOptions", ["max_workers", "batch", "playbooks"])
 FirewallRule = namedtuple(
     "FirewallRule",
     ["name", "source_ip_ranges", "priority", "tags", "protocol", "ports"],
 )
+
+
+def config_hash(*entries) -> str:
+    """Short stable hash of configuration entries, namedtuples or plain values."""
+    data = json.dumps(
+        [x._asdict() if hasattr(x, "_asdict") else x for x in entries], sort_keys=True
+    )
+    return hashlib.sha256(data.encode()).hexdigest()[:16]
+
+
+def content_hash(*paths) -> str:
+    """Short hash of files content, directories are walked recursively."""
+    digest = hashlib.sha256()
+    for path in paths:
+        files = [path]
+        if os.path.isdir(path):
+            files = sorted(
+                os.path.join(root, name)
+                for root, _, names in os.walk(path)
+                for name in names
+            )
+        for file in files:
+            digest.update(os.path.relpath(file, os.path.dirname(path)).encode())
+            with open(file, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:16]
@@ -1,47 +1,154 @@
 from abc import ABC, abstractmethod
 import json
 import re
+import time
+import uuid
+import logging
+import functools
+from email.parser import BytesParser
+from urllib.parse import urlsplit
 
-import polling
-from google.auth.transport import requests
-from google.oauth2 import service_account
-from requests.exceptions import HTTPError
+from requests import Response
+from requests.exceptions import HTTPError, Timeout
+from requests.exceptions import ConnectionError as RequestsConnectionError
 
+from src.environment.google_cloud_setup.auth import get_session
+from src.classes.tracing import span, traced
+from src.environment.google_cloud_setup.components import config_hash
+from src.environment.google_cloud_setup.retry import (
+    API_RATE,
+    OperationError,
+    RetryPolicy,
+    backoff_delay,
+    get_bucket,
+    is_retryable,
+    is_retryable_response,
+)
 
-def retry_on_error(max_attempts):
-    """Retry decorator for 400 error."""
+_log = logging.getLogger(__name__)
+
+
+COMPUTE_API = "https://www.googleapis.com/compute/v1"
+# request was not answered, it is resent like a transient error response
+TRANSPORT_ERRORS = (RequestsConnectionError, Timeout)
+
+
+def _parse_config_hash(response_data):
+    """Config hash from the resource description, None if not set."""
+    match = re.search(r"config-hash: (\w+)", response_data.get("description", ""))
+    return match.group(1) if match else None
+
+
+def retry_on_error(policy_name):
+    """Retry decorator, transient errors are retried by the controller's policy.
+
+    Args:
+        policy_name (str): name of the controller's RetryPolicy attribute
+    """
 
     def inner(func):
+        @functools.wraps(func)
         def wrapper(self):
-            for i in range(max_attempts):
-                response = func(self)
-                if self._exceptions and i < max_attempts - 1:
+            policy = getattr(self, policy_name)
+            name = f"{type(self).__name__}.{func.__name__}"
+            self._exceptions = []
+            with span(name, "controller") as details:
+                for attempt in range(policy.max_attempts):
+                    details["attempts"] = attempt + 1
+                    try:
+                        response = func(self)
+                    except TRANSPORT_ERRORS:
+                        # already added to the exceptions by _send
+                        response = None
+                    if not self._exceptions or attempt == policy.max_attempts - 1:
+                        break
+                    if not all(is_retryable(x) for x in self._exceptions):
+                        break
+                    delay = backoff_delay(policy, attempt, self._exceptions)
+                    _log.info(
+                        f"{name} attempt {attempt + 1} failed: "
+                        f"{self._exceptions[-1]}, retrying in {delay:.1f}s"
+                    )
+                    time.sleep(delay)
                     self._exceptions = []
-                else:
-                    return response
+                details["ok"] = not self._exceptions
+            return response
 
         return wrapper
 
     return inner
 
 
+def _send_with_retry(send, policy, name):
+    """Call send until its response is not a transient error, returns it.
+
+    Connection errors and timeouts are resent too, the one of the last
+    attempt is raised.
+
+    Args:
+        send (callable): sends the request, returns the response
+        policy (RetryPolicy): number of attempts and backoff delays
+        name (str): request name for logs
+    """
+    for attempt in range(policy.max_attempts):
+        response, error = None, None
+        try:
+            response = send()
+        except TRANSPORT_ERRORS as exception:
+            error = exception
+        transient = error is not None or is_retryable_response(response)
+        if not transient or attempt == policy.max_attempts - 1:
+            break
+        delay = backoff_delay(policy, attempt, responses=[response])
+        reason = repr(error) if error is not None else response.status_code
+        _log.debug(f"{name}: {reason}, resent in {delay:.1f}s")
+        time.sleep(delay)
+    if error is not None:
+        raise error
+    return response
+
+
+def _next_attempt(pending, policy, attempt):
+    """Controllers to retry after a batched attempt, waits the backoff delay."""
+    retry = [
+        x
+        for x in pending
+        if x._exceptions and all(is_retryable(e) for e in x._exceptions)
+    ]
+    if not retry or attempt == policy.max_attempts - 1:
+        return []
+    delay = backoff_delay(policy, attempt, [e for x in retry for e in x._exceptions])
+    _log.info(
+        f"Batched attempt {attempt + 1} failed for {len(retry)}, retrying in {delay:.1f}s"
+    )
+    time.sleep(delay)
+    return retry
+
+
 class Controller(ABC):
     """Base controller class constructor."""
 
+    # max time to wait for a single operation, seconds
+    _operation_timeout = 300
+    # only transient errors are retried, single requests and whole operations
+    _request_policy = RetryPolicy(max_attempts=5)
+    _create_policy = RetryPolicy(max_attempts=5)
+    _delete_policy = RetryPolicy(max_attempts=5)
+
     def __init__(self, project):
         self._project = project
         self._session = None
         self._created_status = False
         self._deleted_status = False
+        # insert was accepted, the resource didn't exist before
+        self._inserted = False
         self._data = None
         self._exceptions = []
-
-        service_key = project.credentials["service-acc-key"]
-        scopes = project.credentials["access-scopes"]
-        credentials = service_account.Credentials.from_service_account_file(
-            service_key, scopes=scopes
+        self._api = project.credentials.get("api-endpoint", COMPUTE_API)
+        self._session = get_session(project.credentials)
+        self._bucket = get_bucket(
+            project.id, project.credentials.get("api-rate", API_RATE)
         )
-        self._session = requests.AuthorizedSession(credentials=credentials)
 
     def _is_good_response(self, response):
         """Check that response status code is in range 200-299 or eq to 409."""
@@ -54,28 +161,144 @@ class Controller(ABC):
                 self._exceptions.append(exception)
         return result
 
-    def _wait_for_deletion_complete(self):
-        """Poll GET request till 404 occured."""
-        try:
-            polling.poll(lambda: self.get().status_code == 404, timeout=120, step=2)
-        except polling.TimeoutException as exception:
-            self._exceptions.append(exception)
+    def _operation_wait_url(self, operation):
+        if "zone" in operation:
+            scope = f"zones/{operation['zone'].rsplit('/', 1)[-1]}"
         else:
+            scope = "global"
+        return (
+            f"{self._api}/projects/{self._project.id}/{scope}"
+            f"/operations/{operation['name']}/wait"
+        )
+
+    def _check_operation(self, operation):
+        """Check that DONE operation has no errors."""
+        if "error" in operation:
+            self._exceptions.append(OperationError(operation["error"]["errors"]))
+            return False
+        return True
+
+    def _operation_timed_out(self, operation):
+        self._exceptions.append(
+            TimeoutError(
+                f"Operation `{operation['name']}` is not done in "
+                f"{self._operation_timeout}s"
+            )
+        )
+
+    def _wait_for_operation(self, response):
+        """Wait till the operation returned by insert/delete request is DONE.
+
+        Uses 'wait' endpoint, the API holds each call for up to 2 minutes and
+        returns as soon as the operation is done, so usually a single request
+        is sent per operation.
+        """
+        operation = json.loads(response.content)
+        url = self._operation_wait_url(operation)
+        deadline = time.monotonic() + self._operation_timeout
+        with span("wait operation", "poll", operation=operation["name"]) as details:
+            details["polls"] = 0
+            while operation.get("status") != "DONE":
+                if time.monotonic() > deadline:
+                    self._operation_timed_out(operation)
+                    break
+                details["polls"] += 1
+                response = self._send("POST", url)
+                if not self._is_good_response(response):
+                    break
+                operation = json.loads(response.content)
+        return operation.get("status") == "DONE" and self._check_operation(operation)
+
+    def _wait_for_deletion_complete(self, response):
+        """Wait for delete operation, resource which is already gone is OK."""
+        if response.status_code == 404:
+            self._deleted_status = True
+        elif self._is_good_response(response) and self._wait_for_operation(response):
             self._deleted_status = True
 
-    def _wait_for_creation_complete(self):
-        """Poll crreation status, individual for each case."""
+    def _wait_for_creation_complete(self, response):
+        """Wait for insert operation, resource which already exists is OK."""
+        if response.status_code == 409 or self._wait_for_operation(response):
+            self._created_status = True
 
-    @abstractmethod
+    def _send(self, method, url, body=None):
+        """Send API request, it is resent while the response is a transient error.
+
+        Resent insert and delete are safe, their 409 and 404 responses are OK.
+        Unanswered request is resent too, its error is added to the exceptions
+        and raised if the last attempt fails.
+        """
+        data = json.dumps(body) if body is not None else None
+
+        def send():
+            with span(f"{method} {type(self).__name__}", "api", url=url) as details:
+                details["throttled"] = self._bucket.acquire()
+                response = self._session.request(method=method, url=url, data=data)
+                details["status"] = response.status_code
+            return response
+
+        try:
+            return _send_with_retry(send, self._request_policy, f"{method} {url}")
+        except TRANSPORT_ERRORS as exception:
+            self._exceptions.append(exception)
+            raise
+
+    @property
+    def inserted(self):
+        """Resource was inserted by this controller, it didn't exist before."""
+        return self._inserted
+
+    def _get_data(self):
+        self._parse_data(json.loads(self.get().content))
+
+    def _load(self, response):
+        """Load data of the existing resource, returns False if there is none."""
+        found = response.status_code != 404 and self._is_good_response(response)
+        if found:
+            self._parse_data(json.loads(response.content))
+        return found
+
+    def refresh(self):
+        """Load data of the existing resource, returns False if there is none."""
+        return self._load(self.get())
+
+    @retry_on_error("_create_policy")
     def create(self):
+        """Build and send API 'insert' request."""
+        response = self._send(*self._insert_request())
+        # accepted insert of any attempt counts, the retried one gets 409
+        self._inserted = self._inserted or response.ok
+        if self._is_good_response(response):
+            self._wait_for_creation_complete(response)
+            if self._created_status:
+                self._get_data()
+        return response
+
+    def get(self):
+        """Build and send API 'get' request."""
+        return self._send(*self._get_request())
+
+    @retry_on_error("_delete_policy")
+    def delete(self):
+        """Build and send API 'delete' request."""
+        response = self._send(*self._delete_request())
+        self._wait_for_deletion_complete(response)
+        return response
+
+    @abstractmethod
+    def _parse_data(self, response_data):
         pass
 
     @abstractmethod
-    def get(self):
+    def _insert_request(self):
         pass
 
     @abstractmethod
-    def delete(self):
+    def _get_request(self):
+        pass
+
+    @abstractmethod
+    def _delete_request(self):
         pass
 
 
@@ -98,30 +321,13 @@ class NetworkController(Controller):
     def exceptions(self):
         return self._exceptions
 
-    def _wait_for_creation_complete(self):
-        # wait untill all subnets are created
-        def subnets_created():
-            response_data = json.loads(self.get().content)
-            subnets = response_data.get("subnetworks", [])
-            if len(subnets) < 25:
-                return False
-            return True
-
-        try:
-            polling.poll(lambda: subnets_created() is True, timeout=60, step=2)
-        except polling.TimeoutException as exception:
-            self._exceptions.append(exception)
-        else:
-            self._created_status = True
-
-    def _get_data(self):
-        response_data = json.loads(self.get().content)
+    def _parse_data(self, response_data):
         self._data = {"network": response_data["name"]}
 
-    def create(self):
-        """Build and send API 'insert' request."""
+    def _insert_request(self):
+        """Build API 'insert' request."""
         method = "POST"
-        url = f"https://www.googleapis.com/compute/v1/projects/{self._project.id}/global/networks"
+        url = f"{self._api}/projects/{self._project.id}/global/networks"
         body = {
             "autoCreateSubnetworks": True,
             "description": "",
@@ -130,47 +336,43 @@ class NetworkController(Controller):
             "routingConfig": {"routingMode": "REGIONAL"},
             "selfLink": f"projects/{self._project.id}/global/networks/{self._project.network}",
         }
-        response = self._session.request(method=method, url=url, data=json.dumps(body))
-
-        if self._is_good_response(response):
-            self._wait_for_creation_complete()
-            self._get_data()
-
-        return response
+        return method, url, body
 
-    def get(self):
-        """Build and send API 'get' request."""
+    def _get_request(self):
+        """Build API 'get' request."""
         method = "GET"
         url = (
-            f"https://www.googleapis.com/compute/v1/projects/{self._project.id}"
+            f"{self._api}/projects/{self._project.id}"
             f"/global/networks/{self._project.network}"
         )
+        return method, url, None
 
-        response = self._session.request(method=method, url=url)
-        return response
-
-    def delete(self):
-        """Build and send API 'delete' request."""
-
+    def _delete_request(self):
+        """Build API 'delete' request."""
         method = "DELETE"
         url = (
-            f"https://www.googleapis.com/compute/v1/projects/{self._project.id}/global"
+            f"{self._api}/projects/{self._project.id}/global"
             f"/networks/{self._project.network}"
         )
-
-        response = self._session.request(method=method, url=url)
-        self._wait_for_deletion_complete()
-        return response
+        return method, url, None
 
 
 class InstanceController(Controller):
     """Controller for InstancesClient class of google-cloud-compute lib."""
 
+    # subnets of a new network are not ready for a while
+    _create_policy = RetryPolicy(max_attempts=15)
+
     def __init__(self, project, instance, template=None):
         super().__init__(project)
         self._template = template
         self._instance = instance
 
+    @property
+    def config_hash(self):
+        """Hash of the instance configuration, stored in its description."""
+        return config_hash(self._project.network, self._instance, self._template)
+
     @property
     def created_status(self):
         return self._created_status
@@ -187,45 +389,44 @@ class InstanceController(Controller):
     def exceptions(self):
         return self._exceptions
 
-    def _wait_for_creation_complete(self):
-        # wait untill VM's network interfaces are configured, that's a bit of latency
-        def ip_identified():
-            response_data = json.loads(self.get().content)
-            net_ip = response_data["networkInterfaces"][0].get("networkIP")
-            nat_ip = response_data["networkInterfaces"][0]["accessConfigs"][0].get(
-                "natIP"
-            )
-            if not net_ip or not nat_ip:
-                return False
-            return True
-
-        try:
-            polling.poll(lambda: ip_identified() is True, timeout=60, step=2)
-        except polling.TimeoutException as exception:
-            self._exceptions.append(exception)
-        else:
-            self._created_status = True
-
-    def _get_data(self):
-        response_data = json.loads(self.get().content)
+    def _parse_data(self, response_data):
         self._data = {
             "name": response_data["name"],
             "network_ip": response_data["networkInterfaces"][0].get("networkIP"),
             "nat_ip": response_data["networkInterfaces"][0]["accessConfigs"][0].get(
                 "natIP"
             ),
+            "status": response_data.get("status"),
+            "config_hash": _parse_config_hash(response_data),
         }
 
+    def _source_image(self):
+        # baked image if prepared, otherwise the latest image of the os family
+        if self._template.image is not None:
+            return f"projects/{self._project.id}/global/images/{self._template.image}"
+        return f"projects/ubuntu-os-cloud/global/images/family/{self._template.os}"
+
+    def stop(self):
+        """Build and send API 'stop' request."""
+        method = "POST"
+        url = (
+            f"{self._api}/projects/{self._project.id}/zones"
+            f"/{self._instance.zone}/instances/{self._instance.name}/stop"
+        )
+        response = self._send(method, url)
+        if self._is_good_response(response):
+            self._wait_for_operation(response)
+        return response
+
     def _identify_subnet(self):
         zone = self._instance.zone
         return re.compile(r"\w+-\w+").search(zone)[0]
 
-    @retry_on_error(max_attempts=15)
-    def create(self):
-        """Build and send API 'insert' request."""
+    def _insert_request(self):
+        """Build API 'insert' request."""
         method = "POST"
         url = (
-            f"https://www.googleapis.com/compute/v1/projects/{self._project.id}/zones"
+            f"{self._api}/projects/{self._project.id}/zones"
             f"/{self._instance.zone}/instances"
         )
         body = {
@@ -242,8 +443,7 @@ class InstanceController(Controller):
                     "autoDelete": True,
                     "deviceName": self._instance.name,
                     "initializeParams": {
-                        "sourceImage": f"projects/ubuntu-os-cloud/global/images/family"
-                        f"/{self._template.os}",
+                        "sourceImage": self._source_image(),
                         "diskType": f"projects/{self._project.id}/zones/{self._instance.zone}"
                         f"/diskTypes/pd-balanced",
                         "diskSizeGb": str(self._template.disk_size),
@@ -266,10 +466,12 @@ class InstanceController(Controller):
                     ],
                 }
             ],
-            "description": "",
+            "description": f"config-hash: {self.config_hash}",
             "serviceAccounts": [
                 {
-                    "email": self._session.credentials.service_account_email,
+                    "email": getattr(
+                        self._session.credentials, "service_account_email", "default"
+                    ),
                     "scopes": [
                         "https://www.googleapis.com/auth/devstorage.read_only",
                         "https://www.googleapis.com/auth/logging.write",
@@ -282,37 +484,84 @@ class InstanceController(Controller):
             ],
         }
 
-        response = self._session.request(method=method, url=url, data=json.dumps(body))
-        if self._is_good_response(response):
-            self._wait_for_creation_complete()
-            self._get_data()
-
-        return response
+        return method, url, body
 
-    def get(self):
-        """Build and send API 'get' request."""
+    def _get_request(self):
+        """Build API 'get' request."""
         method = "GET"
         url = (
-            f"https://www.googleapis.com/compute/v1/projects/{self._project.id}/zones"
+            f"{self._api}/projects/{self._project.id}/zones"
             f"/{self._instance.zone}/instances/{self._instance.name}"
         )
+        return method, url, None
 
-        response = self._session.request(method=method, url=url)
-        return response
-
-    @retry_on_error(max_attempts=2)
-    def delete(self):
-        """Build and send API 'delete' request."""
-
+    def _delete_request(self):
+        """Build API 'delete' request."""
         method = "DELETE"
         url = (
-            f"https://www.googleapis.com/compute/v1/projects/{self._project.id}/zones"
+            f"{self._api}/projects/{self._project.id}/zones"
             f"/{self._instance.zone}/instances/{self._instance.name}"
         )
+        return method, url, None
 
-        response = self._session.request(method=method, url=url)
-        self._wait_for_deletion_complete()
-        return response
+
+class ImageController(Controller):
+    """Compute engine's Images API Controller."""
+
+    # creating an image from a disk takes minutes
+    _operation_timeout = 900
+
+    def __init__(self, project, name, family=None, source_disk=None):
+        super().__init__(project)
+        self._name = name
+        self._family = family
+        self._source_disk = source_disk
+
+    @property
+    def created_status(self):
+        return self._created_status
+
+    @property
+    def deleted_status(self):
+        return self._deleted_status
+
+    @property
+    def data(self):
+        return self._data
+
+    @property
+    def exceptions(self):
+        return self._exceptions
+
+    def _parse_data(self, response_data):
+        self._data = {
+            "name": response_data["name"],
+            "family": response_data.get("family"),
+            "status": response_data.get("status"),
+        }
+
+    def _insert_request(self):
+        """Build API 'insert' request."""
+        method = "POST"
+        url = f"{self._api}/projects/{self._project.id}/global/images"
+        body = {
+            "name": self._name,
+            "family": self._family,
+            "sourceDisk": self._source_disk,
+        }
+        return method, url, body
+
+    def _get_request(self):
+        """Build API 'get' request."""
+        method = "GET"
+        url = f"{self._api}/projects/{self._project.id}/global/images/{self._name}"
+        return method, url, None
+
+    def _delete_request(self):
+        """Build API 'delete' request."""
+        method = "DELETE"
+        url = f"{self._api}/projects/{self._project.id}/global/images/{self._name}"
+        return method, url, None
 
 
 class FirewallController(Controller):
@@ -322,6 +571,11 @@ class FirewallController(Controller):
         super().__init__(project)
         self._firewall_rule = firewall_rule
 
+    @property
+    def config_hash(self):
+        """Hash of the rule configuration, stored in its description."""
+        return config_hash(self._project.network, self._firewall_rule)
+
     @property
     def created_status(self):
         return self._created_status
@@ -338,18 +592,18 @@ class FirewallController(Controller):
     def exceptions(self):
         return self._exceptions
 
-    def _get_data(self):
-        response_data = json.loads(self.get().content)
+    def _parse_data(self, response_data):
         self._data = {
             "name": response_data["name"],
             "allowed": response_data["allowed"][0],
             "tags": response_data["targetTags"],
+            "config_hash": _parse_config_hash(response_data),
         }
 
-    def create(self):
-        """Build and send API 'insert' request."""
+    def _insert_request(self):
+        """Build API 'insert' request."""
         method = "POST"
-        url = f"https://www.googleapis.com/compute/v1/projects/{self._project.id}/global/firewalls"
+        url = f"{self._api}/projects/{self._project.id}/global/firewalls"
         body = {
             "name": self._firewall_rule.name,
             "network": f"projects/{self._project.id}/global/networks/{self._project.network}",
@@ -363,32 +617,299 @@ class FirewallController(Controller):
                 }
             ],
             "sourceRanges": self._firewall_rule.source_ip_ranges,
+            "description": f"config-hash: {self.config_hash}",
         }
-        response = self._session.request(method=method, url=url, data=json.dumps(body))
-        self._created_status = True
-        self._get_data()
-        return response
+        return method, url, body
 
-    def get(self):
-        """Build and send API 'get' request."""
+    def _get_request(self):
+        """Build API 'get' request."""
         method = "GET"
         url = (
-            f"https://www.googleapis.com/compute/v1/projects/{self._project.id}/global"
+            f"{self._api}/projects/{self._project.id}/global"
             f"/firewalls/{self._firewall_rule.name}"
         )
+        return method, url, None
 
-        response = self._session.request(method=method, url=url)
-        return response
-
-    def delete(self):
-        """Build and send API 'delete' request."""
-
+    def _delete_request(self):
+        """Build API 'delete' request."""
         method = "DELETE"
         url = (
-            f"https://www.googleapis.com/compute/v1/projects/{self._project.id}/global"
+            f"{self._api}/projects/{self._project.id}/global"
             f"/firewalls/{self._firewall_rule.name}"
         )
-
-        response = self._session.request(method=method, url=url)
-        self._wait_for_deletion_complete()
+        return method, url, None
+
+
+class Batch:
+    """Google API batch requests.
+
+    Sends calls as multipart/mixed requests to the batch endpoint, up to
+    `max_size` calls per request, and maps sub-responses back to the calls.
+    """
+
+    max_size = 1000
+
+    def __init__(self, session, api=COMPUTE_API, bucket=None, policy=None):
+        """Constructor.
+
+        Args:
+            session (AuthorizedSession): session to send batch requests with
+            api (str): API base url, batch endpoint is derived from it
+            bucket (TokenBucket): API calls throttling, each call in a batch
+                takes a token
+            policy (RetryPolicy): calls with transient error responses are
+                resent by it, not resent if None
+        """
+        self._session = session
+        self._bucket = bucket
+        self._policy = policy or RetryPolicy(max_attempts=1)
+        parsed = urlsplit(api)
+        self._url = f"{parsed.scheme}://{parsed.netloc}/batch{parsed.path}"
+
+    @staticmethod
+    def _encode(calls, boundary):
+        parts = []
+        for index, (method, url, body) in enumerate(calls):
+            parsed = urlsplit(url)
+            target = parsed.path + (f"?{parsed.query}" if parsed.query else "")
+            request = f"{method} {target} HTTP/1.1\r\n"
+            if body is not None:
+                request += f"Content-Type: application/json\r\n\r\n{json.dumps(body)}"
+            else:
+                request += "\r\n"
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <item{index}>\r\n\r\n{request}\r\n"
+            )
+        return ("".join(parts) + f"--{boundary}--\r\n").encode()
+
+    @staticmethod
+    def _decode_part(raw, url):
+        head, _, body = raw.replace(b"\r\n", b"\n").partition(b"\n\n")
+        status_line, *header_lines = head.decode().split("\n")
+        response = Response()
+        response.url = url
+        _, status_code, *reason = status_line.split(" ", 2)
+        response.status_code = int(status_code)
+        response.reason = reason[0] if reason else ""
+        for line in header_lines:
+            name, _, value = line.partition(":")
+            response.headers[name.strip()] = value.strip()
+        response._content = body.strip()
         return response
+
+    def _execute(self, calls):
+        boundary = f"batch_{uuid.uuid4().hex}"
+        content_type = f"multipart/mixed; boundary={boundary}"
+        data = self._encode(calls, boundary)
+
+        def send():
+            with span("POST batch", "api", calls=len(calls)) as details:
+                if self._bucket is not None:
+                    details["throttled"] = self._bucket.acquire(len(calls))
+                response = self._session.request(
+                    method="POST",
+                    url=self._url,
+                    data=data,
+                    headers={"Content-Type": content_type},
+                )
+                details["status"] = response.status_code
+            return response
+
+        # throttled or failed batch request is resent as a whole
+        response = _send_with_retry(send, self._policy, f"POST {self._url}")
+        response.raise_for_status()
+
+        message = BytesParser().parsebytes(
+            f"Content-Type: {response.headers['Content-Type']}\r\n\r\n".encode()
+            + response.content
+        )
+        responses = [None] * len(calls)
+        for part in message.get_payload():
+            index = int(re.search(r"(\d+)>?$", part["Content-ID"]).group(1))
+            responses[index] = self._decode_part(
+                part.get_payload(decode=True), calls[index][1]
+            )
+        for index, sub_response in enumerate(responses):
+            if sub_response is None:
+                raise ValueError(f"No batch response for `{calls[index][1]}`")
+        return responses
+
+    def _execute_chunks(self, calls):
+        responses = []
+        for start in range(0, len(calls), self.max_size):
+            responses += self._execute(calls[start : start + self.max_size])
+        return responses
+
+    def execute(self, calls):
+        """Send (method, url, body) calls, returns responses in the same order.
+
+        Calls with transient error responses are resent in the next batch.
+        """
+        responses = [None] * len(calls)
+        pending = list(range(len(calls)))
+        for attempt in range(self._policy.max_attempts):
+            sent = self._execute_chunks([calls[x] for x in pending])
+            for index, response in zip(pending, sent):
+                responses[index] = response
+            retry = [x for x in pending if is_retryable_response(responses[x])]
+            if not retry or attempt == self._policy.max_attempts - 1:
+                break
+            delay = backoff_delay(
+                self._policy, attempt, responses=[responses[x] for x in retry]
+            )
+            _log.debug(f"{len(retry)} batched calls resent in {delay:.1f}s")
+            time.sleep(delay)
+            pending = retry
+        return responses
+
+
+def _batch_of(controllers):
+    controller = controllers[0]
+    return Batch(
+        controller._session,
+        controller._api,
+        controller._bucket,
+        controller._request_policy,
+    )
+
+
+def _split_running(operations):
+    """Split operations into controllers which succeeded and still running ones."""
+    succeeded, running = [], {}
+    for controller, operation in operations.items():
+        if operation.get("status") != "DONE":
+            running[controller] = operation
+        elif controller._check_operation(operation):
+            succeeded.append(controller)
+    return succeeded, running
+
+
+@traced("poll operations", "poll")
+def _poll_operations(batch, running):
+    """Send batched 'wait' calls, returns refreshed operations of the good responses."""
+    calls = [
+        ("POST", controller._operation_wait_url(operation), None)
+        for controller, operation in running.items()
+    ]
+    return {
+        controller: json.loads(response.content)
+        for controller, response in zip(running, batch.execute(calls))
+        if controller._is_good_response(response)
+    }
+
+
+@traced("wait operations", "poll")
+def _wait_for_operations(batch, operations):
+    """Wait for operations of many controllers with batched 'wait' calls.
+
+    Returns controllers whose operations succeeded, errors are added to
+    the exceptions of the rest.
+    """
+    succeeded = []
+    # controllers of long operations, e.g. instances and images, wait longer
+    timeout = max((x._operation_timeout for x in operations), default=0)
+    deadline = time.monotonic() + timeout
+    while operations:
+        done, running = _split_running(operations)
+        succeeded += done
+        if running and time.monotonic() > deadline:
+            for controller, operation in running.items():
+                controller._operation_timed_out(operation)
+            break
+        operations = _poll_operations(batch, running) if running else {}
+    return succeeded
+
+
+def _create_round(batch, controllers):
+    """Batched inserts, operation waits and gets of one create attempt."""
+    for controller in controllers:
+        controller._exceptions = []
+    responses = batch.execute([x._insert_request() for x in controllers])
+    operations = {}
+    for controller, response in zip(controllers, responses):
+        if response.status_code == 409:
+            controller._created_status = True
+        elif controller._is_good_response(response):
+            controller._inserted = True
+            operations[controller] = json.loads(response.content)
+    for controller in _wait_for_operations(batch, operations):
+        controller._created_status = True
+
+    created = [x for x in controllers if x._created_status]
+    responses = batch.execute([x._get_request() for x in created]) if created else []
+    for controller, response in zip(created, responses):
+        if controller._is_good_response(response):
+            controller._parse_data(json.loads(response.content))
+
+
+def _delete_round(batch, controllers):
+    """Batched deletes and operation waits of one delete attempt."""
+    for controller in controllers:
+        controller._exceptions = []
+    responses = batch.execute([x._delete_request() for x in controllers])
+    operations = {}
+    for controller, response in zip(controllers, responses):
+        if response.status_code == 404:
+            controller._deleted_status = True
+        elif controller._is_good_response(response):
+            operations[controller] = json.loads(response.content)
+    for controller in _wait_for_operations(batch, operations):
+        controller._deleted_status = True
+
+
+@traced(category="controller")
+def batch_get(controllers):
+    """Load data of existing resources of all controllers with batched requests.
+
+    Returns list of flags whether the resource of each controller exists.
+    """
+    if not controllers:
+        return []
+    batch = _batch_of(controllers)
+    responses = batch.execute([x._get_request() for x in controllers])
+    return [x._load(response) for x, response in zip(controllers, responses)]
+
+
+@traced(category="controller")
+def batch_create(controllers, policy=None):
+    """Create resources of all controllers with batched requests.
+
+    Inserts, operation waits and gets are sent as one batch request per step,
+    results are mapped back to each controller's created_status, data and
+    exceptions. Transient failures are retried like `create` does.
+
+    Args:
+        controllers (list): controllers of resources to create
+        policy (RetryPolicy): retry policy, the one of controllers if None
+    """
+    if not controllers:
+        return
+    policy = policy or controllers[0]._create_policy
+    batch = _batch_of(controllers)
+    pending = list(controllers)
+    for attempt in range(policy.max_attempts):
+        _create_round(batch, pending)
+        pending = _next_attempt(pending, policy, attempt)
+        if not pending:
+            break
+
+
+@traced(category="controller")
+def batch_delete(controllers, policy=None):
+    """Delete resources of all controllers with batched requests.
+
+    Args:
+        controllers (list): controllers of resources to delete
+        policy (RetryPolicy): retry policy, the one of controllers if None
+    """
+    if not controllers:
+        return
+    policy = policy or controllers[0]._delete_policy
+    batch = _batch_of(controllers)
+    pending = list(controllers)
+    for attempt in range(policy.max_attempts):
+        _delete_round(batch, pending)
+        pending = _next_attempt(pending, policy, attempt)
+        if not pending:
+            break
@@ -0,0 +1,321 @@
+"""Local fake of the Compute Engine API subset used by the controllers.
+
+Keeps networks, instances and firewall rules in memory, every insert/delete
+returns an operation which is done after `latency` seconds, operations can be
+long-polled with the 'wait' endpoint. Batch requests to /batch/compute/v1 are
+served too. Requests are counted by method, calls inside batches as `batched`,
+so the number of API calls of a scenario can be checked.
+
+Every `throttle`-th call is rejected with 429 rateLimitExceeded, to check
+retries of transient errors.
+
+Usage: fake_compute.py [--port 8085] [--latency 2] [--throttle 5] [--fail user-2 ...]
+
+and point the controllers to it with the project credentials:
+
+    credentials:
+      api-endpoint: http://127.0.0.1:8085/compute/v1
+"""
+import re
+import json
+import time
+import uuid
+import argparse
+import threading
+from itertools import count
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import Counter
+from email.parser import BytesParser
+from concurrent.futures import ThreadPoolExecutor
+
+
+BASE = "/compute/v1/projects/(?P<project>[^/]+)"
+ROUTES = (
+    ("project", re.compile(f"{BASE}$")),
+    ("metadata", re.compile(f"{BASE}/setCommonInstanceMetadata$")),
+    (
+        "collection",
+        re.compile(f"{BASE}/global/(?P<kind>networks|firewalls|images)$"),
+    ),
+    (
+        "resource",
+        re.compile(
+            f"{BASE}/global/(?P<kind>networks|firewalls|images)/(?P<name>[^/]+)$"
+        ),
+    ),
+    ("collection", re.compile(f"{BASE}/zones/(?P<zone>[^/]+)/(?P<kind>instances)$")),
+    (
+        "resource",
+        re.compile(
+            f"{BASE}/zones/(?P<zone>[^/]+)/(?P<kind>instances)/(?P<name>[^/]+)$"
+        ),
+    ),
+    (
+        "stop",
+        re.compile(f"{BASE}/zones/(?P<zone>[^/]+)/instances/(?P<name>[^/]+)/stop$"),
+    ),
+    (
+        "operation",
+        re.compile(
+            f"{BASE}/(?:global|zones/(?P<zone>[^/]+))/operations/(?P<name>[^/]+?)"
+            f"(?P<wait>/wait)?$"
+        ),
+    ),
+)
+
+
+class FakeCompute:
+    """In-memory resources and operations."""
+
+    def __init__(self, latency=2.0, wait_timeout=120.0, fail=(), throttle=0):
+        self.latency = latency
+        self.throttle = throttle
+        self.wait_timeout = wait_timeout
+        self.fail = set(fail)
+        self.requests = Counter()
+        self._resources = {}
+        self._operations = {}
+        # operation ids, instance addresses and calls for throttling
+        self._counters = {"operation": count(1), "address": count(2), "call": count(1)}
+        self._lock = threading.Lock()
+
+    def _new_operation(self, kind, name, op_type, zone=None):
+        operation = {
+            "kind": "compute#operation",
+            "name": f"operation-{next(self._counters['operation'])}",
+            "operationType": op_type,
+            "targetLink": f"{kind}/{name}",
+            "status": "RUNNING",
+        }
+        if zone is not None:
+            operation["zone"] = f"zones/{zone}"
+        if name in self.fail:
+            operation["error"] = {
+                "errors": [{"code": "FAKE_FAILURE", "message": f"{name} failed"}]
+            }
+        self._operations[operation["name"]] = (
+            operation,
+            time.monotonic() + self.latency,
+        )
+        return dict(operation)
+
+    def operation(self, name, wait=False):
+        operation, done_at = self._operations[name]
+        if wait:
+            time.sleep(max(0, min(done_at - time.monotonic(), self.wait_timeout)))
+        if time.monotonic() >= done_at:
+            operation["status"] = "DONE"
+        return dict(operation)
+
+    def insert(self, kind, body, zone=None):
+        name = body["name"]
+        with self._lock:
+            if (kind, name) in self._resources:
+                return 409, {
+                    "error": {"code": 409, "message": f"{name} already exists"}
+                }
+            resource = dict(body)
+            if kind == "instances":
+                resource["status"] = "RUNNING"
+                address = next(self._counters["address"])
+                resource["networkInterfaces"] = [
+                    {
+                        "networkIP": f"10.166.0.{address}",
+                        "accessConfigs": [{"natIP": f"203.0.113.{address}"}],
+                    }
+                ]
+            if kind == "images":
+                resource["status"] = "READY"
+            if kind == "networks":
+                resource["subnetworks"] = [f"subnetworks/{name}-{i}" for i in range(25)]
+            if name not in self.fail:
+                self._resources[(kind, name)] = resource
+            return 200, self._new_operation(kind, name, "insert", zone)
+
+    def get(self, kind, name):
+        resource = self._resources.get((kind, name))
+        if resource is None:
+            return 404, {"error": {"code": 404, "message": f"{name} not found"}}
+        return 200, resource
+
+    def stop(self, name, zone):
+        resource = self._resources.get(("instances", name))
+        if resource is None:
+            return 404, {"error": {"code": 404, "message": f"{name} not found"}}
+        resource["status"] = "TERMINATED"
+        return 200, self._new_operation("instances", name, "stop", zone)
+
+    def delete(self, kind, name, zone=None):
+        with self._lock:
+            if self._resources.pop((kind, name), None) is None:
+                return 404, {"error": {"code": 404, "message": f"{name} not found"}}
+            return 200, self._new_operation(kind, name, "delete", zone)
+
+
+def route(path):
+    path = path.split("?", 1)[0]
+    for name, pattern in ROUTES:
+        match = pattern.match(path)
+        if match:
+            return name, match.groupdict()
+    return None, {}
+
+
+def _not_found(compute, args, body):  # pylint: disable=unused-argument
+    return 404, {"error": {"code": 404, "message": "not found"}}
+
+
+def _operation(compute, args, body):  # pylint: disable=unused-argument
+    if args["name"] not in compute._operations:
+        return _not_found(compute, args, body)
+    return 200, compute.operation(args["name"], wait=bool(args["wait"]))
+
+
+# API call handlers by route name and method
+HANDLERS = {
+    ("project", "GET"): lambda compute, args, body: (
+        200,
+        {"commonInstanceMetadata": {"fingerprint": "fake"}},
+    ),
+    ("metadata", "POST"): lambda compute, args, body: (
+        200,
+        compute._new_operation("projects", args["project"], "setMetadata"),
+    ),
+    ("collection", "POST"): lambda compute, args, body: compute.insert(
+        args["kind"], body, args.get("zone")
+    ),
+    ("resource", "GET"): lambda compute, args, body: compute.get(
+        args["kind"], args["name"]
+    ),
+    ("resource", "DELETE"): lambda compute, args, body: compute.delete(
+        args["kind"], args["name"], args.get("zone")
+    ),
+    ("stop", "POST"): lambda compute, args, body: compute.stop(
+        args["name"], args["zone"]
+    ),
+    ("operation", "GET"): _operation,
+    ("operation", "POST"): _operation,
+}
+
+
+def _rate_limited(compute, args, body):  # pylint: disable=unused-argument
+    compute.requests["throttled"] += 1
+    error = {"reason": "rateLimitExceeded", "message": "Rate Limit Exceeded"}
+    return 429, {"error": {"code": 429, "errors": [error]}}
+
+
+def dispatch(compute, method, path, body):
+    """Handle single API call, returns status code and response body."""
+    name, args = route(path)
+    handler = HANDLERS.get((name, method), _not_found)
+    if compute.throttle and next(compute._counters["call"]) % compute.throttle == 0:
+        handler = _rate_limited
+    return handler(compute, args, body)
+
+
+def _parse_batch(content_type, data):
+    """Split multipart/mixed batch into (content id, method, path, body) calls."""
+    message = BytesParser().parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + data
+    )
+    calls = []
+    for part in message.get_payload():
+        raw = part.get_payload(decode=True).replace(b"\r\n", b"\n")
+        head, _, body = raw.partition(b"\n\n")
+        method, path, _ = head.decode().split("\n")[0].split(" ")
+        calls.append((part["Content-ID"], method, path, json.loads(body or b"{}")))
+    return calls
+
+
+def _encode_batch(content_ids, results):
+    """Join (status, body) results into multipart/mixed response."""
+    boundary = f"batch_{uuid.uuid4().hex}"
+    parts = [
+        f"--{boundary}\r\nContent-Type: application/http\r\n"
+        f"Content-ID: <response-{content_id.strip('<>')}>\r\n\r\n"
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+        f"Content-Type: application/json\r\n\r\n{json.dumps(body)}\r\n"
+        for content_id, (status, body) in zip(content_ids, results)
+    ]
+    body = "".join(parts) + f"--{boundary}--\r\n"
+    return f"multipart/mixed; boundary={boundary}", body.encode()
+
+
+def dispatch_batch(compute, content_type, data):
+    """Handle multipart/mixed batch request, sub-requests run concurrently.
+
+    Returns content type and body of the multipart/mixed response.
+    """
+    calls = _parse_batch(content_type, data)
+    compute.requests["batched"] += len(calls)
+
+    with ThreadPoolExecutor(max(len(calls), 1)) as executor:
+        results = list(executor.map(lambda call: dispatch(compute, *call[1:]), calls))
+
+    return _encode_batch([call[0] for call in calls], results)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    # keep connections alive like the real API does
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, status, body, content_type="application/json"):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length)
+
+    def _handle(self):
+        compute = self.server.compute
+        compute.requests[self.command] += 1
+        data = self._body()
+        if self.path.startswith("/batch/") and self.command == "POST":
+            content_type, body = dispatch_batch(
+                compute, self.headers["Content-Type"], data
+            )
+            return 200, body, content_type
+        return dispatch(compute, self.command, self.path, json.loads(data or b"{}"))
+
+    def do_GET(self):  # pylint: disable=invalid-name # BaseHTTPRequestHandler API
+        self._reply(*self._handle())
+
+    do_POST = do_GET
+    do_DELETE = do_GET
+
+    def log_message(self, *args):
+        if self.server.verbose:
+            super().log_message(*args)
+
+
+class FakeComputeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=8085, verbose=False, **kwargs):
+        super().__init__(("127.0.0.1", port), RequestHandler)
+        self.compute = FakeCompute(**kwargs)
+        self.verbose = verbose
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8085)
+    parser.add_argument("--latency", type=float, default=2.0)
+    parser.add_argument("--throttle", type=int, default=0, help="429 every N calls")
+    parser.add_argument("--fail", nargs="*", default=[], help="resources to fail")
+    arguments = parser.parse_args()
+    server = FakeComputeServer(
+        arguments.port,
+        verbose=True,
+        latency=arguments.latency,
+        fail=arguments.fail,
+        throttle=arguments.throttle,
+    )
+    server.serve_forever()
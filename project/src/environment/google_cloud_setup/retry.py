@@ -0,0 +1,135 @@
+import json
+import time
+import random
+import threading
+from collections import namedtuple
+
+from requests.exceptions import HTTPError, Timeout
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+
+RetryPolicy = namedtuple(
+    "RetryPolicy", ["max_attempts", "base_delay", "max_delay"], defaults=[1.0, 32.0]
+)
+
+# default limit of API calls per second for the project, shared by all threads
+API_RATE = 20
+
+# reasons of 400/403 errors which go away by themselves
+RETRYABLE_REASONS = {
+    "rateLimitExceeded",
+    "userRateLimitExceeded",
+    "resourceNotReady",
+    "backendError",
+}
+# codes of failed operations which go away by themselves
+RETRYABLE_OPERATION_CODES = {
+    "RATE_LIMIT_EXCEEDED",
+    "RESOURCE_OPERATION_RATE_EXCEEDED",
+    "RESOURCE_NOT_READY",
+    "ZONE_RESOURCE_POOL_EXHAUSTED",
+    "INTERNAL_ERROR",
+}
+
+
+class OperationError(Exception):
+    """Compute Engine operation finished with errors."""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def _error_reasons(response) -> set:
+    try:
+        error = json.loads(response.content).get("error", {})
+    except (ValueError, AttributeError):
+        return set()
+    return {x.get("reason") for x in error.get("errors", [])}
+
+
+def is_retryable_response(response) -> bool:
+    """API response with a transient error: rate limit, 5xx, resource not ready."""
+    status = response.status_code
+    transient = status == 429 or status >= 500
+    if status in (400, 403):
+        transient = bool(_error_reasons(response) & RETRYABLE_REASONS)
+    return transient
+
+
+def is_retryable(exception: Exception) -> bool:
+    """Transient errors are worth to retry: rate limits, 5xx, resources not ready.
+
+    Permanent errors, e.g. bad request, permission denied or quota exceeded,
+    are returned right away.
+    """
+    transient = (TimeoutError, RequestsConnectionError, Timeout)
+    retryable = isinstance(exception, transient)
+    if isinstance(exception, HTTPError) and exception.response is not None:
+        retryable = is_retryable_response(exception.response)
+    elif isinstance(exception, OperationError):
+        codes = {x.get("code") for x in exception.errors}
+        retryable = bool(codes) and codes <= RETRYABLE_OPERATION_CODES
+    return retryable
+
+
+def backoff_delay(
+    policy: RetryPolicy, attempt: int, exceptions: list = (), responses: list = ()
+) -> float:
+    """Exponential backoff with full jitter, not less than server's Retry-After."""
+    delay = random.uniform(0, min(policy.max_delay, policy.base_delay * 2**attempt))
+    responses = list(responses) + [getattr(x, "response", None) for x in exceptions]
+    for response in responses:
+        retry_after = (
+            response.headers.get("Retry-After") if response is not None else None
+        )
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+    return delay
+
+
+class TokenBucket:
+    """Thread-safe token bucket.
+
+    `acquire` takes tokens at once and waits for the debt to be refilled,
+    so waiting threads are served in order and a big batch can't starve.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        """Constructor.
+
+        Args:
+            rate (float): tokens added per second
+            capacity (float): max number of tokens, bursts size, rate if None
+        """
+        self._rate = rate
+        self._capacity = capacity or rate
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 1) -> float:
+        """Take tokens, returns time waited for them, seconds."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self._capacity, self._tokens + (now - self._updated) * self._rate
+            )
+            self._updated = now
+            self._tokens -= tokens
+            wait = max(0.0, -self._tokens / self._rate)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+_buckets = {}
+_lock = threading.Lock()
+
+
+def get_bucket(key: str, rate: float = API_RATE) -> TokenBucket:
+    """Process-wide token bucket, e.g. per project, shared by all controllers."""
+    with _lock:
+        if key not in _buckets:
+            _buckets[key] = TokenBucket(rate)
+        return _buckets[key]
@@ -2,12 +2,13 @@ import os
 import stat
 import json
 
-from google.auth.transport import requests
-from google.oauth2 import service_account
 from cryptography.hazmat.primitives import serialization as crypto_serialization
 from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.hazmat.backends import default_backend as crypto_default_backend
 
+from src.classes.tracing import span, traced
+from src.environment.google_cloud_setup.auth import get_session
+
 
 class SshManager:
     """Manage ssh key pair creation and adding public key to the cloud."""
@@ -19,13 +20,12 @@ class SshManager:
         self._private_key = None
         self._public_key = None
 
-        service_key = project.credentials["service-acc-key"]
-        scopes = project.credentials["access-scopes"]
-        credentials = service_account.Credentials.from_service_account_file(
-            service_key, scopes=scopes
+        self._api = project.credentials.get(
+            "api-endpoint", "https://compute.googleapis.com/compute/v1"
         )
-        self._session = requests.AuthorizedSession(credentials=credentials)
+        self._session = get_session(project.credentials)
 
+    @traced()
     def create_keys(self, private_key_file=None, pub_key_file=None):
         key = rsa.generate_private_key(
             backend=crypto_default_backend(), public_exponent=65537, key_size=2048
@@ -54,21 +54,21 @@ class SshManager:
             with open(pub_key_file, "w") as file:
                 file.write(self._public_key)
 
+    @traced()
     def get_fingerprint(self):
         method = "GET"
-        url = f"https://compute.googleapis.com/compute/v1/projects/{self._project.id}"
+        url = f"{self._api}/projects/{self._project.id}"
 
-        response = self._session.request(method=method, url=url)
+        with span(f"{method} SshManager", "api", url=url):
+            response = self._session.request(method=method, url=url)
         response_data = json.loads(response.content)
         return response_data.get("commonInstanceMetadata").get("fingerprint")
 
+    @traced()
     def send_pub_key_to_cloud(self):
         fingerprint = self.get_fingerprint()
         method = "POST"
-        url = (
-            f"https://compute.googleapis.com/compute/v1/projects/{self._project.id}"
-            "/setCommonInstanceMetadata"
-        )
+        url = f"{self._api}/projects/{self._project.id}" "/setCommonInstanceMetadata"
         body = {
             "fingerprint": fingerprint,
             "items": [
@@ -78,5 +78,8 @@ class SshManager:
                 }
             ],
         }
-        response = self._session.request(method=method, url=url, data=json.dumps(body))
+        with span(f"{method} SshManager", "api", url=url):
+            response = self._session.request(
+                method=method, url=url, data=json.dumps(body)
+            )
         return response
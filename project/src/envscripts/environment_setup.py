@@ -1,25 +1,134 @@
 import os
+import time
 import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 from pyats import aetest, topology
 import ansible_runner
 
 import src
+from src.classes.formatters import log_table_ansible_timing, log_table_grid_deployment
 from src.classes.remote_tools import SeleniumGrid
+from src.classes.tracing import span, tracer
 from src.environment.google_cloud_setup import builder
 
 
 _log = logging.getLogger(__name__)
 
 
-parameters = {"root": src.__path__[0]}
+parameters = {"root": src.__path__[0], "reconcile": False, "trace_file": None}
+
+
+def _task_timings(events, top: int = 15) -> list:
+    """Playbook totals and the slowest tasks from ansible-runner events.
+
+    Duration of a task is the max across hosts, as hosts run it in parallel.
+    """
+    tasks = {}
+    for event in events:
+        data = event.get("event_data", {})
+        if not event.get("event", "").startswith("runner_on_"):
+            continue
+        if data.get("duration") is None:
+            continue
+        playbook = os.path.basename(data.get("task_path", "").split(":")[0])
+        key = (playbook, data.get("task", ""))
+        row = tasks.setdefault(
+            key,
+            {
+                "playbook": playbook,
+                "task": key[1],
+                "hosts": 0,
+                "max": 0.0,
+                "total": 0.0,
+            },
+        )
+        row["hosts"] += 1
+        row["max"] = max(row["max"], data["duration"])
+        row["total"] += data["duration"]
+
+    playbooks = {}
+    for row in tasks.values():
+        total = playbooks.setdefault(
+            row["playbook"],
+            {"playbook": row["playbook"], "task": "(all tasks)", "hosts": 0},
+        )
+        total["hosts"] = max(total["hosts"], row["hosts"])
+        total["max"] = total.get("max", 0.0) + row["max"]
+        total["total"] = total.get("total", 0.0) + row["total"]
+    slowest = sorted(tasks.values(), key=lambda x: x["max"], reverse=True)[:top]
+    return sorted(playbooks.values(), key=lambda x: x["max"], reverse=True) + slowest
+
+
+def _trace_tasks(group: str, started: float, events) -> None:
+    """Add ansible tasks to the trace, one row per host of the group.
+
+    Task times are relative to the first task of the run, anchored at the
+    time the run was started, as runner timestamps have no timezone.
+    """
+    tasks = []
+    for event in events:
+        data = event.get("event_data", {})
+        if not event.get("event", "").startswith("runner_on_"):
+            continue
+        if data.get("duration") is None or not data.get("start"):
+            continue
+        tasks.append((datetime.fromisoformat(data["start"]), event["event"], data))
+    if not tasks:
+        return
+    first = min(x[0] for x in tasks)
+    for start, result, data in tasks:
+        tracer.add(
+            data.get("task", ""),
+            started + (start - first).total_seconds(),
+            data["duration"],
+            "ansible",
+            thread=f"ansible {group} {data.get('host', '')}",
+            playbook=os.path.basename(data.get("task_path", "").split(":")[0]),
+            result=result[len("runner_on_") :],
+        )
+
+
+def _trace_playbook(group: str, playbook: str, started: float):
+    """Callback for the finished run, adds whole playbook run to the trace."""
+
+    def finished(runner):
+        tracer.add(
+            f"ansible {playbook}",
+            started,
+            time.time() - started,
+            "ansible",
+            thread=f"ansible {group}",
+            status=runner.status,
+        )
+
+    return finished
+
+
+def _plays(provisioned: list, baked: bool, ansible_groups: dict) -> list:
+    """(group, playbook, hosts) runs needed to bring instances up to date.
+
+    Instances created by this run get the whole main.yml unless they boot
+    from baked images. The SUT is updated on the rest of the proxy group on
+    every run, reused instances included.
+    """
+    plays = []
+    for group, names in ansible_groups.items():
+        hosts = [] if baked else [x for x in names if x in provisioned]
+        if hosts:
+            plays.append((group, "main.yml", hosts))
+        rest = [x for x in names if x not in hosts]
+        if group == "proxy" and rest:
+            plays.append((group, os.path.join("playbooks", "proxy.yml"), rest))
+    return plays
 
 
 class GoogleCloudSetup(aetest.Testcase):
     """Creating Google Cloud setup."""
 
     @aetest.test
-    def main(self, steps, root, service_key):
+    def main(self, steps, root, service_key, reconcile):
         print(service_key)
         _build_file = os.path.join(
             root, "environment", "google_cloud_setup", "setup.config.yaml"
@@ -29,15 +138,28 @@ class GoogleCloudSetup(aetest.Testcase):
             root, "environment", "ansible", "group_vars", "all"
         )
         _ansible_hosts = os.path.join(root, "environment", "ansible", "myhosts.ini")
+        _ansible_root = os.path.join(root, "environment", "ansible")
         _ssh_file = os.path.join(
             root, "environment", "google_cloud_setup", "cloud_access.key"
         )
         try:
-            setup = builder.Builder(build_file=_build_file, service_acc_key=service_key)
-            with steps.start("Executing main building scenario"):
-                setup.execute_setup_scenario()
+            setup = builder.Builder(
+                build_file=_build_file,
+                service_acc_key=service_key,
+                playbooks=_ansible_root,
+            )
+            # keys are needed by image baking, before instances are created
             with steps.start("Generating SSH keys"):
                 setup.add_ssh_keys(private_key_file=_ssh_file)
+            if reconcile:
+                with steps.start("Reconciling existing setup"):
+                    setup.execute_reconcile_scenario()
+            else:
+                with steps.start("Executing main building scenario"):
+                    setup.execute_setup_scenario()
+            self.parent.parameters["provisioned"] = setup.provisioned
+            self.parent.parameters["baked"] = setup.baked
+            self.parent.parameters["ansible_groups"] = setup.ansible_groups
             with steps.start("Generating ansible config files"):
                 setup.generate_ansible_configs(
                     general=_ansible_general, groups=_ansible_hosts
@@ -45,20 +167,44 @@ class GoogleCloudSetup(aetest.Testcase):
             with steps.start("Generating testbed"):
                 setup.generate_testbed(testbed_file=_testbed)
         except Exception as exp:
-            self.errored(f"{exp} occured!", goto=["exit"])
+            self.errored(f"{exp} occured!", goto=["common_cleanup"])
 
 
 class AnsibleSetup(aetest.Testcase):
     """Run playbooks. Setup docker, tshark and proxy."""
 
     @aetest.test
-    def main(self, root):
+    def main(self, root, provisioned, baked, ansible_groups):
         _ansible_root = os.path.join(root, "environment", "ansible")
-
+        # one run per group and playbook, so proxy and users playbooks go in parallel
+        runs = {}
         try:
-            ansible_runner.run(project_dir=_ansible_root, playbook="main.yml")
+            for group, playbook, hosts in _plays(provisioned, baked, ansible_groups):
+                started = time.time()
+                thread, runner = ansible_runner.run_async(
+                    project_dir=_ansible_root,
+                    playbook=playbook,
+                    limit=",".join(hosts),
+                    quiet=True,
+                    finished_callback=_trace_playbook(group, playbook, started),
+                )
+                runs[(group, playbook)] = (thread, runner, started)
+            for thread, _, _ in runs.values():
+                thread.join()
         except Exception as exp:
-            self.errored(f"{exp} occured!", goto=["exit"])
+            self.errored(f"{exp} occured!", goto=["common_cleanup"])
+
+        failed = []
+        for (group, playbook), (_, runner, started) in runs.items():
+            _trace_tasks(group, started, runner.events)
+            _log.info(log_table_ansible_timing(group, _task_timings(runner.events)))
+            if runner.rc != 0:
+                _log.error(runner.stdout.read())
+                failed.append(f"{group} ({playbook})")
+        if failed:
+            self.errored(
+                f"Playbooks failed for groups {failed}", goto=["common_cleanup"]
+            )
 
 
 class DeployGrid(aetest.Testcase):
@@ -77,13 +223,36 @@ class DeployGrid(aetest.Testcase):
 
     @aetest.test
     def main(self, grid_servers):
-        for server in grid_servers:
-            grid = SeleniumGrid(server)
-            grid.up()
+        def deploy(server):
+            with span("SeleniumGrid.deploy", "grid", device=server.name) as details:
+                try:
+                    timings = SeleniumGrid(server).deploy()
+                    details.update(timings)
+                    return timings
+                except Exception as exp:  # pylint: disable=broad-except
+                    _log.error(f"Selenium grid is not deployed on {server.name}: {exp}")
+                    return None
+
+        # devices are independent, deployment time doesn't grow with their count
+        with ThreadPoolExecutor(max(len(grid_servers), 1)) as executor:
+            deployments = executor.map(deploy, grid_servers)
+            timings = {
+                server.name: result for server, result in zip(grid_servers, deployments)
+            }
+        _log.info(log_table_grid_deployment(timings))
+
+        failed = [name for name, result in timings.items() if result is None]
+        if failed:
+            self.failed(f"Selenium grid is not deployed on {failed}")
 
 
 class CommonCleanup(aetest.CommonCleanup):
-    pass
+    @aetest.subsection
+    def save_trace(self, root, trace_file):
+        """Save spans of the environment build as Chrome trace-event JSON."""
+        trace_file = trace_file or os.path.join(root, "environment_trace.json")
+        tracer.save(trace_file)
+        _log.info(f"Environment build trace saved to {trace_file}")
 
 
 if __name__ == "__main__":
@@ -97,6 +266,12 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="standalone parser")
     parser.add_argument("--service-key", dest="service_key")
+    parser.add_argument("--reconcile", action="store_true")
+    parser.add_argument("--trace-file", dest="trace_file")
 
     args, sys.argv[1:] = parser.parse_known_args(sys.argv[1:])
-    aetest.main(service_key=args.service_key)
+    aetest.main(
+        service_key=args.service_key,
+        reconcile=args.reconcile,
+        trace_file=args.trace_file,
+    )
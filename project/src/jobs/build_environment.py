@@ -20,7 +20,27 @@ def main(runtime):
 
     parser = argparse.ArgumentParser(description="standalone parser")
     parser.add_argument("--service-key", dest="service_key")
+    parser.add_argument(
+        "--reconcile",
+        action="store_true",
+        help="reuse existing up to date instances instead of building from scratch",
+    )
+    parser.add_argument(
+        "--trace-file",
+        dest="trace_file",
+        help="Chrome trace-event JSON of the build, environment_trace.json in "
+        "the job archive by default",
+    )
     args, sys.argv[1:] = parser.parse_known_args(sys.argv[1:])
+    trace_file = args.trace_file or os.path.join(
+        runtime.directory, "environment_trace.json"
+    )
 
     testscript = os.path.join(_scripts_dir, "environment_setup.py")
-    run(runtime=runtime, testscript=testscript, service_key=args.service_key)
+    run(
+        runtime=runtime,
+        testscript=testscript,
+        service_key=args.service_key,
+        reconcile=args.reconcile,
+        trace_file=trace_file,
+    )
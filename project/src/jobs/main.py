@@ -1,29 +1,75 @@
 import os
 import logging
 
-from pyats.easypy import run
+import yaml
+from pyats.datastructures.logic import Not, Or
 
 import src
+from src.classes.session import JobSession
+from src.classes.scheduler import JobTask, ParallelRunner
 
 
 _scripts_dir = os.path.join(src.__path__[0], "testscripts")
 _datafile_dir = os.path.join(src.__path__[0], "datafiles")
 
 
+def _host_support_hosts() -> list:
+    """Hosts of all HostSupport* testcases from the browser datafile."""
+    with open(os.path.join(_datafile_dir, "browser.yaml")) as file:
+        host_support = yaml.safe_load(file)["parameters"]["host_support"]
+    return [host for hosts in host_support.values() for host in hosts]
+
+
 def main(runtime):
 
     logging.getLogger().setLevel(logging.INFO)
     logging.getLogger("unicon").setLevel(logging.ERROR)
 
-    tasks = (
-        ("socks.py", "socks.yaml"),
-        ("tls.py", "tls.yaml"),
-        ("browser.py", "browser.yaml"),
+    # `{user}` - whole user device assigned to the task, `capture@proxy-vm` -
+    # traffic capture on the proxy, shared by all user devices
+    capture = ("{user}", "capture@proxy-vm")
+    host_support = (
+        "HostSupportCloudFlare",
+        "HostSupportApache",
+        "HostSupportNginx",
+        "HostSupportMicrosoftIIS",
+        "HostSupportGWS",
+        "HostSupportAmazon",
     )
+    users = [name for name in runtime.testbed.devices if name.startswith("user")]
+    runner = ParallelRunner(runtime, user_devices=users)
 
-    for script, data in tasks:
-
-        testscript = os.path.join(_scripts_dir, script)
-        datafile = os.path.join(_datafile_dir, data)
+    tasks = (
+        JobTask(
+            "socks_capture",
+            "socks.py",
+            "socks.yaml",
+            capture,
+            Or("common_setup", "SocksHandshakeSuccess", "common_cleanup"),
+        ),
+        JobTask(
+            "socks_curl",
+            "socks.py",
+            "socks.yaml",
+            ("{user}",),
+            Not("SocksHandshakeSuccess"),
+        ),
+        JobTask("tls", "tls.py", "tls.yaml", capture),
+        JobTask("browser", "browser.py", "browser.yaml", capture, Not(*host_support)),
+        # host support iterations are split across all user devices
+        *runner.shard(
+            JobTask("browser_hosts", "browser.py", "browser.yaml", ("{user}",)),
+            looped=host_support,
+            items=_host_support_hosts(),
+        ),
+    )
+    tasks = [
+        task._replace(
+            testscript=os.path.join(_scripts_dir, task.testscript),
+            datafile=os.path.join(_datafile_dir, task.datafile),
+        )
+        for task in tasks
+    ]
 
-        run(runtime=runtime, testscript=testscript, datafile=datafile)
+    with JobSession(runtime.testbed, grid_devices=users) as session:
+        return runner.run(tasks, **session.parameters)
@@ -1,5 +1,6 @@
 # pylint: disable=no-self-use # pyATS-related exclusion
 # pylint: disable=attribute-defined-outside-init # pyATS-related exclusion
+import os
 import statistics
 import logging
 from pprint import pformat
@@ -7,19 +8,51 @@ from pprint import pformat
 from pyats import aetest
 
 from src.classes.remote_tools import SeleniumGrid
+from src.classes.sut import LocalProxy
 from src.classes.clients import Chrome, ChromeAsync
 from src.classes.page_objects import AuthPage, PageForNavigation
-from src.classes.analyse import BrowserResponseAnalyzer
-from src.classes.formatters import log_table_time, log_table_resources
+from src.classes.tshark_pcap import TsharkPcap
+from src.classes.scheduler import shard_items
+from src.classes.utils import _temp_files_dir
+from src.classes.analyse import BrowserResponseAnalyzer, ConnectionLatencyAnalyzer
+from src.classes.formatters import (
+    log_table_time,
+    log_table_resources,
+    log_table_connections,
+)
 
 
 _log = logging.getLogger(__name__)
 
 
+def _prefetch_pages(user, proxy, hosts: list, pool_size: int = None) -> dict:
+    """Load hosts concurrently over a pool of browser sessions.
+
+    Returns stats by host, empty if the pool is disabled.
+    """
+    if not pool_size or not hosts:
+        return {}
+    with ChromeAsync(
+        grid_server=user,
+        proxy_server=proxy,
+        max_num_of_instances=min(pool_size, len(hosts)),
+    ) as chrome:
+        return chrome.get_each(hosts)
+
+
+def _page_stats(prefetched: dict, user, proxy, host: str) -> dict:
+    """Stats of the prefetched host or of a new single browser session."""
+    if host in prefetched:
+        return prefetched[host]
+    with Chrome(grid_server=user, proxy_server=proxy) as chrome:
+        chrome.get(host)
+        return chrome.get_stats()
+
+
 class CommonSetup(aetest.CommonSetup):
     @aetest.subsection
-    def update_testscript_parameters(self, testbed):
-        user_device = testbed.devices["user-2"]
+    def update_testscript_parameters(self, testbed, user_name="user-2"):
+        user_device = testbed.devices[user_name]
         proxy_device = testbed.devices["proxy-vm"]
         self.parent.parameters.update(
             {
@@ -29,44 +62,41 @@ class CommonSetup(aetest.CommonSetup):
         )
 
     @aetest.subsection
-    def start_selenium(self, user):
+    def start_selenium(self, user, shared_session=False):
         grid = SeleniumGrid(user)
         self.parent.parameters.update({"grid": grid})
-        grid.start()
+        if shared_session:
+            grid.attach()
+        else:
+            grid.start()
 
 
-class HostSupportCloudFlare(aetest.Testcase):
-    @aetest.setup
-    def setup_loops(self):
-        aetest.loop.mark(self.cloud_flare_test, host=self.parameters["hosts"])
+class HostSupport:
+    """Checks shared by HostSupport* testcases.
 
-    @aetest.test
-    def cloud_flare_test(self, proxy, user, host):
+    Hosts of every testcase are listed in `host_support` parameter by class
+    name, hosts of all of them are loaded at once by the first one which runs,
+    so the pool of browser sessions is set up once per testscript.
+    """
 
-        with Chrome(grid_server=user, proxy_server=proxy) as chrome:
-            chrome.get(host)
-            stats = chrome.get_stats()
+    _test = None
 
-        data = BrowserResponseAnalyzer(stats)
-        status_code = data.get_status_code()
-        if status_code != 200:
-            _log.info(f"Web Brower logs:\n{pformat(stats)}")
-            self.failed(
-                f"Invalid response, expected status code 200, got {status_code}!"
-            )
-
-
-class HostSupportApache(aetest.Testcase):
     @aetest.setup
-    def setup_loops(self):
-        aetest.loop.mark(self.apache_test, host=self.parameters["hosts"])
-
-    @aetest.test
-    def apache_test(self, proxy, user, host):
+    def setup_loops(
+        self, user, proxy, host_support, shard=None, host_support_pool=None
+    ):
+        if "prefetched" not in self.parent.parameters:
+            hosts = [x for y in host_support.values() for x in shard_items(y, shard)]
+            self.parent.parameters["prefetched"] = _prefetch_pages(
+                user, proxy, hosts, host_support_pool
+            )
+        hosts = shard_items(host_support[type(self).__name__], shard)
+        if not hosts:
+            self.skipped("No hosts in this shard")
+        aetest.loop.mark(getattr(self, self._test), host=hosts)
 
-        with Chrome(grid_server=user, proxy_server=proxy) as chrome:
-            chrome.get(host)
-            stats = chrome.get_stats()
+    def check_host(self, proxy, user, host, prefetched):
+        stats = _page_stats(prefetched, user, proxy, host)
 
         data = BrowserResponseAnalyzer(stats)
         status_code = data.get_status_code()
@@ -77,88 +107,52 @@ class HostSupportApache(aetest.Testcase):
             )
 
 
-class HostSupportNginx(aetest.Testcase):
-    @aetest.setup
-    def setup_loops(self):
-        aetest.loop.mark(self.nginx_test, host=self.parameters["hosts"])
+class HostSupportCloudFlare(HostSupport, aetest.Testcase):
+    _test = "cloud_flare_test"
 
     @aetest.test
-    def nginx_test(self, proxy, user, host):
-
-        with Chrome(grid_server=user, proxy_server=proxy) as chrome:
-            chrome.get(host)
-            stats = chrome.get_stats()
-
-        data = BrowserResponseAnalyzer(stats)
-        status_code = data.get_status_code()
-        if status_code != 200:
-            _log.info(f"Web Brower logs:\n{pformat(stats)}")
-            self.failed(
-                f"Invalid response, expected status code 200, got {status_code}!"
-            )
+    def cloud_flare_test(self, proxy, user, host, prefetched):
+        self.check_host(proxy, user, host, prefetched)
 
 
-class HostSupportMicrosoftIIS(aetest.Testcase):
-    @aetest.setup
-    def setup_loops(self):
-        aetest.loop.mark(self.microsoft_iis_test, host=self.parameters["hosts"])
+class HostSupportApache(HostSupport, aetest.Testcase):
+    _test = "apache_test"
 
     @aetest.test
-    def microsoft_iis_test(self, proxy, user, host):
-
-        with Chrome(grid_server=user, proxy_server=proxy) as chrome:
-            chrome.get(host)
-            stats = chrome.get_stats()
-
-        data = BrowserResponseAnalyzer(stats)
-        status_code = data.get_status_code()
-        if status_code != 200:
-            _log.info(f"Web Brower logs:\n{pformat(stats)}")
-            self.failed(
-                f"Invalid response, expected status code 200, got {status_code}!"
-            )
+    def apache_test(self, proxy, user, host, prefetched):
+        self.check_host(proxy, user, host, prefetched)
 
 
-class HostSupportGWS(aetest.Testcase):
-    @aetest.setup
-    def setup_loops(self):
-        aetest.loop.mark(self.gws_test, host=self.parameters["hosts"])
+class HostSupportNginx(HostSupport, aetest.Testcase):
+    _test = "nginx_test"
 
     @aetest.test
-    def gws_test(self, proxy, user, host):
+    def nginx_test(self, proxy, user, host, prefetched):
+        self.check_host(proxy, user, host, prefetched)
 
-        with Chrome(grid_server=user, proxy_server=proxy) as chrome:
-            chrome.get(host)
-            stats = chrome.get_stats()
 
-        data = BrowserResponseAnalyzer(stats)
-        status_code = data.get_status_code()
-        if status_code != 200:
-            _log.info(f"Web Brower logs:\n{pformat(stats)}")
-            self.failed(
-                f"Invalid response, expected status code 200, got {status_code}!"
-            )
+class HostSupportMicrosoftIIS(HostSupport, aetest.Testcase):
+    _test = "microsoft_iis_test"
 
+    @aetest.test
+    def microsoft_iis_test(self, proxy, user, host, prefetched):
+        self.check_host(proxy, user, host, prefetched)
 
-class HostSupportAmazon(aetest.Testcase):
-    @aetest.setup
-    def setup_loops(self):
-        aetest.loop.mark(self.amazon_test, host=self.parameters["hosts"])
+
+class HostSupportGWS(HostSupport, aetest.Testcase):
+    _test = "gws_test"
 
     @aetest.test
-    def amazon_test(self, proxy, user, host):
+    def gws_test(self, proxy, user, host, prefetched):
+        self.check_host(proxy, user, host, prefetched)
 
-        with Chrome(grid_server=user, proxy_server=proxy) as chrome:
-            chrome.get(host)
-            stats = chrome.get_stats()
 
-        data = BrowserResponseAnalyzer(stats)
-        status_code = data.get_status_code()
-        if status_code != 200:
-            _log.info(f"Web Brower logs:\n{pformat(stats)}")
-            self.failed(
-                f"Invalid response, expected status code 200, got {status_code}!"
-            )
+class HostSupportAmazon(HostSupport, aetest.Testcase):
+    _test = "amazon_test"
+
+    @aetest.test
+    def amazon_test(self, proxy, user, host, prefetched):
+        self.check_host(proxy, user, host, prefetched)
 
 
 class WebsiteResourcesLoading(aetest.Testcase):
@@ -370,6 +364,60 @@ class LoadingTime(aetest.Testcase):
                 )
 
 
+class ConnectionLatencyBreakdown(aetest.Testcase):
+    @aetest.setup
+    def setup_loops(self, shard=None):
+        hosts = shard_items(self.parameters["hosts"], shard)
+        if not hosts:
+            self.skipped("No hosts in this shard")
+        aetest.loop.mark(self.latency_breakdown_test, host=hosts)
+
+    @aetest.test
+    def latency_breakdown_test(self, steps, proxy, user, host, max_relay_delay):
+
+        with steps.start("Loading page with traffic capturing"):
+            with Chrome(
+                grid_server=user, proxy_server=proxy, traffic_dump=True
+            ) as chrome:
+                chrome.get(host)
+
+        with steps.start("Correlating captures"):
+            grid_pcap = TsharkPcap(
+                os.path.join(_temp_files_dir, f"{user.name}_tshark.pcap")
+            )
+            grid_streams = grid_pcap.tcp_timeline()
+            # both proxy legs are captured on the user device in local mode
+            proxy_streams = grid_streams
+            client_ip = None
+            if proxy.type != LocalProxy.device_type:
+                # proxy capture has connections of tests running on other devices
+                net_ifs = user.interfaces.names.pop()
+                client_ip = user.interfaces[net_ifs].ipv4.ip.compressed
+                proxy_pcap = TsharkPcap(
+                    os.path.join(_temp_files_dir, f"{proxy.name}_tshark.pcap")
+                )
+                proxy_streams = proxy_pcap.tcp_timeline()
+
+        with steps.start("Anylizing results"):
+            data = ConnectionLatencyAnalyzer(
+                grid_streams, proxy_streams, client_ip=client_ip
+            )
+            summary = data.get_summary()
+            _log.info(log_table_connections(summary))
+
+            slow_hosts = [
+                name
+                for name, metrics in summary.items()
+                for metric in ("relay_upstream", "relay_downstream")
+                if metrics[metric] and metrics[metric]["p95"] > max_relay_delay
+            ]
+            if slow_hosts:
+                self.failed(
+                    f"Relay delay exceeded {max_relay_delay} ms for {set(slow_hosts)}",
+                    goto=["next_tc"],
+                )
+
+
 class AuthenticationOAUTH(aetest.Testcase):
     @aetest.test
     def test_login(self, proxy, user, email, services_pass, mailbox_pass):
@@ -487,7 +535,9 @@ class MultipleTabsLoading(aetest.Testcase):
 
 class CommonCleanup(aetest.CommonCleanup):
     @aetest.subsection
-    def stop_selenium(self, user):
+    def stop_selenium(self, user, shared_session=False):
+        if shared_session:
+            self.skipped("Selenium grid is stopped by the job session")
         grid = SeleniumGrid(user)
         grid.stop()
 
@@ -0,0 +1,224 @@
+# pylint: disable=no-self-use # pyATS-related exclusion
+# pylint: disable=attribute-defined-outside-init # pyATS-related exclusion
+import logging
+from pprint import pformat
+
+from pyats import aetest
+
+from src.classes.remote_tools import BulkServer, SeleniumGrid
+from src.classes.sut import LocalProxy, ProxyMonitor
+from src.classes.clients import Curl
+from src.classes.load import LoadGenerator, LoadProfile
+from src.classes.analyse import (
+    LoadResponseAnalyzer,
+    ProxyResourcesAnalyzer,
+    ThroughputAnalyzer,
+)
+from src.classes.formatters import log_table_load
+
+
+_log = logging.getLogger(__name__)
+
+
+class CommonSetup(aetest.CommonSetup):
+    @aetest.subsection
+    def update_testscript_parameters(self, testbed, user_name="user-2"):
+        user_device = testbed.devices[user_name]
+        proxy_device = testbed.devices["proxy-vm"]
+        self.parent.parameters.update(
+            {
+                "user": user_device,
+                "proxy": proxy_device,
+            }
+        )
+
+    @aetest.subsection
+    def start_selenium(self, user, shared_session=False):
+        grid = SeleniumGrid(user)
+        if shared_session:
+            grid.attach()
+        else:
+            grid.start()
+
+
+class ProxyLoadCurve(aetest.Testcase):
+    @aetest.setup
+    def setup_loops(self):
+        aetest.loop.mark(
+            self.load_curve_test,
+            uids=self.parameters["sections_uids"],
+            client=self.parameters["clients"],
+            target_concurrency=self.parameters["target_concurrency"],
+        )
+
+    @aetest.test
+    def load_curve_test(
+        self, steps, proxy, user, hosts, client, profile, target_concurrency
+    ):
+
+        load_profile = LoadProfile(
+            steps=profile["steps"],
+            step_duration=profile["step_duration"],
+            target_concurrency=target_concurrency,
+        )
+        with steps.start(f"Ramping load up to {target_concurrency} {client} sessions"):
+            with LoadGenerator(
+                client_server=user,
+                proxy_server=proxy,
+                hosts=hosts,
+                profile=load_profile,
+                client=client,
+                resources_interval=profile.get("resources_interval"),
+                supervise=profile.get("supervise", False),
+            ) as generator:
+                samples = generator.run()
+            resources = generator.resources
+            supervision = generator.supervision
+            started_at = generator.started_at
+
+        with steps.start("Anylizing results"):
+            data = LoadResponseAnalyzer(samples, step_duration=profile["step_duration"])
+            curve = data.get_curve()
+
+            console_log = log_table_load(hosts=hosts, client=client, curve=curve)
+            _log.info(console_log)
+            _log.info(f"Load timeline:\n{pformat(data.get_timeline())}")
+
+            saturation = data.get_saturation_point()
+            if saturation is not None:
+                _log.info(
+                    f"Proxy saturated at {saturation['concurrency']} concurrent "
+                    f"sessions, {saturation['throughput']} req/s"
+                )
+
+            if resources is not None:
+                usage = ProxyResourcesAnalyzer(resources, started=started_at)
+                duration = profile["step_duration"]
+                for stat in curve:
+                    step_usage = usage.get_summary(
+                        start=(stat["step"] - 1) * duration, end=stat["step"] * duration
+                    )
+                    _log.info(
+                        f"Proxy resources at {stat['concurrency']} concurrent "
+                        f"sessions:\n{pformat(step_usage)}"
+                    )
+
+            if supervision is not None and supervision["restarts"]:
+                self.failed(
+                    f"Proxy crashed under load and was restarted "
+                    f"{supervision['restarts']} times, time to ready: "
+                    f"{supervision['ready_times']}",
+                    goto=["next_tc"],
+                )
+
+            overloaded = [
+                stat for stat in curve if stat["error_rate"] > profile["max_error_rate"]
+            ]
+            if overloaded:
+                self.failed(
+                    f"Error rate exceeded {profile['max_error_rate']} starting from "
+                    f"{overloaded[0]['concurrency']} concurrent sessions",
+                    goto=["next_tc"],
+                )
+
+
+class BulkThroughput(aetest.Testcase):
+    @aetest.setup
+    def setup(self, testbed, user, server_name):
+        self.bulk_server = None
+        # server on another device, so both direct and proxied transfers
+        # cross the network instead of the loopback of the client device
+        if server_name == user.name:
+            self.errored("Bulk server must run on other device than the client")
+        self.bulk_server = BulkServer(testbed.devices[server_name])
+        self.bulk_server.start()
+        aetest.loop.mark(
+            self.throughput_test,
+            uids=self.parameters["sections_uids"],
+            direction=self.parameters["directions"],
+            streams=self.parameters["streams"],
+        )
+
+    @aetest.test
+    def throughput_test(
+        self, steps, proxy, user, direction, streams, size, runs, min_throughput_rate
+    ):
+        url = f"{self.bulk_server.url}/bytes/{size}"
+        upload_size = size if direction == "upload" else None
+
+        with steps.start(f"Transferring {runs} times over {streams} streams directly"):
+            with Curl(client_server=user, session_timeout=120) as curl:
+                direct = [curl.get_bulk(url, streams, upload_size) for _ in range(runs)]
+
+        with steps.start(f"Transferring {runs} times over {streams} streams via proxy"):
+            monitor = None
+            if proxy.type != LocalProxy.device_type:
+                monitor = ProxyMonitor(proxy)
+            with Curl(
+                client_server=user, proxy_server=proxy, session_timeout=120
+            ) as curl:
+                if monitor is not None:
+                    monitor.start()
+                try:
+                    proxied = [
+                        curl.get_bulk(url, streams, upload_size) for _ in range(runs)
+                    ]
+                finally:
+                    if monitor is not None:
+                        monitor.stop()
+
+        with steps.start("Comparing results"):
+            cpu_time = None
+            if monitor is not None:
+                cpu_time = ProxyResourcesAnalyzer(monitor.get_stats()).get_cpu_time()
+            data = ThroughputAnalyzer(proxied, direct, proxy_cpu_time=cpu_time)
+            throughput = data.get_throughput()
+            _log.info(
+                f"{direction} over {streams} streams, MB/s: proxy ON "
+                f"{throughput['proxied']}, proxy OFF {throughput['direct']}, "
+                f"proxy CPU per MB: {data.get_cpu_per_megabyte()} ms"
+            )
+
+            errors = data.get_errors()
+            if errors["proxied"]:
+                self.failed(
+                    f"{errors['proxied']} proxied transfers failed", goto=["next_tc"]
+                )
+
+            rate = data.get_throughput_rate()
+            if rate is not None and rate < min_throughput_rate:
+                self.failed(
+                    f"Throughput with proxy on is {rate:.2f} of the throughput"
+                    f" without proxy (min {min_throughput_rate})",
+                    goto=["next_tc"],
+                )
+
+    @aetest.cleanup
+    def cleanup(self):
+        if self.bulk_server is not None:
+            self.bulk_server.stop()
+
+
+class CommonCleanup(aetest.CommonCleanup):
+    @aetest.subsection
+    def stop_selenium(self, user, shared_session=False):
+        if shared_session:
+            self.skipped("Selenium grid is stopped by the job session")
+        grid = SeleniumGrid(user)
+        grid.stop()
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    from pyats import topology
+
+    _log.setLevel(logging.DEBUG)
+    logging.getLogger("unicon").setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser(description="standalone parser")
+    parser.add_argument("--testbed", dest="testbed", type=topology.loader.load)
+
+    args, sys.argv[1:] = parser.parse_known_args(sys.argv[1:])
+    aetest.main(testbed=args.testbed)
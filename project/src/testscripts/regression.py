@@ -1,5 +1,6 @@
 # pylint: disable=no-self-use # pyATS-related exclusion
 # pylint: disable=attribute-defined-outside-init # pyATS-related exclusion
+import os
 import logging
 import statistics
 from pprint import pformat
@@ -7,9 +8,10 @@ from pprint import pformat
 from pyats import aetest
 
 from src.classes.remote_tools import SeleniumGrid
-from src.classes.sut import Proxy
+from src.classes.sut import LocalProxy, ProxyMonitor, proxy_controller
 from src.classes.clients import Chrome, ChromeAsync
-from src.classes.analyse import BrowserResponseAnalyzer
+from src.classes.utils import _temp_files_dir
+from src.classes.analyse import BrowserResponseAnalyzer, ProxyResourcesAnalyzer
 from src.classes.formatters import log_table_time, log_table_resources
 
 
@@ -18,8 +20,8 @@ _log = logging.getLogger(__name__)
 
 class CommonSetup(aetest.CommonSetup):
     @aetest.subsection
-    def update_testscript_parameters(self, testbed):
-        user_device = testbed.devices["user-2"]
+    def update_testscript_parameters(self, testbed, user_name="user-2"):
+        user_device = testbed.devices[user_name]
         proxy_device = testbed.devices["proxy-vm"]
         self.parent.parameters.update(
             {
@@ -29,17 +31,24 @@ class CommonSetup(aetest.CommonSetup):
         )
 
     @aetest.subsection
-    def start_selenium(self, user):
+    def start_selenium(self, user, shared_session=False):
         grid = SeleniumGrid(user)
         self.parent.parameters.update({"grid": grid})
-        grid.start()
+        if shared_session:
+            grid.attach()
+        else:
+            grid.start()
 
 
 class ProxyDoesntShutAfterCacheCleaning(aetest.Testcase):
     @aetest.setup
     def setup(self, proxy):
-        self.proxy_connection = Proxy(proxy)
+        self.proxy_connection = proxy_controller(proxy)
         self.proxy_connection.start()
+        self.proxy_monitor = None
+        if proxy.type != LocalProxy.device_type:
+            self.proxy_monitor = ProxyMonitor(proxy)
+            self.proxy_monitor.start()
 
     @aetest.test
     def test_cache_cleaning(self, proxy, user, host, cleanings):
@@ -49,11 +58,33 @@ class ProxyDoesntShutAfterCacheCleaning(aetest.Testcase):
                 grid_server=user, proxy_server=proxy, session_wide_proxy=False
             ) as chrome:
                 chrome.get(host)
+            if self.proxy_monitor is not None:
+                self.proxy_monitor.collect()
             if not self.proxy_connection.is_alive():
                 self.failed(f"Proxy server shuted down after session `{i}`")
 
+    @aetest.test
+    def test_resources_not_leaking(self, max_fd_growth):
+        if self.proxy_monitor is None:
+            self.skipped("Resource sampling is not available for the local stand-in")
+
+        self.proxy_monitor.collect()
+        resources_file = os.path.join(_temp_files_dir, "proxy_resources.json")
+        data = ProxyResourcesAnalyzer(
+            self.proxy_monitor.get_stats(write_to_file=resources_file)
+        )
+        _log.info(f"Proxy resources usage:\n{pformat(data.get_summary())}")
+
+        growth = data.get_growth("fds")
+        if growth is not None and growth > max_fd_growth:
+            self.failed(
+                f"Proxy open file descriptors grew by {growth} after cache cleanings"
+            )
+
     @aetest.cleanup
     def cleanup(self):
+        if self.proxy_monitor is not None:
+            self.proxy_monitor.stop()
         self.proxy_connection.stop()
 
 
@@ -350,7 +381,9 @@ class MultipleTabsLoading(aetest.Testcase):
 
 class CommonCleanup(aetest.CommonCleanup):
     @aetest.subsection
-    def stop_selenium(self, user):
+    def stop_selenium(self, user, shared_session=False):
+        if shared_session:
+            self.skipped("Selenium grid is stopped by the job session")
         grid = SeleniumGrid(user)
         grid.stop()
 
@@ -11,7 +11,8 @@ from src.classes.remote_tools import SeleniumGrid
 from src.classes.clients import Chrome, Curl
 from src.classes.tshark_pcap import TsharkPcap
 from src.classes.utils import _temp_files_dir
-from src.classes.analyse import CurlResponseAnalyzer
+from src.classes.analyse import CurlTimingAnalyzer
+from src.classes.formatters import log_table_curl_timing
 
 
 _log = logging.getLogger(__name__)
@@ -19,8 +20,8 @@ _log = logging.getLogger(__name__)
 
 class CommonSetup(aetest.CommonSetup):
     @aetest.subsection
-    def update_testscript_parameters(self, testbed):
-        user_device = testbed.devices["user-2"]
+    def update_testscript_parameters(self, testbed, user_name="user-2"):
+        user_device = testbed.devices[user_name]
         proxy_device = testbed.devices["proxy-vm"]
         self.parent.parameters.update(
             {
@@ -30,9 +31,12 @@ class CommonSetup(aetest.CommonSetup):
         )
 
     @aetest.subsection
-    def start_selenium(self, user):
+    def start_selenium(self, user, shared_session=False):
         grid = SeleniumGrid(user)
-        grid.start()
+        if shared_session:
+            grid.attach()
+        else:
+            grid.start()
 
 
 class SocksHandshakeSuccess(aetest.Testcase):
@@ -52,24 +56,70 @@ class SocksHandshakeSuccess(aetest.Testcase):
 
 class StatusCodesCorrectTransfer(aetest.Testcase):
     @aetest.setup
-    def setup_loop(self):
+    def setup_loop(self, user, proxy, hosts):
+        with Curl(client_server=user, proxy_server=proxy, session_timeout=10) as curl:
+            responses = curl.get_batch(hosts)
+
         aetest.loop.mark(
-            self.test_code, host=self.parameters["hosts"], code=self.parameters["codes"]
+            self.test_code,
+            host=self.parameters["hosts"],
+            code=self.parameters["codes"],
+            response=responses,
         )
 
     @aetest.test
-    def test_code(self, user, proxy, host, code):
-
-        with Curl(client_server=user, proxy_server=proxy, session_timeout=10) as curl:
-            curl.get(host)
-            stats = curl.get_response()
+    def test_code(self, host, code, response):
 
-        data = CurlResponseAnalyzer(stats)
-        status_code = data.get_status_code()
+        status_code = response["status_code"]
         if status_code != code:
             self.failed(f"Expected status code {code}, got {status_code}")
 
 
+class CurlTimingOverhead(aetest.Testcase):
+    @aetest.setup
+    def setup_loops(self):
+        aetest.loop.mark(
+            self.curl_timing_test,
+            uids=self.parameters["sections_uids"],
+            host=self.parameters["hosts"],
+        )
+
+    @aetest.test
+    def curl_timing_test(self, steps, proxy, user, host, runs, delay_rate):
+
+        with steps.start("Collecting timings with proxy off"):
+            with Curl(client_server=user, session_timeout=10) as curl:
+                direct = curl.get_timing(host, runs=runs)
+
+        with steps.start("Collecting timings with proxy on"):
+            with Curl(
+                client_server=user, proxy_server=proxy, session_timeout=10
+            ) as curl:
+                proxied = curl.get_timing(host, runs=runs)
+
+        with steps.start("Comparing results"):
+            data = CurlTimingAnalyzer(proxied=proxied, direct=direct)
+            console_log = log_table_curl_timing(
+                host=host, runs=runs, summary=data.get_summary()
+            )
+            _log.info(console_log)
+
+            error_rate = data.get_error_rate()
+            if error_rate["proxied"] != 0:
+                self.failed(
+                    f"{error_rate['proxied']} of proxied transfers failed",
+                    goto=["next_tc"],
+                )
+
+            rate = data.get_delay_rate()
+            if rate is not None and rate > delay_rate:
+                self.failed(
+                    f"Median transfer time with proxy on exceeded the time without"
+                    f" proxy for {rate:.2f} times (max {delay_rate})",
+                    goto=["next_tc"],
+                )
+
+
 class HTTPNotSupported(aetest.Testcase):
     @aetest.test
     def connect_http(self, user, proxy, host):
@@ -115,7 +165,9 @@ class IncorrectProxyProtocol(aetest.Testcase):
 
 class CommonCleanup(aetest.CommonCleanup):
     @aetest.subsection
-    def stop_selenium(self, user):
+    def stop_selenium(self, user, shared_session=False):
+        if shared_session:
+            self.skipped("Selenium grid is stopped by the job session")
         grid = SeleniumGrid(user)
         grid.stop()
 
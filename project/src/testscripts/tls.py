@@ -20,8 +20,8 @@ _log = logging.getLogger(__name__)
 
 class CommonSetup(aetest.CommonSetup):
     @aetest.subsection
-    def update_testscript_parameters(self, testbed):
-        user_device = testbed.devices["user-2"]
+    def update_testscript_parameters(self, testbed, user_name="user-2"):
+        user_device = testbed.devices[user_name]
         proxy_device = testbed.devices["proxy-vm"]
         self.parent.parameters.update(
             {
@@ -31,9 +31,12 @@ class CommonSetup(aetest.CommonSetup):
         )
 
     @aetest.subsection
-    def start_selenium(self, user):
+    def start_selenium(self, user, shared_session=False):
         grid = SeleniumGrid(user)
-        grid.start()
+        if shared_session:
+            grid.attach()
+        else:
+            grid.start()
 
 
 class BrockenCerts(aetest.Testcase):
@@ -123,7 +126,9 @@ class TLSHandshake13(aetest.Testcase):
 
 class CommonCleanup(aetest.CommonCleanup):
     @aetest.subsection
-    def stop_selenium(self, user):
+    def stop_selenium(self, user, shared_session=False):
+        if shared_session:
+            self.skipped("Selenium grid is stopped by the job session")
         grid = SeleniumGrid(user)
         grid.stop()
 
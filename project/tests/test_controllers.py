@@ -0,0 +1,88 @@
+import unittest
+from unittest import mock
+
+from requests import Response
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+from src.environment.google_cloud_setup import components, controllers, fake_compute
+from src.environment.google_cloud_setup.retry import RetryPolicy
+
+
+API = "http://127.0.0.1:8085/compute/v1"
+NO_DELAY = RetryPolicy(max_attempts=3, base_delay=0, max_delay=0)
+
+
+def _response(status_code, body=b"{}", headers=None):
+    response = Response()
+    response.status_code = status_code
+    response._content = body
+    response.headers.update(headers or {})
+    return response
+
+
+class FakeSession:
+    """Session which raises or returns queued outcomes one per request."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.requests = []
+
+    def request(self, method, url, data=None, headers=None):
+        self.requests.append((method, url))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class SendTest(unittest.TestCase):
+    def setUp(self):
+        project = components.Project(
+            id="test", network="test-net", credentials={"api-endpoint": API}
+        )
+        with mock.patch.object(controllers, "get_session"):
+            self.controller = controllers.NetworkController(project)
+        self.controller._request_policy = NO_DELAY
+
+    def test_connection_error_is_resent(self):
+        session = FakeSession(
+            RequestsConnectionError("connection reset"),
+            _response(200, b'{"name": "test-net"}'),
+        )
+        self.controller._session = session
+
+        self.assertTrue(self.controller.refresh())
+        self.assertEqual(len(session.requests), 2)
+        self.assertEqual(self.controller.exceptions, [])
+        self.assertEqual(self.controller.data, {"network": "test-net"})
+
+    def test_connection_error_of_last_attempt_is_kept(self):
+        error = RequestsConnectionError("connection reset")
+        self.controller._session = FakeSession(error, error, error)
+
+        with self.assertRaises(RequestsConnectionError):
+            self.controller.get()
+        self.assertEqual(self.controller.exceptions, [error])
+
+
+class BatchTest(unittest.TestCase):
+    def test_throttled_batch_is_resent(self):
+        content_type, body = fake_compute._encode_batch(
+            ["<item0>"], [(200, {"name": "test-net"})]
+        )
+        session = FakeSession(
+            _response(429, headers={"Retry-After": "0"}),
+            _response(200, body, headers={"Content-Type": content_type}),
+        )
+        batch = controllers.Batch(session, API, policy=NO_DELAY)
+
+        responses = batch.execute(
+            [("GET", f"{API}/projects/test/global/networks/x", None)]
+        )
+        self.assertEqual(len(session.requests), 2)
+        self.assertEqual(responses[0].status_code, 200)
+        self.assertEqual(responses[0].json(), {"name": "test-net"})
+
+
+if __name__ == "__main__":
+    unittest.main()